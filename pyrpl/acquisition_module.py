@@ -64,6 +64,61 @@ class AcquisitionError(ValueError):
     pass
 
 
+class TraceAverager(object):
+    """
+    Accumulates traces into the array average, in place and without
+    temporary arrays, such that averaging large traces does not allocate
+    memory for every trace.
+
+    Modes:
+    - 'mean', 'exponential': average += weight * (trace - average), where
+      the weight of the n-th trace is 1/n for a running mean and stays
+      constant for an exponentially weighted average. If variance is True,
+      the (weighted) variance of the traces is updated along with Welford's
+      method in self.variance.
+    - 'max_hold', 'min_hold': elementwise maximum or minimum of all traces.
+    """
+    modes = ['mean', 'exponential', 'max_hold', 'min_hold']
+
+    def __init__(self, average, mode='mean', variance=False):
+        self.average = average
+        self.mode = mode
+        self.count = 0  # number of traces added
+        self._delta = np.empty_like(average)
+        if variance and mode in ['mean', 'exponential']:
+            self.variance = np.zeros_like(average)
+            self._square = np.empty_like(average)
+        else:
+            self.variance = None
+
+    def add(self, trace, weight):
+        """
+        Adds trace with the given weight (ignored in the hold modes) and
+        returns the average.
+        """
+        average = self.average
+        self.count += 1
+        if self.mode in ['max_hold', 'min_hold']:
+            if self.count == 1:
+                np.copyto(average, trace)
+            elif self.mode == 'max_hold':
+                np.maximum(average, trace, out=average)
+            else:
+                np.minimum(average, trace, out=average)
+            return average
+        delta = np.subtract(trace, average, out=self._delta)
+        if self.variance is not None:
+            # var = (1 - w) * (var + w * delta**2), i.e. Welford's update
+            # for w = 1/n
+            square = np.multiply(delta, delta, out=self._square)
+            square *= weight
+            self.variance += square
+            self.variance *= 1. - weight
+        delta *= weight
+        average += delta
+        return average
+
+
 class RunningStateProperty(SelectProperty):
     def __init__(self, options=["running_single",
                                 "running_continuous",
@@ -199,6 +254,20 @@ class AcquisitionModule(Module):
                            default=1,
                            min=1)
     curve_name = StringProperty(doc="name of the curve to save.")
+    average_mode = SelectProperty(default='mean',
+                                  options=TraceAverager.modes,
+                                  doc="How traces are averaged: running "
+                                      "'mean' (decaying with memory "
+                                      "trace_average in continuous mode), "
+                                      "'exponential' average with memory "
+                                      "trace_average, 'max_hold' or "
+                                      "'min_hold'.",
+                                  call_setup=True)
+    trace_variance = BoolProperty(default=False,
+                                  doc="If True, data_var contains the "
+                                      "variance of the averaged traces, "
+                                      "e.g. for error bars.",
+                                  call_setup=True)
     run_continuous = BoolProperty(default=False,
                                   doc="Is the module in the running_state "
                                       "'running_continuous' or not. Contrary "
@@ -213,6 +282,8 @@ class AcquisitionModule(Module):
         self._last_run = None
         self.curve_name = self.name + " curve"
         self.current_avg = 0
+        self._averager = None
+        self.data_var = None
 
     def _emit_signal_by_name(self, signal_name, *args, **kwds):
         """Let's the module's signal_launcher emit signal name"""
@@ -224,7 +295,7 @@ class AcquisitionModule(Module):
         """
         self._start_trace_acquisition()
         await self._data_ready_async(min_delay_ms)
-        return self._get_trace()
+        return await self._get_trace_async()
 
     def single_async(self):
         """
@@ -259,14 +330,35 @@ class AcquisitionModule(Module):
             self.current_avg+=1
             if self.running_state=='paused_single':
                 await self._resume_event.wait()
-            self.data_avg = (self.data_avg * (self.current_avg-1) + \
-                             await self._trace_async(0)) / self.current_avg
+            self._average_trace(await self._trace_async(0))
             self._emit_signal_by_name('display_curve', [self.data_x,
                                                         self.data_avg])
         self._running_state = 'stopped'
         self._free_up_resources()
         return self.data_avg
 
+    def _average_trace(self, trace):
+        """
+        Adds trace, the current_avg-th trace of the run, to self.data_avg
+        according to average_mode.
+        """
+        averager = self._averager
+        if averager is None or averager.average is not self.data_avg:
+            # new run: data_avg was (re-)allocated by _prepare_averaging()
+            if getattr(self, 'data_avg', None) is None or \
+                    np.shape(self.data_avg) != np.shape(trace):
+                self.data_avg = np.zeros(np.shape(trace),
+                                         dtype=np.result_type(trace, float))
+            averager = self._averager = TraceAverager(self.data_avg,
+                                                      self.average_mode,
+                                                      self.trace_variance)
+            self.data_var = averager.variance
+        if self.average_mode == 'exponential' and self.current_avg > 1:
+            weight = 1. / self.trace_average
+        else:
+            weight = 1. / self.current_avg
+        averager.add(trace, weight)
+
     async def _single_async(self):
         """
         Coroutine to launch the acquisition of a trace_average traces.
@@ -305,10 +397,8 @@ class AcquisitionModule(Module):
             if self.running_state == 'paused_continuous':
                 await self._resume_event.wait()
             self.current_avg = min(self.current_avg + 1, self.trace_average)
-            self.data_avg = (self.data_avg * (self.current_avg - 1) + \
-                             await self._trace_async(
-                                 self.MIN_DELAY_CONTINUOUS_MS * 0.001)) / \
-                            self.current_avg
+            self._average_trace(await self._trace_async(
+                self.MIN_DELAY_CONTINUOUS_MS * 0.001))
             self._emit_signal_by_name('display_curve', [self.data_x,
                                                         self.data_avg])
 
@@ -436,6 +526,14 @@ class AcquisitionModule(Module):
         """
         raise NotImplementedError  # pragma: no cover
 
+    async def _get_trace_async(self):
+        """
+        coroutine version of _get_trace(). Instruments that transfer large
+        amounts of data should override it such that the transfer does not
+        block the event loop.
+        """
+        return self._get_trace()
+
     def _start_trace_acquisition(self):
         """
         If anything has to be communicated to the hardware (such as make
@@ -188,7 +188,10 @@ def wait(future, timeout=None):
         if future in done:
             return future.result()
     else:
-        loop = asyncio.get_event_loop()
+        try:
+            loop = asyncio.get_event_loop()
+        except RuntimeError:  # no current event loop, e.g. after asyncio.run
+            loop = LOOP
         if asyncio.iscoroutine(future):
             future = asyncio.ensure_future(future, loop=loop)
 
@@ -205,9 +208,10 @@ def wait(future, timeout=None):
                 # pump Qt
                 app.processEvents(QtCore.QEventLoop.AllEvents, 50)
 
-                # pump asyncio
-                loop.call_soon(loop.stop)
-                loop.run_forever()
+                # pump asyncio (LOOP is pumped by Qt)
+                if loop is not LOOP:
+                    loop.call_soon(loop.stop)
+                    loop.run_forever()
 
                 if deadline is not None:
                     remaining = deadline - loop.time()
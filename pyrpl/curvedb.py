@@ -31,10 +31,37 @@ import numpy as np
 import pandas as pd
 import os
 import logging
+import json
+import sqlite3
+import time
+from datetime import datetime
 import pickle as file_backend
 #import json as file_backend  # currently unable to store pandas
 
 
+# the index of the curves in a curve directory. A row is inserted when a pk
+# is allocated, and 'modified' is NULL until the curve is saved.
+_INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS curves (
+    pk INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT,
+    created REAL,
+    modified REAL,
+    parent INTEGER,
+    params TEXT);
+CREATE INDEX IF NOT EXISTS curves_name ON curves (name);
+CREATE INDEX IF NOT EXISTS curves_created ON curves (created);
+CREATE INDEX IF NOT EXISTS curves_parent ON curves (parent);
+"""
+
+
+def _json_value(obj):
+    """ converts the params that json cannot serialize """
+    if isinstance(obj, np.generic):
+        return obj.item()
+    return str(obj)
+
+
 # optional override of CurveDB class with custom module, as defined in
 # ./pyrpl/config/global_config.yml
 try:
@@ -45,6 +72,16 @@ except:
     class CurveDB(object):
         _dirname = user_curve_dir
         file_extension = '.dat'
+        # 'npy': the .dat file holds pk, params and the names of the files
+        # <pk>.x.<version>.npy and <pk>.y.<version>.npy, which store x and y
+        # as typed arrays. get() returns copy-on-write memory maps of them.
+        # 'pickle': x and y are pickled as lists into the .dat file (format
+        # of earlier versions, which get() can always read).
+        data_format = 'npy'
+        # sqlite database in _dirname with the pk, name, timestamps, parent
+        # and params of all curves, see search()
+        index_filename = 'curves.sqlite'
+        _index_connections = dict()  # _dirname -> sqlite3.Connection
 
         if not os.path.exists(_dirname): # if _dirname doesn't exist, some unexpected errors will occur.
             os.mkdir(_dirname)
@@ -114,6 +151,15 @@ except:
         # Implement the following methods if you want to save curves permanently
         @classmethod
         def get(cls, curve):
+            """
+            Returns the curve with primary key curve (or a list of curves
+            for a list of primary keys).
+
+            For curves in 'npy' format, curve.data holds numpy.memmap arrays
+            of the column files, which are only read from disk as far as
+            they are accessed. Changing them in place only modifies the
+            copy in memory until the curve is saved.
+            """
             if isinstance(curve, CurveDB):
                 return curve
             elif isinstance(curve, list):
@@ -126,20 +172,215 @@ except:
                     # see http://stackoverflow.com/questions/5512811/builtins-typeerror-must-be-str-not-bytes
                     curve = CurveDB()
                     curve._pk, curve.params, data = file_backend.load(f)
+                if isinstance(data, dict):  # columnar format
+                    curve._columns = data
+                    curve.data = tuple([cls._load_array(os.path.join(
+                        cls._dirname, data[axis])) for axis in 'xy'])
+                    # save() does not need to rewrite unchanged arrays
+                    curve._mapped_data = curve.data
+                else:
                     curve.data = tuple([np.asarray(a) for a in data])
                 if isinstance(curve.data, pd.Series):  # for backwards compatibility
                     x, y = curve.data.index.values, curve.data.values
                     curve.data = (x, y)
                 return curve
 
+        @staticmethod
+        def _load_array(filename):
+            try:
+                return np.load(filename, mmap_mode='c')
+            except ValueError:  # empty arrays cannot be mapped by older numpy
+                return np.load(filename)
+
+        @staticmethod
+        def _unchanged(a, mapped):
+            """ whether a is the array mapped by get() with its content on
+            disk, i.e. not modified in place """
+            if a is not mapped:
+                return False
+            if not isinstance(a, np.memmap):
+                return True
+            # the pages of the file that were not written are shared
+            reference = np.load(a.filename, mmap_mode='r')
+            return np.array_equal(a.reshape(-1).view(np.uint8),
+                                  reference.reshape(-1).view(np.uint8))
+
+        def _write_column(self, axis, a, previous=None):
+            """
+            writes a into a new version of the column file of axis and
+            returns the name of the file
+            """
+            # files that are mapped into memory cannot be overwritten or
+            # replaced on windows, therefore each version has its own file
+            version = 0 if previous is None else \
+                int(previous.split('.')[2]) + 1
+            while True:
+                filename = "%d.%s.%d.npy" % (self.pk, axis, version)
+                try:
+                    f = open(os.path.join(self._dirname, filename), 'xb')
+                except FileExistsError:
+                    version += 1
+                    continue
+                with f:
+                    np.save(f, np.ascontiguousarray(a))
+                return filename
+
+        def _remove_columns(self, filenames):
+            for filename in filenames:
+                try:
+                    os.remove(os.path.join(self._dirname, filename))
+                except OSError:  # e.g. still mapped into memory on windows
+                    self.logger.debug("Could not remove the file %s. ",
+                                      filename)
+
         def save(self):
+            data = [np.asarray(a) for a in self.data]
+            columns = getattr(self, '_columns', dict())
+            if self.data_format == 'npy' and not any(a.dtype.hasobject
+                                                     for a in data):
+                mapped = getattr(self, '_mapped_data', (None, None))
+                data = dict()
+                for axis, a, old in zip('xy', self.data, mapped):
+                    if axis in columns and self._unchanged(a, old):
+                        data[axis] = columns[axis]
+                    else:
+                        data[axis] = self._write_column(axis, a,
+                                                        columns.get(axis))
+                self._columns = data
+            else:
+                data = [a.tolist() for a in data]
+                self._columns = dict()
             with open(os.path.join(self._dirname, str(self.pk) + self.file_extension),
                       'wb' if file_backend.__name__ == 'pickle' else 'w')\
                     as f:
                 # wb is for compatibility with python 3
                 # see http://stackoverflow.com/questions/5512811/builtins-typeerror-must-be-str-not-bytes
-                data = [a.tolist() for a in self.data]
                 file_backend.dump([self.pk, self.params, data], f, )
+            # remove the previous versions of the columns
+            self._remove_columns(set(columns.values()) -
+                                 set(self._columns.values()))
+            self._update_index()
+
+        @classmethod
+        def _index(cls):
+            """
+            returns the connection to the index of the curves in _dirname,
+            which is built from the .dat files if it does not exist yet
+            """
+            try:
+                return cls._index_connections[cls._dirname]
+            except KeyError:
+                pass
+            filename = os.path.join(cls._dirname, cls.index_filename)
+            new = not os.path.exists(filename)
+            connection = sqlite3.connect(filename, timeout=10)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            with connection:
+                connection.executescript(_INDEX_SCHEMA)
+            cls._index_connections[cls._dirname] = connection
+            if new:
+                cls.rebuild_index()
+            return connection
+
+        @staticmethod
+        def _index_row(pk, params, created, modified):
+            return (pk, params.get('name'), created, modified,
+                    params.get('parent'),
+                    json.dumps(params, skipkeys=True, default=_json_value))
+
+        @classmethod
+        def rebuild_index(cls):
+            """
+            rebuilds the index from the .dat files in _dirname, e.g. after
+            curve files were copied into the directory
+            """
+            rows = []
+            for f in os.listdir(cls._dirname):
+                if not f.endswith(cls.file_extension):
+                    continue
+                try:
+                    pk = int(f[:-len(cls.file_extension)])
+                except ValueError:
+                    continue
+                filename = os.path.join(cls._dirname, f)
+                mtime = os.path.getmtime(filename)
+                try:
+                    with open(filename, 'rb') as fh:
+                        params = file_backend.load(fh)[1]
+                except EOFError:  # allocated pk of an unsaved curve
+                    rows.append((pk, None, mtime, None, None, None))
+                    continue
+                except Exception:
+                    logging.getLogger(name=__name__).warning(
+                        "Could not index the curve file %s.", filename)
+                    continue
+                rows.append(cls._index_row(pk, params, mtime, mtime))
+            with cls._index() as connection:
+                # the AUTOINCREMENT counter keeps deleted pks from being reused
+                connection.execute("DELETE FROM curves")
+                connection.executemany("INSERT INTO curves (pk, name, "
+                                       "created, modified, parent, params) "
+                                       "VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+        def _update_index(self):
+            now = time.time()
+            pk, name, created, modified, parent, params = \
+                self._index_row(self.pk, self.params, now, now)
+            with self._index() as connection:
+                if connection.execute("UPDATE curves SET name=?, modified=?, "
+                                      "parent=?, params=? WHERE pk=?",
+                                      (name, modified, parent, params,
+                                       pk)).rowcount == 0:
+                    connection.execute("INSERT INTO curves (pk, name, created, "
+                                       "modified, parent, params) VALUES "
+                                       "(?, ?, ?, ?, ?, ?)",
+                                       (pk, name, created, modified, parent,
+                                        params))
+
+        @classmethod
+        def search(cls, name=None, parent=None, since=None, until=None,
+                   **params):
+            """
+            Returns the primary keys of the saved curves that match all
+            given arguments, most recent first, without reading any curve
+            file.
+
+            Arguments:
+                name (str): name of the curve
+                parent (int or CurveDB): the parent curve
+                since, until (float or datetime.datetime): interval of the
+                    creation time of the curve (time.time() for floats)
+                params: further scalar entries of curve.params, e.g.
+                    search(input='in1')
+
+            Returns:
+                list of int: the primary keys
+            """
+            conditions, values = ["modified IS NOT NULL"], []
+            if name is not None:
+                conditions.append("name = ?")
+                values.append(name)
+            if parent is not None:
+                conditions.append("parent = ?")
+                values.append(parent.pk if isinstance(parent, CurveDB)
+                              else parent)
+            for condition, value in (("created >= ?", since),
+                                     ("created < ?", until)):
+                if value is not None:
+                    if isinstance(value, datetime):
+                        value = value.timestamp()
+                    conditions.append(condition)
+                    values.append(value)
+            for key, value in params.items():
+                conditions.append("json_extract(params, ?) = ?")
+                values += ['$."%s"' % key,
+                           value.item() if isinstance(value, np.generic)
+                           else value]
+            rows = cls._index().execute("SELECT pk FROM curves WHERE " +
+                                        " AND ".join(conditions) +
+                                        " ORDER BY pk DESC", values)
+            return [pk for pk, in rows]
 
         def delete(self):
             # remove the file
@@ -157,10 +398,19 @@ except:
             except OSError:
                 self.logger.warning("Could not find and remove the file %s. ",
                                     filename)
+            # all versions of the columns, including those that could not be
+            # removed earlier
+            prefix = "%d." % delpk
+            for filename in os.listdir(self._dirname):
+                if filename.startswith(prefix) and filename.endswith('.npy'):
+                    self._remove_columns([filename])
+            with self._index() as connection:
+                connection.execute("DELETE FROM curves WHERE pk=?", (delpk,))
             if parent:
-                parentchilds = parent.childs
-                parentchilds.remove(delpk)
-                parent.childs = parentchilds
+                parentchilds = parent.params.get("childs") or []
+                if delpk in parentchilds:
+                    parentchilds.remove(delpk)
+                parent.params["childs"] = parentchilds
                 parent.save()
 
         # Implement the following methods if you want to use a hierarchical
@@ -203,9 +453,7 @@ except:
             Returns:
                 list of int: A list of the primary keys of all CurveDB objects on the computer.
             """
-            pks = [int(f.split('.dat')[0])
-                   for f in os.listdir(cls._dirname) if f.endswith('.dat')]
-            return sorted(pks, reverse=True)
+            return cls.search()
 
         @classmethod
         def all(cls):
@@ -223,15 +471,14 @@ except:
             if hasattr(self, "_pk"):
                 return self._pk
             else:
-                pks = self.all_pks()
-                if len(pks) == 0:
-                    self._pk = 1
-                else:
-                    self._pk = max(pks) + 1
-                # create the file to make this pk choice persistent
-                with open(os.path.join(self._dirname,
-                                       str(self._pk) + ".dat"), 'w') as f:
-                    f.close()
+                # the index allocates the pk atomically, also across processes
+                with self._index() as connection:
+                    self._pk = connection.execute(
+                        "INSERT INTO curves (name, created) VALUES (?, ?)",
+                        (self.params.get("name"), time.time())).lastrowid
+                # an empty curve file keeps rebuild_index from reusing the pk
+                open(os.path.join(self._dirname, str(self._pk) +
+                                  self.file_extension), 'ab').close()
                 return self._pk
             return -1
             # a proper implementation will assign the database primary key for pk
@@ -261,6 +508,6 @@ except:
             Returns:
                 CurveDB: the child curve
             """
-            for c in self.childs:
-                if c.name == name:
-                    return c
+            pks = self.search(name=name, parent=self.pk)
+            if pks:
+                return CurveDB.get(pks[-1])
@@ -0,0 +1,116 @@
+"""
+FFT backends for the spectrum analyzer.
+
+All backends compute batched transforms along the last axis of a 2D array
+and zero-pad each row to n points:
+
+ * 'pyfftw': FFTW plans (if pyfftw is installed) that are created once per
+   input shape and reused for all following frames, together with their
+   aligned input and output buffers,
+ * 'scipy.fft': scipy's pocketfft with one worker per cpu and its internal
+   plan cache,
+ * 'numpy': numpy.fft as a fallback.
+
+BACKENDS lists the available backends, the best one first. Use
+get_backend(name) to obtain the (shared) backend instance for a name.
+"""
+import logging
+import os
+from collections import OrderedDict
+
+import numpy as np
+
+logger = logging.getLogger(name=__name__)
+
+try:
+    import pyfftw
+except ImportError:
+    pyfftw = None
+
+try:
+    import scipy.fft as scipy_fft
+except ImportError:  # scipy < 1.4
+    scipy_fft = None
+
+WORKERS = os.cpu_count() or 1
+
+
+class NumpyFft(object):
+    name = 'numpy'
+
+    def rfft(self, x, n):
+        """ real fft of the rows of x, zero-padded to n points """
+        return np.fft.rfft(x, n, axis=-1)
+
+    def fft(self, x, n):
+        """ complex fft of the rows of x, zero-padded to n points """
+        return np.fft.fft(x, n, axis=-1)
+
+
+class ScipyFft(NumpyFft):
+    name = 'scipy.fft'
+
+    def __init__(self, workers=WORKERS):
+        self.workers = workers
+
+    def rfft(self, x, n):
+        return scipy_fft.rfft(x, n, axis=-1, workers=self.workers)
+
+    def fft(self, x, n):
+        return scipy_fft.fft(x, n, axis=-1, workers=self.workers)
+
+
+class FftwFft(NumpyFft):
+    """
+    The returned arrays are the output buffers of the plans, i.e. they are
+    overwritten by the next transform of the same shape.
+    """
+    name = 'pyfftw'
+
+    def __init__(self, workers=WORKERS):
+        self.workers = workers
+        self._plans = dict()  # (kind, shape, dtype, n) -> FFTW plan
+
+    def _plan(self, builder, x, n):
+        key = (builder.__name__, x.shape, x.dtype, n)
+        if key not in self._plans:
+            # the plan copies each frame into its own aligned input buffer,
+            # zero-padding the rows to n points
+            self._plans[key] = builder(pyfftw.empty_aligned(x.shape,
+                                                            dtype=x.dtype),
+                                       n, axis=-1, threads=self.workers,
+                                       planner_effort='FFTW_MEASURE',
+                                       avoid_copy=False)
+        return self._plans[key]
+
+    def rfft(self, x, n):
+        return self._plan(pyfftw.builders.rfft, x, n)(x)
+
+    def fft(self, x, n):
+        return self._plan(pyfftw.builders.fft, x, n)(x)
+
+
+BACKENDS = OrderedDict()
+if pyfftw is not None:
+    BACKENDS[FftwFft.name] = FftwFft
+if scipy_fft is not None:
+    BACKENDS[ScipyFft.name] = ScipyFft
+BACKENDS[NumpyFft.name] = NumpyFft
+
+_instances = dict()
+
+
+def get_backend(name=None):
+    """
+    returns the backend instance for name, or the best available backend if
+    name is None or not available
+    """
+    if name not in BACKENDS:
+        if name is not None:
+            logger.warning("FFT backend %s is not available, using %s "
+                           "instead.", name, list(BACKENDS)[0])
+        name = list(BACKENDS)[0]
+    if name not in _instances:
+        _instances[name] = BACKENDS[name]()
+        logger.info("Using FFT backend %s.", name)
+    return _instances[name]
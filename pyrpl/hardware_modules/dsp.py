@@ -202,6 +202,10 @@ class DspModule(HardwareModule, SignalModule):
 
     _delay = 0  # delay of the module from input to output_signal (in cycles)
 
+    # saturation flags, the sync register that is shared by all dsp modules
+    # and current_output_signal are never served from a snapshot
+    _live_registers = ((0x8, 0xC),)
+
     @property
     def inputs(self):
         self._logger.warning("Deprecation warning: DspModule.inputs "
@@ -1,4 +1,4 @@
-from . import iir_theory #, bodefit
+from . import iir_theory, iir_simulation #, bodefit
 from .. import FilterModule
 from ...attributes import IntRegister, BoolRegister, ComplexProperty, \
     FloatProperty, StringProperty, CurveSelectProperty, \
@@ -697,37 +697,30 @@ class IIR(FilterModule):
 
     def simulate_filter_float(self, xs, biquad="all"):
         """
-        plots the response of the iir filter to a time series xs (sampling time
-        is dt*loops
-        :param freq:
-        :return:
+        returns the response of the iir filter to a time series xs (sampling
+        time is dt*loops), computed along the last axis of xs such that
+        several time series can be simulated at once.
+        :param xs: time series or array of time series
+        :param biquad: index of the biquad to simulate or 'all'
+        :return: ys, array of the same shape as xs
         """
         if biquad=='all':
             coefs = self.coefficients
         else:
             coefs = [self.coefficients[biquad]]
-
-        ys = np.zeros(len(xs))
-        ys_biquad = np.zeros((len(coefs), 2))
-        for index in range(2, len(xs)):
-            for index_biquad, (b0, b1, _, _, a1, a2) in enumerate(coefs):
-                adder = -  a1 * ys_biquad[index_biquad, 0] - a2 * ys_biquad[index_biquad, 1]
-
-                y = b0 * xs[index] + b1 * xs[index - 1] + adder
-                ys[index] += y
-                ys_biquad[index_biquad, 1] = ys_biquad[index_biquad, 0]
-                ys_biquad[index_biquad, 0] = y
-        return ys
+        return iir_simulation.simulate_float(coefs, xs)
 
     def simulate_filter_int(self, xs, biquad="all"):
         """
-        plots the response of the iir filter to a time series xs (sampling time
-        is dt*loops
-        :param freq:
-        :return:
+        returns the bit-exact response of the iir filter to an integer time
+        series xs (14 bits signed, sampling time is dt*loops), computed along
+        the last axis of xs such that several time series can be simulated
+        at once. An OverflowError is raised if the internal signals of the
+        filter saturate.
+        :param xs: integer time series or array of time series
+        :param biquad: index of the biquad to simulate or 'all'
+        :return: ys, integer array of the same shape as xs
         """
-        print("yo")
-
         if biquad == 'all':
             coefs = self.coefficients
         else:
@@ -736,36 +729,22 @@ class IIR(FilterModule):
 
         coefs = np.asarray(coefs*(2**self._IIRSHIFT), dtype=np.int64)
 
-
-        if xs.dtype != int:
+        xs = np.asarray(xs)
+        if not np.issubdtype(xs.dtype, np.integer):
             raise TypeError("expected an integer input array")
 
-        if any(xs > 2**13 - 1):
+        if np.any(xs > 2**13 - 1):
             raise ValueError("input should not exceed 2**13 - 1 = 8191")
 
-        if any(xs < -2**13):
+        if np.any(xs < -2**13):
             raise ValueError("input should not exceed -2**13 = -8192")
 
-
-
-        xs = xs*2**3 # pre-filters change the signal from 14 to 17 bits
+        xs = np.asarray(xs, dtype=np.int64)*2**3 # pre-filters change the
+        # signal from 14 to 17 bits
         xs = xs*2**(-self._IIRBITS + 17 + self._IIRSHIFT + 1)
 
-
-        ys = np.zeros(len(xs), dtype=np.int64)
-        ys_biquad = np.zeros((len(coefs), 2), dtype=np.int64)
-
-        for index in range(2, len(xs)):
-            for index_biquad, (b0, b1, _, _, a1, a2) in enumerate(coefs):
-                p_ay1 = self._product_sat(-a1, ys_biquad[index_biquad, 0])
-                p_ay2 = self._product_sat(-a2, ys_biquad[index_biquad, 1])
-                p_bx0 = self._product_sat(b0, xs[index])
-                p_bx1 = self._product_sat(b1, xs[index - 1])
-                y = self._saturate(p_ay1 + p_ay2 + p_bx0 + p_bx1, bits=self._IIRBITS)
-                ys[index] += y
-                ys_biquad[index_biquad, 1] = ys_biquad[index_biquad, 0]
-                ys_biquad[index_biquad, 0] = y
-
+        ys = iir_simulation.simulate_int(coefs, xs, shift=self._IIRSHIFT,
+                                         bits=self._IIRBITS)
         return ys//2**(self._IIRBITS - 14)
 
 
@@ -848,19 +827,6 @@ class IIR(FilterModule):
         """
         return int(np.floor(val*2**13))
 
-    def _product_sat(self, factor1_i, factor2_i):
-        result = (factor1_i*factor2_i)//(2**self._IIRSHIFT)
-        assert(np.abs(result - np.float64(factor1_i) * np.float64(
-            factor2_i)/(2**self._IIRSHIFT)) < 1)
-        return self._saturate(result, bits=self._IIRBITS)
-
-    def _saturate(self, val, bits):
-        if val > 2**bits - 1:
-            raise OverflowError(f"Overflox in saturate with {val} > {2**bits - 1}")
-        if val < -2 ** bits:
-                raise OverflowError(f"Overflox in saturate with {val} < {-2**bits}")
-        return val
-
     def format_coefs_verilog(self):
         n = 0
         for b0, b1, _, _, a1, a2 in np.asarray(
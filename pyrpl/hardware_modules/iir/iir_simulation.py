@@ -0,0 +1,140 @@
+"""
+Time-domain simulation of the parallel biquads of the IIR module.
+
+Each biquad (b0, b1, _, _, a1, a2) of the coefficient array computes
+
+    y[n] = b0 * x[n] + b1 * x[n-1] - a1 * y[n-1] - a2 * y[n-2]
+
+and the filter output is the sum of all biquad outputs. As in the FPGA,
+the simulation starts at the third sample, i.e. y[0] = y[1] = 0.
+
+All functions filter along the last axis of xs, such that a batch of many
+traces can be simulated in one call:
+
+ * simulate_float: floating point simulation with scipy.signal.sosfilt,
+ * simulate_int: bit-exact simulation of the fixed-point arithmetic of the
+   FPGA, i.e. products are rounded down after the shift by 'shift' bits and
+   an OverflowError is raised if a product or a biquad output leaves the
+   range of 'bits' bits. The recursion is compiled with numba if it is
+   installed, and otherwise runs over all biquads and traces at once in
+   numpy.
+"""
+import numpy as np
+from scipy.signal import sosfilt
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+def simulate_float(coefficients, xs):
+    """
+    returns the response of the biquads with the given coefficients (one
+    row of 6 coefficients per biquad) to the time series xs
+    """
+    xs = np.asarray(xs, dtype=float)
+    ys = np.zeros(xs.shape)
+    if xs.shape[-1] < 3:
+        return ys
+    for b0, b1, _, _, a1, a2 in coefficients:
+        # initial state of the transposed direct form II that corresponds
+        # to the input x[1] and vanishing outputs y[0] = y[1] = 0
+        zi = np.zeros((1,) + xs.shape[:-1] + (2,))
+        zi[..., 0] = b1 * xs[..., 1]
+        y, _ = sosfilt([[b0, b1, 0., 1., a1, a2]], xs[..., 2:], zi=zi)
+        ys[..., 2:] += y
+    return ys
+
+
+def _check_range(values, bits):
+    if values.size == 0:
+        return
+    if values.max() > 2**bits - 1:
+        raise OverflowError(f"Overflow in saturate with {values.max()} > "
+                            f"{2**bits - 1}")
+    if values.min() < -2**bits:
+        raise OverflowError(f"Overflow in saturate with {values.min()} < "
+                            f"{-2**bits}")
+
+
+def _recursion_numpy(feedforward, a1, a2, shift, bits):
+    """ numpy version of _recursion_numba, vectorized over the biquads """
+    ys = np.zeros(feedforward.shape, dtype=np.int64)
+    a1 = -a1[:, np.newaxis]
+    a2 = -a2[:, np.newaxis]
+    divider = 2**shift
+    y1 = np.zeros(feedforward.shape[:-1], dtype=np.int64)
+    y2 = np.zeros(feedforward.shape[:-1], dtype=np.int64)
+    for index in range(2, feedforward.shape[-1]):
+        y = feedforward[..., index] + (a1 * y1) // divider + \
+            (a2 * y2) // divider
+        ys[..., index] = y
+        y1, y2 = y, y1
+    # The values of ys are correct up to the first overflow, so checking
+    # all outputs and feedback products afterwards detects any overflow
+    # that the sample-by-sample check of the FPGA arithmetic detects.
+    _check_range(ys, bits)
+    _check_range((a1[..., np.newaxis] * ys[..., 2:-1]) // divider, bits)
+    _check_range((a2[..., np.newaxis] * ys[..., 2:-2]) // divider, bits)
+    return ys
+
+
+if numba is not None:
+    @numba.njit(cache=True)
+    def _recursion_numba(feedforward, a1, a2, shift, bits):
+        """
+        returns y[n] = feedforward[n] + (-a1 * y[n-1] >> shift) + (-a2 *
+        y[n-2] >> shift) for each biquad (first axis of feedforward) and
+        trace (second axis)
+        """
+        ys = np.zeros(feedforward.shape, dtype=np.int64)
+        divider = 2**shift
+        high = 2**bits - 1
+        low = -2**bits
+        for biquad in range(feedforward.shape[0]):
+            for trace in range(feedforward.shape[1]):
+                y1 = 0
+                y2 = 0
+                for index in range(2, feedforward.shape[2]):
+                    p1 = (-a1[biquad] * y1) // divider
+                    p2 = (-a2[biquad] * y2) // divider
+                    if p1 > high or p1 < low or p2 > high or p2 < low:
+                        raise OverflowError("Overflow in product saturation")
+                    y = feedforward[biquad, trace, index] + p1 + p2
+                    if y > high or y < low:
+                        raise OverflowError("Overflow in saturate")
+                    ys[biquad, trace, index] = y
+                    y2 = y1
+                    y1 = y
+        return ys
+
+
+def simulate_int(coefficients, xs, shift, bits):
+    """
+    returns the response of the biquads with the given integer coefficients
+    (coefficients * 2**shift) to the integer time series xs, summed over
+    all biquads, without any rescaling of the output
+    """
+    coefficients = np.asarray(coefficients, dtype=np.int64).reshape(-1, 6)
+    xs = np.asarray(xs, dtype=np.int64)
+    shape = xs.shape
+    xs = xs.reshape(1, -1, shape[-1])  # (biquad, trace, sample)
+    b0 = coefficients[:, 0, np.newaxis, np.newaxis]
+    b1 = coefficients[:, 1, np.newaxis, np.newaxis]
+    divider = 2**shift
+    # feed-forward products of all samples at once
+    bx0 = (b0 * xs[..., 2:]) // divider
+    bx1 = (b1 * xs[..., 1:-1]) // divider
+    _check_range(bx0, bits)
+    _check_range(bx1, bits)
+    feedforward = np.zeros((len(coefficients),) + xs.shape[1:],
+                           dtype=np.int64)
+    feedforward[..., 2:] = bx0 + bx1
+    if numba is not None:
+        ys = _recursion_numba(feedforward, coefficients[:, 4],
+                              coefficients[:, 5], shift, bits)
+    else:
+        ys = _recursion_numpy(feedforward, coefficients[:, 4],
+                              coefficients[:, 5], shift, bits)
+    return ys.sum(axis=0).reshape(shape)
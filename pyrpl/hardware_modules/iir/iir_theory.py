@@ -20,6 +20,7 @@
 import scipy.signal as sig
 import numpy as np
 import logging
+from concurrent.futures import ProcessPoolExecutor
 from ...errors import ExpectedPyrplError
 
 logger = logging.getLogger(name=__name__)
@@ -117,6 +118,38 @@ def freqs_rp(r, p, c, w):
     return h
 
 
+def freqz_biquads(coefficients, w, delay_per_cycle=None):
+    """
+    Computes the summed frequency response of parallel biquads.
+
+    Parameters
+    ----------
+    coefficients: np.array
+        biquad coefficients (b0, b1, b2, a0, a1, a2) of shape
+        (..., n_biquads, 6)
+    w: np.array
+        discrete angular frequencies (rad/sample) of shape (..., n_frequencies)
+    delay_per_cycle: np.array or None
+        if not None, the response of the biquad at index i is multiplied by
+        delay_per_cycle ** (i + 1)
+
+    Returns
+    -------
+    np.array(..., dtype=complex) of shape (..., n_frequencies)
+    """
+    coefficients = np.asarray(coefficients, dtype=np.float64)
+    # z^-1 with an extra axis for the biquads
+    z = np.exp(-1j * np.asarray(w, dtype=np.float64))[..., np.newaxis, :]
+    b0, b1, b2, a0, a1, a2 = [coefficients[..., i, np.newaxis]
+                              for i in range(6)]
+    h = (b0 + z * (b1 + z * b2)) / (a0 + z * (a1 + z * a2))
+    if delay_per_cycle is not None:
+        delay_per_cycle = np.asarray(delay_per_cycle)[..., np.newaxis, :]
+        h *= delay_per_cycle ** np.arange(1, coefficients.shape[-2] + 1)[
+            :, np.newaxis]
+    return h.sum(axis=-2)
+
+
 # this one is not tested, so probably not working satisfactorily
 def freqz_(sys, w, dt=8e-9):
     """
@@ -843,24 +876,15 @@ class IirFilter(object):
             totalbits = self.totalbits
         if shiftbits is None:
             shiftbits = self.shiftbits
-        res = coeff * 0 + coeff  # weird way to make a copy of coeff
-        for x in np.nditer(res, op_flags=['readwrite']):
-            xr = np.round(x * 2 ** shiftbits)
-            xmax = 2 ** (totalbits - 1)
-            if xr == 0 and xr != 0:
-                logger.warning("One value was rounded off to zero: Increase "
-                               "shiftbits in fpga design if this is a "
-                               "problem!")
-            elif xr > xmax - 1:
-                xr = xmax - 1
-                logger.warning("One value saturates positively: Increase "
-                               "totalbits or decrease gain!")
-            elif xr < -xmax:
-                xr = -xmax
-                logger.warning("One value saturates negatively: Increase "
-                               "totalbits or decrease gain!")
-            x[...] = 2 ** (-shiftbits) * xr
-        return res
+        xmax = 2 ** (totalbits - 1)
+        xr = np.round(np.asarray(coeff, dtype=np.float64) * 2 ** shiftbits)
+        if (xr > xmax - 1).any():
+            logger.warning("One value saturates positively: Increase "
+                           "totalbits or decrease gain!")
+        if (xr < -xmax).any():
+            logger.warning("One value saturates negatively: Increase "
+                           "totalbits or decrease gain!")
+        return 2. ** (-shiftbits) * np.clip(xr, -xmax, xmax - 1)
 
     @property
     def coefficients_rounded(self):
@@ -1037,17 +1061,9 @@ class IirFilter(object):
         # the higher stages have progressively more delay to the output
         if delay:
             delay_per_cycle = np.exp(-1j * self.dt * frequencies * 2 * np.pi)
-        h = np.zeros(len(w), dtype=np.complex128)
-        for i in range(len(fcoefficients)):
-            sos = np.asarray(fcoefficients[i], dtype=np.float64)
-            # later we can use sig.sosfreqz (very recent function, dont want
-            #  to update scipy now)
-            ww, hh = sig.freqz(sos[:3], sos[3:], worN=np.asarray(w,
-                                                           dtype=np.float64))
-            if delay:
-                hh *= delay_per_cycle ** (i + 1)
-            h += hh
-        return h
+        else:
+            delay_per_cycle = None
+        return freqz_biquads(fcoefficients, w, delay_per_cycle)
 
     def tf_rounded(self, frequencies=None, delay=False):
         """
@@ -1125,3 +1141,110 @@ class IirFilter(object):
         return self._frequencies
 
 
+
+
+def _design_filter(kwargs):
+    """ returns IirFilter(**kwargs), or the exception raised by the design """
+    try:
+        return IirFilter(**kwargs)
+    except Exception as e:
+        return e
+
+
+class IirDesignSweep(object):
+    """
+    Designs IIR filters for many specifications and evaluates their
+    transfer functions on a shared frequency grid.
+
+    Parameters
+    ----------
+    specs: list
+        each element is either a dict of keyword arguments for IirFilter or
+        a tuple (zeros, poles, gain). Keyword arguments in a dict override
+        the common keyword arguments.
+
+    frequencies: np.array
+        frequencies to compute the transfer functions for
+
+    processes: int or None
+        number of worker processes for the filter designs. With None or 1,
+        all filters are designed in the calling process.
+
+    kwargs:
+        keyword arguments of IirFilter that are common to all specs. For
+        example, IirDesignSweep([dict(loops=l) for l in range(4, 20)],
+        frequencies, zeros=z, poles=p, gain=1.0) scans the number of loops
+        for one filter.
+
+    Attributes
+    ----------
+    filters: list of IirFilter objects, None where the design failed
+    errors: dict of the exceptions of the failed designs by spec index
+    loops: array of the implemented number of loops
+    coefficients, coefficients_rounded: arrays of shape (n_specs,
+        n_biquads, 6) with the (rounded) coefficients of all filters,
+        padded with empty biquads. Failed designs only have empty biquads.
+    tf_coefficients, tf_rounded, tf_final: arrays of shape (n_specs,
+        n_frequencies) with the transfer functions of the same name of
+        IirFilter, NaN for failed designs
+    """
+    _empty_biquad = [0., 0., 0., 1., 0., 0.]
+
+    def __init__(self, specs, frequencies, processes=None, **kwargs):
+        self.frequencies = np.asarray(frequencies, dtype=np.float64)
+        kwargs_list = []
+        for spec in specs:
+            if not isinstance(spec, dict):
+                zeros, poles, gain = spec
+                spec = dict(zeros=zeros, poles=poles, gain=gain)
+            spec_kwargs = dict(kwargs, frequencies=self.frequencies)
+            spec_kwargs.update(spec)
+            kwargs_list.append(spec_kwargs)
+        if processes is None or processes <= 1:
+            results = [_design_filter(k) for k in kwargs_list]
+        else:
+            with ProcessPoolExecutor(max_workers=processes) as pool:
+                results = list(pool.map(_design_filter, kwargs_list))
+        self.filters, self.errors = [], dict()
+        for index, result in enumerate(results):
+            if isinstance(result, Exception):
+                logger.warning("Design of filter %d failed: %s", index, result)
+                self.errors[index] = result
+                result = None
+            self.filters.append(result)
+        self._evaluate()
+
+    def _stack(self, name):
+        """ stacks attribute name of all filters, padded with empty biquads """
+        coefficients = [np.asarray(getattr(f, name)) for f in self.filters
+                        if f is not None]
+        n_biquads = max([len(c) for c in coefficients] + [1])
+        stacked = np.tile(self._empty_biquad, (len(self.filters), n_biquads, 1))
+        for index, f in enumerate(self.filters):
+            if f is not None:
+                c = getattr(f, name)
+                stacked[index, :len(c)] = c
+        return stacked
+
+    def _evaluate(self):
+        valid = np.array([f is not None for f in self.filters], dtype=bool)
+        dt = np.array([8e-9 if f is None else f.dt for f in self.filters])
+        self.loops = np.array([0 if f is None else f.loops
+                               for f in self.filters])
+        self.coefficients = self._stack('coefficients')
+        self.coefficients_rounded = self._stack('coefficients_rounded')
+        # discrete frequencies and delays of all filters at once
+        w = 2 * np.pi * self.frequencies * (dt * self.loops)[:, np.newaxis]
+        delay_per_cycle = np.exp(-1j * 2 * np.pi * self.frequencies *
+                                 dt[:, np.newaxis])
+        inputfilter = np.ones(w.shape, dtype=np.complex128)
+        for index, f in enumerate(self.filters):
+            if f is not None:
+                inputfilter[index] = f.tf_inputfilter(
+                    frequencies=self.frequencies)
+        self.tf_coefficients = freqz_biquads(self.coefficients, w)
+        self.tf_rounded = freqz_biquads(self.coefficients_rounded, w)
+        self.tf_final = freqz_biquads(self.coefficients_rounded, w,
+                                      delay_per_cycle) * inputfilter
+        for tf in (self.tf_coefficients, self.tf_rounded, self.tf_final):
+            tf[~valid] = np.nan
@@ -255,6 +255,11 @@ class Iq(FilterModule):
 
     _gui_attributes = _setup_attributes  # + ["synchronize_iqs"]  # function calls auto-gui only works in develop-0.9.3 branch
 
+    # all iq registers are fetched in one transfer by _snapshot()
+    _register_window = (0x0, 0x240)
+    # na data and pfd_integral are live
+    _live_registers = FilterModule._live_registers + ((0x140, 0x14),)
+
     _delay = 5  # bare delay of IQ module with no filters set (cycles)
 
     _output_signals = sorted_dict(
@@ -412,18 +417,53 @@ class Iq(FilterModule):
     @property
     def _nadata_total(self): #only one read operation--> twice faster than _nadata
         attempt = 0
-        a, b, c, d = self._reads(0x140, 4)
-        while not ((a >> 31 == 0) and (b >> 31 == 0)
-                   and (c >> 31 == 0) and (d >> 31 == 0)):
-            a, b, c, d = self._reads(0x140, 4)
+        data = self._reads(0x140, 4)
+        while not self._nadata_ready(data):
+            data = self._reads(0x140, 4)
 
             self._logger.warning('NA data not ready yet. Try again!')
             attempt += 1
             if attempt > 10:
                 raise Exception("Trying to recover NA data while averaging is not finished. Some setting is wrong. ")
-        sum = np.complex128(self._to_pyint(int(a) + (int(b) << 31), bitlength=62)) \
+        return self._nadata_sum(data)
+
+    @staticmethod
+    def _nadata_ready(data):
+        """ True if the 4 na data words are valid, i.e. averaging is done """
+        return all(int(v) >> 31 == 0 for v in data)
+
+    def _nadata_sum(self, data):
+        """ complex sum of the na averages from the 4 na data words """
+        a, b, c, d = data
+        return np.complex128(self._to_pyint(int(a) + (int(b) << 31), bitlength=62)) \
               + np.complex128(self._to_pyint(int(c) + (int(d) << 31), bitlength=62)) * 1j
-        return sum
+
+    @property
+    def _na_sweep_available(self):
+        """ True if monitor_server can run na sweeps on the board """
+        from ..redpitaya_client import NA_SWEEP_PROTOCOL_VERSION
+        return self._async_client is not None and \
+            self._client.protocol_version >= NA_SWEEP_PROTOCOL_VERSION
+
+    async def _na_sweep_async(self, frequencies, sleepcycles, averages):
+        """
+        Acquires one na point per frequency on the board, without a network
+        round trip between the points (see the command 'n' of
+        monitor_server). Returns an array with the 4 na data words of each
+        point, to be checked with _nadata_ready() and converted with
+        _nadata_sum().
+        """
+        from ..redpitaya_client import NA_SWEEP_POINT_TIMEOUT
+        register = self.__class__.frequency
+        values = [sleepcycles, averages] + \
+                 [register.from_python(self, f) for f in frequencies]
+        # worst case, each point times out on the board
+        duration = len(frequencies) * ((sleepcycles + averages) * 8e-9
+                                       + NA_SWEEP_POINT_TIMEOUT)
+        data, = await self._execute_async([('n', 0x0, values)],
+                                          duration=duration)
+        register.value_updated(self, frequencies[-1])
+        return data
 
     # the implementation of network_analyzer is not identical to na_trace
     # there are still many bugs in it, which is why we will keep this function
@@ -238,6 +238,11 @@ class Pid(FilterModule):
                          ]
     _gui_attributes = _setup_attributes + ["ival"]
 
+    # all pid registers are fetched in one transfer by _snapshot()
+    _register_window = (0x0, 0x240)
+    # the integrator value is live
+    _live_registers = FilterModule._live_registers + ((0x100, 0x4),)
+
     # the function is here so the metaclass generates a setup(**kwds) function
     def _setup(self):
         """
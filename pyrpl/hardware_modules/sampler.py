@@ -10,6 +10,7 @@ class Sampler(HardwareModule):
 
     This is a momentary workaround, will be improved later on with an upgraded FPGA version """
     addr_base = 0x40300000
+    _client_channel = 'sampler'  # polled by the lockbox
 
     def stats(self, signal="in1", t=1e-2):
         """
@@ -32,30 +33,48 @@ class Sampler(HardwareModule):
             signal = signal.name
         except AttributeError:
             pass
+        register = getattr(type(self), signal)
+        addr = self._addr_base + register.address
+        # the register is sampled on the board in chunks whose size is
+        # adapted to the remaining time
+        samples = 1024 if self._client.protocol_version >= 1 else 64
         nn = 0
         cum = 0
         cumsq = 0
         max = -np.inf
         min = np.inf
+        board_stats = True
         t0 = time()  # get start time
         while nn == 0 or time() < t0 + t:  # do at least one sample
-            nn += 1
-            value = self.__getattribute__(signal)
-            cum += value
-            cumsq += (value ** 2.0)
-            if value > max:
-                max = value
-            if value < min:
-                min = value
+            result = None
+            if board_stats:
+                result = self._client.stats(addr, samples, bits=register.bits)
+            if result is None:
+                # the transaction failed: sample the register from python
+                board_stats = False
+                value = getattr(self, signal) * register.norm
+                result = 1, value, value ** 2.0, value, value
+            n, s, sq, mi, ma = result
+            nn += n
+            cum += s
+            cumsq += sq
+            if ma > max:
+                max = ma
+            if mi < min:
+                min = mi
+            elapsed = time() - t0
+            if elapsed > 0:
+                samples = int((t0 + t - time()) * nn / elapsed)
         nn = float(nn)
         mean = cum / nn
-        variance = (cumsq / nn - mean**2.0)
+        variance = (cumsq / nn - mean**2.0) / register.norm**2
         # while mathematically nonsense, this can happen numerically
         if variance < 0:
             # this means the variance is tiny and can be assumed zero
             variance = 0
         stddev = variance ** 0.5
-        return mean, stddev, max, min
+        return (mean / register.norm, stddev,
+                max / register.norm, min / register.norm)
 
     def mean_stddev(self, signal="in1", t=1e-2):
         """
@@ -120,10 +120,10 @@ large an integrator gain will quickly saturate the outputs.
     print("First point in data buffer 1 [V]:", s.ch1_firstpoint)
 """
 
-import time
+from collections import namedtuple
 from .dsp import all_inputs, dsp_addr_base, InputSelectRegister
 from ..acquisition_module import AcquisitionModule
-from ..async_utils import wait, ensure_future, sleep_async
+from ..async_utils import wait, ensure_future, sleep_async, sleep
 from ..pyrpl_utils import sorted_dict
 from ..attributes import *
 from ..modules import HardwareModule
@@ -202,9 +202,173 @@ class SamplingTimeProperty(SelectProperty):
         instance.decimation = float(value) / 8e-9
 
 
+StreamBlock = namedtuple('StreamBlock', ['start', 'data', 'gap'])
+
+
+class ScopeStream(object):
+    """
+    Iterator over contiguous blocks of samples that are continuously
+    drained from the scope buffer, see :meth:`Scope.stream`.
+
+    Each block is a StreamBlock(start, data, gap): start is the index of the
+    first sample of the block counted from the start of the stream, data is
+    an array of shape (len(channels), number of samples) with the normalized
+    samples of the active channels, and gap is the number of samples right
+    before the block that were overwritten in the scope buffer before they
+    could be transferred.
+
+    If filename is given, the samples are also recorded in a memory-mapped
+    .npy file of shape (len(channels), ring_length) that is used as a ring
+    buffer: sample i is stored at index i % ring_length and lost samples
+    are stored as nan.
+    """
+    default_ring_length = 2 ** 24  # samples per channel in the file
+
+    def __init__(self, scope, duration=None, filename=None, ring_length=None):
+        self.scope = scope
+        self.channels = [ch for ch, active in [(1, scope.ch1_active),
+                                               (2, scope.ch2_active)]
+                         if active]
+        if not self.channels:
+            raise ValueError("At least one scope channel must be active "
+                             "for streaming.")
+        self.decimation = scope.decimation
+        self.sampling_time = scope.sampling_time
+        if duration is None:
+            self.length = None
+        else:
+            self.length = int(np.ceil(duration / self.sampling_time))
+        self.samples = 0  # samples transferred or lost so far
+        self.gaps = []  # (start, length) of the lost ranges
+        self.ring = None
+        if filename is not None:
+            if ring_length is None:
+                ring_length = min(self.length or self.default_ring_length,
+                                  self.default_ring_length)
+            self.ring = np.lib.format.open_memmap(
+                filename, mode='w+', dtype=np.float32,
+                shape=(len(self.channels), ring_length))
+        # refill the buffer at least 4 times per round trip
+        self._interval = scope.duration / 4
+        self._gap = 0  # lost samples not reported yet
+        # stream index, buffer position and timestamp of the write pointer
+        self._pointer = None
+        self._time = 0  # time of the last transfer
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        n = self.scope.data_length
+        while self.length is None or self.samples < self.length:
+            delay = self._interval - (time() - self._time)
+            if delay > 0:
+                sleep(delay)  # keeps the event loop running
+            if self._pointer is None:
+                self._pointer = self._update_pointer(
+                    self.scope._reads_many([(0x18, 1), (0x15C, 2)]))
+                continue
+            index, wp, _ = self._pointer
+            # samples older than one buffer are overwritten already
+            stop = index if self.length is None else min(index, self.length)
+            start = min(max(self.samples, index - n), stop)
+            self._lose(start - self.samples)
+            count = stop - start
+            offset = (wp - (index - start)) % n
+            # [offset, offset + count) may wrap around the end of the buffer
+            pieces = [(offset, min(count, n - offset))]
+            if offset + count > n:
+                pieces.append((0, offset + count - n))
+            requests = [(0x10000 * ch + 4 * position, length)
+                        for ch in self.channels for position, length in pieces
+                        if length > 0]
+            # the write pointer is read after the data to detect overwrites
+            replies = self.scope._reads_many(requests + [(0x18, 1),
+                                                         (0x15C, 2)])
+            self._pointer = self._update_pointer(replies[-2:])
+            if count <= 0:
+                continue
+            data = np.empty((len(self.channels), count))
+            reply = 0
+            for row in range(len(self.channels)):
+                position = 0
+                for _, length in pieces:
+                    if length > 0:
+                        x = replies[reply].view(np.int32)
+                        x <<= 18  # sign extension of the 14 bit values
+                        x >>= 18
+                        data[row, position:position + length] = x / 2 ** 13
+                        position += length
+                        reply += 1
+            # samples overwritten while the transfer was in progress
+            lost = min(count, max(0, self._pointer[0] - n - start))
+            self._lose(lost)
+            if lost == count:
+                continue
+            block = StreamBlock(start + lost, data[:, lost:], self._gap)
+            self._record(block.start, block.data)
+            self.samples = stop
+            self._gap = 0
+            return block
+        if self.ring is not None:
+            self.ring.flush()
+        raise StopIteration
+
+    next = __next__  # python 2
+
+    def close(self):
+        """ Ends the stream and flushes the recording to disk. """
+        self.length = self.samples
+        if self.ring is not None:
+            self.ring.flush()
+
+    def _update_pointer(self, replies):
+        """ Returns the new (stream index, buffer position, timestamp) of the
+        write pointer from the replies of its registers. """
+        n = self.scope.data_length
+        wp = int(replies[0][0]) % n
+        timestamp = int(replies[1][0]) + (int(replies[1][1]) << 32)
+        self._time = time()
+        if self._pointer is None:
+            return 0, wp, timestamp
+        index, last_wp, last_timestamp = self._pointer
+        # the write pointer only tells the position modulo the buffer
+        # length, the number of complete buffer cycles comes from the
+        # timestamps
+        count = (wp - last_wp) % n
+        elapsed = ((timestamp - last_timestamp) % 2 ** 64) / self.decimation
+        cycles = max(0, int(round((elapsed - count) / n)))
+        return index + count + cycles * n, wp, timestamp
+
+    def _lose(self, count):
+        if count <= 0:
+            return
+        start = self.samples
+        self.gaps.append((start, count))
+        self._gap += count
+        self.samples += count
+        if self.ring is not None:
+            # only the newest samples fit into the ring
+            length = min(count, self.ring.shape[1])
+            self._record(start + count - length,
+                         np.full((len(self.channels), length), np.nan))
+
+    def _record(self, start, data):
+        if self.ring is None:
+            return
+        ring_length = self.ring.shape[1]
+        start += max(0, data.shape[1] - ring_length)
+        data = data[:, -ring_length:]  # only the newest samples fit
+        position = start % ring_length
+        first = min(data.shape[1], ring_length - position)
+        self.ring[:, position:position + first] = data[:, :first]
+        self.ring[:, :data.shape[1] - first] = data[:, first:]
+
+
 class Scope(HardwareModule, AcquisitionModule):
     MIN_DELAY_CONTINUOUS_ROLLING_MS = 20
     addr_base = 0x40100000
+    _client_channel = 'scope'  # curve transfers use their own connection
     name = 'scope'
     _widget_class = ScopeWidget
     # run = ModuleProperty(ScopeAcquisitionManager)
@@ -222,9 +386,10 @@ class Scope(HardwareModule, AcquisitionModule):
                        "ch2_active",
                        "ch_math_active",
                        "math_formula",
-                       "xy_mode"]
+                       "xy_mode",
+                       "average_mode"]
     # running_state last for proper acquisition setup
-    _setup_attributes = _gui_attributes + ["rolling_mode"]
+    _setup_attributes = _gui_attributes + ["trace_variance", "rolling_mode"]
     # changing these resets the acquisition and autoscale (calls setup())
 
     data_length = data_length  # to use it in a list comprehension
@@ -471,29 +636,42 @@ class Scope(HardwareModule, AcquisitionModule):
         if new is not None:
             self.stop()
 
+    _rawdata_buffer = None  # receive buffer for both channels
+
+    def _rawdata(self, ch):
+        """
+        raw data from channel ch as int32. The data is received into a
+        buffer that is reused by the next transfer of the same channel, such
+        that the returned array is only valid until then. Callers outside
+        of this class should use _rawdata_ch1 and _rawdata_ch2, which return
+        copies.
+        """
+        if self._rawdata_buffer is None or \
+                self._rawdata_buffer.shape[1] != self.data_length:
+            self._rawdata_buffer = np.empty((2, self.data_length),
+                                            dtype=np.uint32)
+        x = self._reads(0x10000 * ch, self.data_length,
+                        out=self._rawdata_buffer[ch - 1]).view(np.int32)
+        # in-place sign extension of the 14 bit values
+        x <<= 18
+        x >>= 18
+        return x
+
     @property
     def _rawdata_ch1(self):
         """raw data from ch1"""
-        # return np.array([self.to_pyint(v) for v in self._reads(0x10000,
-        # self.data_length)],dtype=np.int32)
-        x = np.array(self._reads(0x10000, self.data_length), dtype=np.int16)
-        x[x >= 2 ** 13] -= 2 ** 14
-        return x
+        return self._rawdata(1).copy()
 
     @property
     def _rawdata_ch2(self):
         """raw data from ch2"""
-        # return np.array([self.to_pyint(v) for v in self._reads(0x20000,
-        # self.data_length)],dtype=np.int32)
-        x = np.array(self._reads(0x20000, self.data_length), dtype=np.int16)
-        x[x >= 2 ** 13] -= 2 ** 14
-        return x
+        return self._rawdata(2).copy()
 
     @property
     def _data_ch1(self):
         """ acquired (normalized) data from ch1"""
         return np.array(
-            np.roll(self._rawdata_ch1, - (self._write_pointer_trigger +
+            np.roll(self._rawdata(1), - (self._write_pointer_trigger +
                                           self._trigger_delay_register + 1)),
             dtype=float) / 2 ** 13
 
@@ -501,7 +679,7 @@ class Scope(HardwareModule, AcquisitionModule):
     def _data_ch2(self):
         """ acquired (normalized) data from ch2"""
         return np.array(
-            np.roll(self._rawdata_ch2, - (self._write_pointer_trigger +
+            np.roll(self._rawdata(2), - (self._write_pointer_trigger +
                                           self._trigger_delay_register + 1)),
             dtype=float) / 2 ** 13
 
@@ -509,14 +687,14 @@ class Scope(HardwareModule, AcquisitionModule):
     def _data_ch1_current(self):
         """ (unnormalized) data from ch1 while acquisition is still running"""
         return np.array(
-            np.roll(self._rawdata_ch1, -(self._write_pointer_current + 1)),
+            np.roll(self._rawdata(1), -(self._write_pointer_current + 1)),
             dtype=float) / 2 ** 13
 
     @property
     def _data_ch2_current(self):
         """ (unnormalized) data from ch2 while acquisition is still running"""
         return np.array(
-            np.roll(self._rawdata_ch2, -(self._write_pointer_current + 1)),
+            np.roll(self._rawdata(2), -(self._write_pointer_current + 1)),
             dtype=float) / 2 ** 13
 
     @property
@@ -580,7 +758,53 @@ class Scope(HardwareModule, AcquisitionModule):
         """
         Simply pack together channel 1 and channel 2 curves in a numpy array
         """
-        return np.array((self._get_ch(1), self._get_ch(2)))
+        return self._fetch_frame()
+
+    async def _get_trace_async(self):
+        """
+        Same as _get_trace(), but the curve transfer does not block the
+        event loop
+        """
+        replies = await self._reads_many_async(self._frame_requests())
+        return self._frame_from_replies(replies)
+
+    _frame_buffer = None  # normalized data of both channels
+
+    def _frame_requests(self):
+        # trigger delay, decimation and both write pointers are adjacent
+        return [(0x10, 4),
+                (0x10000, self.data_length),
+                (0x20000, self.data_length)]
+
+    def _fetch_frame(self):
+        """
+        Reads both channel buffers and the pointer registers in a single
+        transaction.
+
+        Returns a (2, data_length) float32 array with the normalized data of
+        both channels, aligned with respect to the trigger. It is reused by
+        the next call.
+        """
+        return self._frame_from_replies(
+            self._reads_many(self._frame_requests()))
+
+    def _frame_from_replies(self, replies):
+        registers, ch1, ch2 = replies
+        delay, _, _, wp_trigger = [int(v) for v in registers]
+        n = self.data_length
+        start = (wp_trigger + delay + 1) % n
+        if self._frame_buffer is None or self._frame_buffer.shape[1] != n:
+            self._frame_buffer = np.empty((2, n), dtype=np.float32)
+        frame = self._frame_buffer
+        for ch, data in enumerate([ch1, ch2]):
+            # in-place sign extension of the 14 bit values
+            x = data.view(np.int32)
+            x <<= 18
+            x >>= 18
+            # the rotation is done while normalizing, without np.roll
+            np.multiply(x[start:], 1. / 2 ** 13, out=frame[ch, :n - start])
+            np.multiply(x[:start], 1. / 2 ** 13, out=frame[ch, n - start:])
+        return frame
 
     def _remaining_time(self):
         """
@@ -646,6 +870,7 @@ class Scope(HardwareModule, AcquisitionModule):
         self._start_trace_acquisition()
         self._trigger_source_register = 'off'
         self._trigger_armed = True
+        self._rolling_data = None  # the first curve transfers everything
 
     # Rolling_mode related methods:
     # -----------------------------
@@ -670,36 +895,111 @@ class Scope(HardwareModule, AcquisitionModule):
     def _get_ch_no_roll(self, ch):
         if ch not in [1, 2]:
             raise ValueError("channel should be 1 or 2, got " + str(ch))
-        return self._rawdata_ch1 * 1. / 2 ** 13 if ch == 1 else \
-            self._rawdata_ch2 * 1. / 2 ** 13
+        return self._rawdata(ch) * 1. / 2 ** 13
+
+    # host-side copy of the scope buffer in rolling mode, each sample is
+    # stored at the same index as in the FPGA memory
+    _rolling_data = None
+    _rolling_write_pointer = 0  # samples up to here have been transferred
+    _rolling_time = 0  # time of the last transfer
+    _rolling_channels = None  # active channels of the last transfer
 
     def _get_rolling_curve(self):
-        datas = np.zeros((2, len(self.times)))
-        # Rolling mode
-        wp0 = self._write_pointer_current  # write pointer
-        # before acquisition
+        """
+        Returns times and data of both channels in rolling mode. Only the
+        samples written since the previous call are transferred into the
+        host-side copy of the scope buffer.
+        """
+        n = self.data_length
         times = self.times
         times -= times[-1]
-
-        for ch, active in (
-                (0, self.ch1_active),
-                (1, self.ch2_active)):
-            if active:
-                datas[ch] = self._get_ch_no_roll(ch + 1)
-        wp1 = self._write_pointer_current  # write pointer after
-        #  acquisition
-        for index, active in [(0, self.ch1_active),
-                              (1, self.ch2_active)]:
-            if active:
-                data = datas[index]
-                to_discard = (wp1 - wp0) % self.data_length  # remove
-                #  data that have been affected during acq.
-                data = np.roll(data, self.data_length - wp0)[
-                       to_discard:]
-                data = np.concatenate([[np.nan] * to_discard, data])
-                datas[index] = data
+        channels = [index for index, active in [(0, self.ch1_active),
+                                                (1, self.ch2_active)]
+                    if active]
+        wp = self._write_pointer_current % n  # write pointer
+        now = time()
+        # start over if the buffer may have been overwritten entirely
+        full = self._rolling_data is None \
+            or self._rolling_data.shape[1] != n \
+            or self._rolling_channels != channels \
+            or now - self._rolling_time > self.duration / 2
+        if full:
+            self._rolling_data = np.zeros((2, n))
+            start, count = wp, n
+        else:
+            start = self._rolling_write_pointer
+            count = (wp - start) % n
+        # [start, start + count) may wrap around the end of the buffer
+        pieces = [(start, min(count, n - start))]
+        if start + count > n:
+            pieces.append((0, start + count - n))
+        requests = [(0x10000 * (ch + 1) + 4 * offset, length)
+                    for ch in channels for offset, length in pieces
+                    if length > 0]
+        if full:  # write pointer after acquisition
+            requests.append((0x18, 1))
+        replies = self._reads_many(requests) if requests else []
+        index = 0
+        for ch in channels:
+            for offset, length in pieces:
+                if length > 0:
+                    x = replies[index].view(np.int32)
+                    x <<= 18  # sign extension of the 14 bit values
+                    x >>= 18
+                    self._rolling_data[ch, offset:offset + length] = \
+                        x / 2 ** 13
+                    index += 1
+        if full:
+            # remove data that have been affected during acq.
+            wp1 = int(replies[-1][0]) % n
+            if wp1 >= wp:
+                self._rolling_data[:, wp:wp1] = np.nan
+            else:
+                self._rolling_data[:, wp:] = np.nan
+                self._rolling_data[:, :wp1] = np.nan
+        self._rolling_write_pointer = wp
+        self._rolling_time = now
+        self._rolling_channels = channels
+        # oldest sample first
+        datas = np.concatenate((self._rolling_data[:, wp:],
+                                self._rolling_data[:, :wp]), axis=1)
         return times, datas
 
+    def stream(self, duration=None, filename=None, ring_length=None):
+        """
+        Continuously transfers the samples of the active channels while the
+        scope keeps filling its buffer, such that records much longer than
+        the scope duration can be acquired.
+
+        Returns a :class:`ScopeStream`, an iterator over contiguous blocks of
+        samples: StreamBlock(start, data, gap) with the index of the first
+        sample of the block, the data of the active channels and the number
+        of samples lost right before the block. Samples get lost if the
+        buffer is overwritten before it could be transferred, i.e. if the
+        decimation is too low for the network link.
+
+        :param duration: duration of the record in seconds, or None to
+            stream until the iterator is closed.
+        :param filename: if given, the samples are also recorded in this
+            memory-mapped .npy file that is used as a ring buffer (lost
+            samples are recorded as nan).
+        :param ring_length: number of samples per channel in the file,
+            defaults to the full duration, but at most
+            ScopeStream.default_ring_length.
+
+        Example::
+
+            s = r.scope
+            s.decimation = 1024
+            for block in s.stream(duration=3600., filename='record.npy'):
+                if block.gap:
+                    print("lost %d samples" % block.gap)
+        """
+        self.stop()
+        self._start_acquisition_rolling_mode()
+        return ScopeStream(self, duration=duration, filename=filename,
+                           ring_length=ring_length)
+
     # Custom behavior of AcquisitionModule methods for scope:
     # -------------------------------------------------------
 
@@ -17,10 +17,14 @@
 ###############################################################################
 
 import os
+import hashlib
+import pickle
+import weakref
 from collections import OrderedDict
+from functools import lru_cache
 from shutil import copyfile
 import numpy as np
-import time
+from time import time as wall_time
 from qtpy import QtCore
 from . import default_config_dir, user_config_dir
 from .pyrpl_utils import time
@@ -55,6 +59,8 @@ try:
     #ruamel.yaml.RoundTripDumper.ignore_aliases = lambda *args: True
     def load(f):
         return ruamel.yaml.load(f, ruamel.yaml.RoundTripLoader)
+    def load_all(f):
+        return ruamel.yaml.load_all(f, ruamel.yaml.RoundTripLoader)
     def save(data, stream=None):
         return ruamel.yaml.dump(data, stream=stream,
                                 Dumper=ruamel.yaml.RoundTripDumper,
@@ -63,47 +69,70 @@ except:
     logger.debug("ruamel.yaml could not be imported. Using yaml instead. "
                  "Comments in config files will be lost.")
     import yaml
+    # libyaml-based loader and dumper are much faster if available
+    try:
+        from yaml import CSafeLoader as SafeLoader, CSafeDumper as SafeDumper
+    except ImportError:
+        from yaml import SafeLoader, SafeDumper
 
     # see http://stackoverflow.com/questions/13518819/avoid-references-in-pyyaml
     #yaml.Dumper.ignore_aliases = lambda *args: True # NEVER TESTED
 
     # ordered load and dump for yaml files. From
     # http://stackoverflow.com/questions/5121931/in-python-how-can-you-load-yaml-mappings-as-ordereddicts
-    def load(stream, Loader=yaml.SafeLoader, object_pairs_hook=OrderedDict):
-        class OrderedLoader(Loader):
-            pass
-        def construct_mapping(loader, node):
-            loader.flatten_mapping(node)
-            return object_pairs_hook(loader.construct_pairs(node))
-        OrderedLoader.add_constructor(
-            yaml.resolver.BaseResolver.DEFAULT_MAPPING_TAG,
-            construct_mapping)
-        return yaml.load(stream, OrderedLoader)
-    def save(data, stream=None, Dumper=yaml.SafeDumper,
+    # The Loader and Dumper subclasses are only created once per base class.
+    _ordered_loaders = dict()
+    _ordered_dumpers = dict()
+
+    def _ordered_loader(Loader, object_pairs_hook):
+        key = (Loader, object_pairs_hook)
+        if key not in _ordered_loaders:
+            class OrderedLoader(Loader):
+                pass
+            def construct_mapping(loader, node):
+                loader.flatten_mapping(node)
+                return object_pairs_hook(loader.construct_pairs(node))
+            OrderedLoader.add_constructor(
+                yaml.resolver.BaseResolver.DEFAULT_MAPPING_TAG,
+                construct_mapping)
+            _ordered_loaders[key] = OrderedLoader
+        return _ordered_loaders[key]
+
+    def _ordered_dumper(Dumper):
+        if Dumper not in _ordered_dumpers:
+            class OrderedDumper(Dumper):
+                pass
+            def _dict_representer(dumper, data):
+                return dumper.represent_mapping(
+                    yaml.resolver.BaseResolver.DEFAULT_MAPPING_TAG,
+                    data.items())
+            OrderedDumper.add_representer(OrderedDict, _dict_representer)
+            OrderedDumper.add_representer(np.float64,
+                        lambda dumper, data: dumper.represent_float(float(data)))
+            OrderedDumper.add_representer(complex,
+                        lambda dumper, data: dumper.represent_str(str(data)))
+            OrderedDumper.add_representer(np.complex128,
+                        lambda dumper, data: dumper.represent_str(str(data)))
+            OrderedDumper.add_representer(np.ndarray,
+                        lambda dumper, data: dumper.represent_list(list(data)))
+            _ordered_dumpers[Dumper] = OrderedDumper
+        return _ordered_dumpers[Dumper]
+
+    def load(stream, Loader=SafeLoader, object_pairs_hook=OrderedDict):
+        return yaml.load(stream, _ordered_loader(Loader, object_pairs_hook))
+    def load_all(stream, Loader=SafeLoader, object_pairs_hook=OrderedDict):
+        return yaml.load_all(stream, _ordered_loader(Loader,
+                                                     object_pairs_hook))
+    def save(data, stream=None, Dumper=SafeDumper,
              default_flow_style=False,
              encoding='utf-8',
              **kwds):
-        class OrderedDumper(Dumper):
-            pass
-        def _dict_representer(dumper, data):
-            return dumper.represent_mapping(
-                yaml.resolver.BaseResolver.DEFAULT_MAPPING_TAG,
-                data.items())
-        OrderedDumper.add_representer(OrderedDict, _dict_representer)
-        OrderedDumper.add_representer(np.float64,
-                    lambda dumper, data: dumper.represent_float(float(data)))
-        OrderedDumper.add_representer(complex,
-                    lambda dumper, data: dumper.represent_str(str(data)))
-        OrderedDumper.add_representer(np.complex128,
-                    lambda dumper, data: dumper.represent_str(str(data)))
-        OrderedDumper.add_representer(np.ndarray,
-                    lambda dumper, data: dumper.represent_list(list(data)))
         # I added the following two lines to make pyrpl compatible with pyinstruments. In principle they can be erased
         if isinstance(data, dict) and not isinstance(data, OrderedDict):
             data = OrderedDict(data)
         return yaml.dump(data,
                          stream=stream,
-                         Dumper=OrderedDumper,
+                         Dumper=_ordered_dumper(Dumper),
                          default_flow_style=default_flow_style,
                          encoding=encoding,
                          **kwds)
@@ -113,10 +142,105 @@ except:
     # save(data, stream=f, Dumper=yaml.SafeDumper)
 
 
+# parsed config files, keyed by the hash of the file content. The data are
+# stored pickled, since unpickling a fresh copy is much faster than parsing.
+_snapshots = OrderedDict()  # hash -> pickled data, most recent last
+_snapshot_files = dict()  # filename -> ((mtime_ns, size), hash)
+_MAX_SNAPSHOTS = 16
+
+
+def load_file(filename):
+    """
+    returns the parsed content of the yml file filename. The result is
+    cached by the (mtime, size, hash) of the file, such that loading an
+    unchanged file or a copy of an already loaded file does not parse it
+    again.
+    """
+    stat = os.stat(filename)
+    key = (stat.st_mtime_ns, stat.st_size)
+    known_key, digest = _snapshot_files.get(filename, (None, None))
+    # the mtime resolution of some file systems is coarse, so the
+    # content of recently modified files is always hashed
+    if known_key != key or digest not in _snapshots or \
+            wall_time() - stat.st_mtime < 2:
+        with open(filename, mode='rb') as f:
+            content = f.read()
+        digest = hashlib.sha1(content).hexdigest()
+        if digest not in _snapshots:
+            _snapshots[digest] = pickle.dumps(load(content),
+                                              pickle.HIGHEST_PROTOCOL)
+            while len(_snapshots) > _MAX_SNAPSHOTS:
+                _snapshots.popitem(last=False)
+        _snapshot_files[filename] = (key, digest)
+    _snapshots.move_to_end(digest)
+    return pickle.loads(_snapshots[digest])
+
+
 def isbranch(obj):
     return isinstance(obj, dict) or isinstance(obj, list)
 
 
+@lru_cache(maxsize=1024)
+def _split_path(name):
+    """ returns the tuple of keys of the dotted path name, e.g. 'a.b.c' """
+    return tuple(name.split('.'))
+
+
+# a single QFileSystemWatcher for the files of all MemoryTree objects, such
+# that a tree only checks its config file after a change has been notified
+_watcher = None
+_watched_trees = weakref.WeakSet()
+
+
+def _watch(tree):
+    """ notifies tree of the changes of its config file and journal """
+    global _watcher
+    if _watcher is None:
+        _watcher = QtCore.QFileSystemWatcher()
+        _watcher.fileChanged.connect(_on_file_changed)
+        _watcher.directoryChanged.connect(_on_file_changed)
+    _watched_trees.add(tree)
+    _watch_paths(tree)
+
+
+def _watch_paths(tree):
+    # the watch of a file is lost when it is replaced (see
+    # MemoryTree._write_to_file) or deleted, and the journal is created only
+    # upon the first change. The directory is watched to catch both cases.
+    watched = set(_watcher.files()) | set(_watcher.directories())
+    missing = [path for path in tree._watched_paths
+               if path not in watched and os.path.exists(path)]
+    if missing:
+        _watcher.addPaths(missing)
+
+
+def _on_file_changed(path):
+    for tree in list(_watched_trees):
+        if path in tree._watched_paths:
+            tree._invalidate()
+            _watch_paths(tree)
+
+
+# every document in the config journal ends with this line
+_JOURNAL_SEPARATOR = b"\n...\n"
+
+
+def _complete_journal_length(f):
+    """
+    returns the length of the journal file f up to the end of its last
+    complete document. The file position is left at the end of the file.
+    """
+    size = f.seek(0, os.SEEK_END)
+    if size < len(_JOURNAL_SEPARATOR):
+        return 0
+    f.seek(size - len(_JOURNAL_SEPARATOR))
+    if f.read() == _JOURNAL_SEPARATOR:  # usual case, a complete journal
+        return size
+    f.seek(0)
+    end = f.read().rfind(_JOURNAL_SEPARATOR)
+    return 0 if end < 0 else end + len(_JOURNAL_SEPARATOR)
+
+
 # two functions to locate config files
 def _get_filename(filename=None):
     """ finds the correct path and name of a config file """
@@ -220,6 +344,10 @@ class MemoryBranch(object):
     def __init__(self, parent, branch):
         self._parent = parent
         self._branch = branch
+        # the MemoryTree object at the root of the tree
+        self._tree = self if parent is self else parent._tree
+        # subbranch objects are created once and reused for all lookups
+        self._branches = dict()
         self._update_instance_dict()
 
     def _update_instance_dict(self):
@@ -243,6 +371,7 @@ class MemoryBranch(object):
         logger.warning("You are directly modifying the data of MemoryBranch"
                        " %s to %s.", self._fullbranchname, str(value))
         self._parent._data[self._branch] = value
+        self._root._append_to_journal(self._path, value)
 
     def _keys(self):
         if isinstance(self._data, list):
@@ -254,6 +383,8 @@ class MemoryBranch(object):
         if isinstance(self._data, list):
             raise NotImplementedError
         self._data.update(new_dict)
+        for k in new_dict:
+            self._journal_item(k, self._data[k])
         self._save()
         # keep auto_completion up to date
         for k in new_dict:
@@ -262,8 +393,8 @@ class MemoryBranch(object):
     def __getattribute__(self, name):
         """ implements the dot notation.
         Example: self.subbranch.leaf returns the item 'leaf' of 'subbranch' """
-        if name.startswith('_'):
-            return super(MemoryBranch, self).__getattribute__(name)
+        if name[0] == '_':
+            return object.__getattribute__(self, name)
         else:
             # convert dot notation into dict notation
             return self[name]
@@ -275,17 +406,31 @@ class MemoryBranch(object):
         This is much faster, as long as no changes have been made to the config
         file.
         """
-        self._reload()
+        self._tree._reload()
+        branch = self
+        data = self._data
         # if a subbranch is requested, iterate through the hierarchy
         if isinstance(item, str) and '.' in item:
-            item, subitem = item.split('.', 1)
-            return self[item][subitem]
-        else:  # otherwise just return what we can find
-            attribute = self._data[item]  # read from the data dict
-            if isbranch(attribute):  # if the object can be expressed as a branch, do so
-                return MemoryBranch(self, item)
-            else:  # otherwise return whatever we found in the data dict
-                return attribute
+            path = _split_path(item)
+            for name in path[:-1]:
+                data = data[name]
+                if not isbranch(data):
+                    raise KeyError(item)
+                branch = branch._subbranch(name)
+            item = path[-1]
+        attribute = data[item]  # read from the data dict
+        if isbranch(attribute):  # if the object can be expressed as a branch, do so
+            return branch._subbranch(item)
+        else:  # otherwise return whatever we found in the data dict
+            return attribute
+
+    def _subbranch(self, name):
+        """ returns the MemoryBranch object of the subbranch name """
+        try:
+            return self._branches[name]
+        except KeyError:
+            subbranch = self._branches[name] = MemoryBranch(self, name)
+            return subbranch
 
     def __setattr__(self, name, value):
         if name.startswith('_'):
@@ -337,12 +482,27 @@ class MemoryBranch(object):
             # trivial case: _data is dict or item within list length
             # and we can simply set the entry
             self._data[item] = value
+        self._journal_item(item, value)
+
+    def _journal_item(self, item, *value):
+        """
+        records in the journal of the tree that item was set to value,
+        or removed if no value is given
+        """
+        self._root._append_to_journal(self._path + [item], *value)
 
     def _pop(self, name):
         """
         remove an item from the branch
         """
         value = self._data.pop(name)
+        if isinstance(self._data, list):
+            # the indices of all following items have changed
+            self._root._append_to_journal(self._path, self._data)
+            self._branches.clear()
+        else:
+            self._journal_item(name)
+            self._branches.pop(name, None)
         if name in self.__dict__.keys():
             self.__dict__.pop(name)
         self._save()
@@ -363,6 +523,7 @@ class MemoryBranch(object):
             if name == 0 and len(self) == 0:
                 # instantiate a new list - odd way because we must
                 self._parent._data[self._branch] = []
+                self._root._append_to_journal(self._path, [])
             # if index <= len, creation is done automatically if needed
             # otherwise an error is raised
             if name >= len(self):
@@ -371,9 +532,9 @@ class MemoryBranch(object):
         else:  # dict-like subbranch, support several sublevels separated by '.'
             # chop name into parts and iterate through them
             currentbranch = self
-            for subbranchname in name.split("."):
+            for subbranchname in _split_path(name):
                 # make new branch if applicable
-                if subbranchname not in currentbranch._data.keys():
+                if subbranchname not in currentbranch._data:
                     currentbranch[subbranchname] = dict()
                 # move into new branch in case another subbranch will be created
                 currentbranch = currentbranch[subbranchname]
@@ -391,10 +552,17 @@ class MemoryBranch(object):
         """
         returns the parent highest in hierarchy (the MemoryTree object)
         """
-        parent = self
-        while parent != parent._parent:
-            parent = parent._parent
-        return parent
+        return self._tree
+
+    @property
+    def _path(self):
+        """ returns the list of keys from root to the branch """
+        path = []
+        branch = self
+        while branch != branch._parent:
+            path.insert(0, branch._branch)
+            branch = branch._parent
+        return path
 
     @property
     def _fullbranchname(self):
@@ -407,11 +575,11 @@ class MemoryBranch(object):
 
     def _reload(self):
         """ reload data from file"""
-        self._parent._reload()
+        self._tree._reload()
 
     def _save(self):
         """ write data to file"""
-        self._parent._save()
+        self._tree._save()
 
     def _get_yml(self, data=None):
         """
@@ -426,6 +594,7 @@ class MemoryBranch(object):
         """
         branch = load(yml_content)
         self._parent._data[self._branch] = branch
+        self._root._append_to_journal(self._path, branch)
         self._save()
 
     def __len__(self):
@@ -469,17 +638,31 @@ class MemoryTree(MemoryBranch):
     # 1. initially, call _load() to get the data from the file
     # 2. upon each inquiry of the config data, _reload() is called to
     # ensure data integrity
-    # 3. _reload assumes a delay of _loadsavedeadtime between changing the
-    # config file and Pyrpl requesting the new data. That means, _reload
-    # will not attempt to touch the config file more often than every
-    # _loadsavedeadtime. The last interaction time with the file system is
-    # saved in the variable _lastreload. If this time is far enough in the
-    # past, the modification time of the config file is compared to _mtime,
-    # the internal memory of the last modifiation time by pyrpl. If the two
+    # 3. _reload touches the file system after a QFileSystemWatcher has
+    # notified a change of the config file, its journal or its directory,
+    # after an explicit call to _invalidate(), and otherwise at most every
+    # _loadsavedeadtime seconds. The watcher thus only speeds up the
+    # detection of changes, which are also found without a running Qt event
+    # loop. With _loadsavedeadtime 0, the file is checked upon every
+    # inquiry. In all cases, the
+    # modification time of the config file is compared to _mtime, the
+    # internal memory of the last modifiation time by pyrpl. If the two
     # don't match, the file was altered outside the scope of pyrpl and _load
-    # is called to reload it.
+    # is called to reload it. Otherwise, the entries that were appended to
+    # the journal by other MemoryTree objects are applied.
 
     ##### internal save logic:
+    # 1. every change of the tree is appended as a small yaml document to
+    # the journal file (config file name + '.journal'), such that a change
+    # costs a short append instead of rewriting the whole config file.
+    # 2. _write_to_file() compacts the journal: the whole tree is written to
+    # the config file and the journal is deleted. This happens when the
+    # journal exceeds _JOURNAL_MAX_SIZE (delayed by _loadsavedeadtime),
+    # when _save is called with deadtime 0, and when pyrpl is closed.
+    # 3. _load() applies the journal on top of the config file. The first
+    # document of the journal identifies the version of the config file it
+    # applies to, such that a journal is ignored if the config file was
+    # replaced in the meantime.
 
     # this structure will hold the data. Must define it here as immutable
     # to overwrite the property _data of MemoryBranch
@@ -489,12 +672,19 @@ class MemoryTree(MemoryBranch):
     # save
     _ERROR_ON_SAVE = False # Set this flag to true to raise
         # Exceptions upon save
+    _JOURNAL_MAX_SIZE = 256 * 1024  # journal size in bytes above which the
+    # journal is compacted into the config file
 
     def __init__(self, filename=None, source=None, _loadsavedeadtime=3):
         # never reload or save more frequently than _loadsavedeadtime because
         # this is the principal cause of slowing down the code (typ. 30-200 ms)
         # for immediate saving, call _save_now, for immediate loading _load_now
         self._loadsavedeadtime = _loadsavedeadtime
+        self._tree = self
+        self._branches = dict()
+        self._changed_on_disk = False  # set by the file system watcher
+        self._journal_offset = 0  # bytes of the journal applied to _data
+        self._journal_size = 0  # bytes of the journal written by self
         # first, make sure filename exists
         self._filename = get_config_file(filename, source)
         if filename is None:
@@ -502,12 +692,15 @@ class MemoryTree(MemoryBranch):
             self._filename = filename
             self._data = OrderedDict()
         self._lastsave = time()
+        self._lastreload = time()
         # create a timer to postpone to frequent savings
         self._savetimer = QtCore.QTimer()
         self._savetimer.setInterval(int(self._loadsavedeadtime*1000))
         self._savetimer.setSingleShot(True)
         self._savetimer.timeout.connect(self._write_to_file)
         self._load()
+        if self._filename is not None:
+            _watch(self)
 
         self._save_counter = 0 # cntr for unittest and debug purposes
         self._write_to_file_counter = 0  # cntr for unittest and debug purposes
@@ -521,22 +714,130 @@ class MemoryTree(MemoryBranch):
         """ makes a temporary file to ensure modification of config file is atomic (double-buffering like operation...)"""
         return self._filename + '.tmp'
 
+    @property
+    def _journal_filename(self):
+        """ the append-only log of the changes since the last _write_to_file """
+        return self._filename + '.journal'
+
+    @property
+    def _watched_paths(self):
+        """ the files whose changes require a reload of the tree """
+        if self._filename is None:
+            return ()
+        filename = os.path.abspath(self._filename)
+        return (filename, filename + '.journal', os.path.dirname(filename))
+
+    def _journal_header(self):
+        """ identifies the version of the config file the journal applies to """
+        stat = os.stat(self._filename)
+        return OrderedDict([('yml_mtime_ns', stat.st_mtime_ns),
+                            ('yml_size', stat.st_size)])
+
+    def _append_to_journal(self, path, *value):
+        """
+        appends to the journal that the item at path (list of keys) was set
+        to value, or removed if no value is given
+        """
+        if self._filename is None:
+            return
+        entry = save([path] + list(value), default_flow_style=True,
+                     explicit_start=True, explicit_end=True)
+        with open(self._journal_filename, mode='a+b') as f:
+            start = _complete_journal_length(f)
+            if start < f.tell():
+                # the last entry was cut off by a crash, never append to it
+                logger.warning("Removing an incomplete entry from the end of "
+                               "the journal %s.", self._journal_filename)
+                f.truncate(start)
+                f.seek(start)
+            if start == 0:
+                f.write(save(self._journal_header(), default_flow_style=True,
+                             explicit_start=True, explicit_end=True))
+            f.write(entry)
+            self._journal_size = f.tell()
+            if start == self._journal_offset:
+                # no other MemoryTree has written to the journal meanwhile
+                self._journal_offset = self._journal_size
+
+    def _read_journal(self):
+        """
+        applies the complete entries of the journal that were not yet applied
+        """
+        try:
+            with open(self._journal_filename, mode='rb') as f:
+                f.seek(self._journal_offset)
+                content = f.read()
+        except (IOError, OSError):  # no journal
+            self._journal_offset = 0
+            return
+        end = content.rfind(_JOURNAL_SEPARATOR)
+        if end < 0:  # no complete entry
+            return
+        documents = content[:end].split(_JOURNAL_SEPARATOR)
+        offset = self._journal_offset
+        if offset == 0:
+            header = documents.pop(0)
+            try:
+                valid = dict(load(header.decode('utf-8'))) \
+                        == dict(self._journal_header())
+            except Exception:  # unreadable header
+                valid = False
+            if not valid:
+                logger.warning("Config file %s was replaced. Its journal "
+                               "%s is ignored and deleted.", self._filename,
+                               self._journal_filename)
+                os.remove(self._journal_filename)
+                return
+            offset += len(header) + len(_JOURNAL_SEPARATOR)
+        for document in documents:
+            try:
+                entry = load(document.decode('utf-8'))
+            except Exception:  # e.g. garbage left by a crash
+                logger.warning("Could not parse an entry of the journal %s. "
+                               "The remaining entries are ignored.",
+                               self._journal_filename)
+                break
+            self._apply_journal_entry(entry)
+            offset += len(document) + len(_JOURNAL_SEPARATOR)
+        self._journal_offset = offset
+
+    def _apply_journal_entry(self, entry):
+        path, value = entry[0], entry[1:]
+        data = self._data
+        try:
+            for key in path[:-1]:
+                data = data[key]
+            key = path[-1]
+            if not value:
+                data.pop(key, None)
+            elif isinstance(data, list) and key == len(data):
+                data.append(value[0])
+            else:
+                data[key] = value[0]
+        except (KeyError, IndexError, TypeError):
+            logger.warning("Could not apply the entry %s of the journal of "
+                           "config file %s.", entry, self._filename)
+
     def _load(self):
         """ loads data from file """
         if self._filename is None:
             # if no file is used, just ignore this call
             return
         logger.debug("Loading config file %s", self._filename)
-        # read file from disc
-        with open(self._filename) as f:
-            self._data = load(f)
+        # read file from disc (or from the cache of parsed files)
+        self._data = load_file(self._filename)
         # store the modification time of this file version
         self._mtime = os.path.getmtime(self._filename)
-        # make sure that reload timeout starts from this moment
         self._lastreload = time()
+        self._changed_on_disk = False
+        # the cached subbranch objects refer to the replaced data
+        self._branches.clear()
         # empty file gives _data=None
         if self._data is None:
             self._data = OrderedDict()
+        # apply the changes since the last _write_to_file
+        self._journal_offset = 0
+        self._read_journal()
         # update dict of the MemoryTree object
         to_remove = []
         # remove all obsolete entries
@@ -548,16 +849,23 @@ class MemoryTree(MemoryBranch):
         # insert the branches into the object __dict__ for auto-completion
         self.__dict__.update(self._data)
 
+    def _invalidate(self):
+        """
+        makes the next inquiry of the tree check the config file for changes
+        """
+        self._changed_on_disk = True
+
     def _reload(self):
         """
         reloads data from file if file has changed recently
         """
-        # first check if a reload was not performed recently (speed up reasons)
-        if self._filename is None:
-            return
-        # check whether reload timeout has expired
-        if time() > self._lastreload + self._loadsavedeadtime:
-            # prepare next timeout
+        # the file is checked after a notified change, or if the reload
+        # timeout has expired (speed up reasons)
+        if self._changed_on_disk or \
+                time() >= self._lastreload + self._loadsavedeadtime:
+            if self._filename is None:
+                return
+            self._changed_on_disk = False
             self._lastreload = time()
             logger.debug("Checking change time of config file...")
             if self._mtime != os.path.getmtime(self._filename):
@@ -566,6 +874,7 @@ class MemoryTree(MemoryBranch):
                 self._load()
             else:
                 logger.debug("... no reloading required")
+                self._read_journal()
 
     def _write_to_file(self):
         """
@@ -585,6 +894,9 @@ class MemoryTree(MemoryBranch):
                 logger.warning("Config file has recently been changed on your " +
                                "harddisk. These changes might have been " +
                                "overwritten now.")
+            else:
+                # include the changes journaled by other MemoryTree objects
+                self._read_journal()
             # we must be sure that overwriting config file never destroys existing data.
             # security 1: backup with copyfile above
             copyfile(self._filename,
@@ -605,13 +917,20 @@ class MemoryTree(MemoryBranch):
                 raise
             # save last modification time of the file
             self._mtime = os.path.getmtime(self._filename)
+            # the journal is now contained in the config file
+            if os.path.exists(self._journal_filename):
+                os.remove(self._journal_filename)
+            self._journal_offset = 0
+            self._journal_size = 0
 
     def _save(self, deadtime=None):
         """
         A call to this function means that the state of the tree has changed
-        and needs to be saved eventually. To reduce system load, the delay
-        between two writes will be at least deadtime (defaults to
-        self._loadsavedeadtime if None)
+        and needs to be saved eventually. The change itself has already been
+        appended to the journal. With deadtime 0, the journal is immediately
+        compacted into the config file. Otherwise, this only happens when
+        the journal has grown larger than _JOURNAL_MAX_SIZE, at the earliest
+        after deadtime (defaults to self._loadsavedeadtime if None).
         """
         if self._ERROR_ON_SAVE:
             raise UnexpectedSaveError("Save to config file should not "
@@ -622,11 +941,12 @@ class MemoryTree(MemoryBranch):
         self._save_counter += 1  # for unittest and debug purposes
         if deadtime is None:
             deadtime = self._loadsavedeadtime
-        # now write current tree structure and data to file
-        if self._lastsave + deadtime < time():
+        # the change is already in the journal, only its compaction into
+        # the config file remains to be done
+        if deadtime <= 0:
             self._write_to_file()
-        else:
-            # make sure saving will eventually occur by launching a timer
+        elif self._journal_size > self._JOURNAL_MAX_SIZE:
+            # compact the journal once the deadtime has elapsed
             if not self._savetimer.isActive():
                 self._savetimer.start()
 
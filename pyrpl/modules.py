@@ -24,9 +24,11 @@ from .errors import ExpectedPyrplError
 
 import logging
 import string
+from contextlib import nullcontext
 import numpy as np
 from six import with_metaclass
 from collections import OrderedDict
+from itertools import groupby
 from qtpy import QtCore
 
 
@@ -158,18 +160,22 @@ class ModuleMetaClass(type):
             def setup(self, **kwds):
                 self._setup_ongoing = True
                 try:
-                    # user can redefine any setup_attribute through kwds
-                    for key in self._setup_attributes:
-                        if key in kwds:
-                            value = kwds.pop(key)
-                            setattr(self, key, value)
-                    if len(kwds) > 0:
-                        self._logger.warning(
-                            "Trying to load attribute %s of module %s that "
-                            "are invalid setup_attributes.",
-                            sorted(kwds.keys())[0], self.name)
-                    if hasattr(self, '_setup'):
-                        self._setup()
+                    # register writes are sent in as few round trips as
+                    # possible, read-modify-write operations are served
+                    # from a snapshot of the register window
+                    with self._batch(), self._snapshot():
+                        # user can redefine any setup_attribute through kwds
+                        for key in self._setup_attributes:
+                            if key in kwds:
+                                value = kwds.pop(key)
+                                setattr(self, key, value)
+                        if len(kwds) > 0:
+                            self._logger.warning(
+                                "Trying to load attribute %s of module %s "
+                                "that are invalid setup_attributes.",
+                                sorted(kwds.keys())[0], self.name)
+                        if hasattr(self, '_setup'):
+                            self._setup()
                 finally:
                     self._setup_ongoing = False
             # b. place the new setup function in the module class
@@ -250,6 +256,38 @@ class DoSetup(object):
                                         exc_type, exc_val, exc_tb)
 
 
+class RegisterSnapshot(object):
+    """
+    A context manager that serves all register reads of a HardwareModule
+    from a single block read of its register window.
+
+    Usage example::
+
+        with module._snapshot():
+            # the first read fetches the entire window in one transfer
+            a = module.p
+            # further reads are served from the local copy
+            b = module.i
+            # writes go to the hardware and update the local copy
+            module.setpoint = 0.1
+
+    The window is fetched lazily upon the first read, such that a context
+    without any reads does not cost any communication. Nested contexts
+    share the same copy, which is discarded when the outermost context is
+    left.
+    """
+    def __init__(self, module):
+        self.module = module
+
+    def __enter__(self):
+        self.module._snapshot_level += 1
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.module._snapshot_level -= 1
+        if self.module._snapshot_level == 0:
+            self.module._snapshot_data = None
+
+
 class Module(with_metaclass(ModuleMetaClass, object)):
     # The Syntax for defining a metaclass changed from Python 2 to 3.
     # with_metaclass is compatible with both versions and roughly does this:
@@ -479,11 +517,12 @@ class Module(with_metaclass(ModuleMetaClass, object)):
         Recursively collects setup_attributes for sub_modules.
         """
         kwds = OrderedDict()
-        for attr in self._setup_attributes:
-            val = getattr(self, attr)
-            if attr in self._modules:
-                val = val.setup_attributes
-            kwds[attr] = val
+        with self._snapshot():
+            for attr in self._setup_attributes:
+                val = getattr(self, attr)
+                if attr in self._modules:
+                    val = val.setup_attributes
+                kwds[attr] = val
         return kwds
 
     def set_setup_attributes(self, **kwds):
@@ -623,6 +662,25 @@ class Module(with_metaclass(ModuleMetaClass, object)):
         """
         pass
 
+    def _batch(self):
+        """
+        Returns a context manager that groups the register transactions
+        of the enclosed code into as few network round trips as possible.
+
+        Software modules do not talk to the hardware directly, and their
+        setup may rely on the timing of individual writes, so no batching
+        is performed by default.
+        """
+        return nullcontext()
+
+    def _snapshot(self):
+        """
+        Returns a context manager during which register reads may be served
+        from a local copy of the module's registers (see
+        :class:`RegisterSnapshot`). Software modules have no registers.
+        """
+        return nullcontext()
+
     # def help(self, register=''):
     #     """returns the docstring of the specified register name
     #        if register is an empty string, all available docstrings are
@@ -732,12 +790,31 @@ class HardwareModule(Module):
 
     parent = None  # parent will be redpitaya instance
 
+    # modules with the same channel share a connection to the board. None
+    # denotes the default connection (see redpitaya_client.ClientPool)
+    _client_channel = None
+
+    # (offset, length in bytes) of the register block that is fetched in a
+    # single transfer by _snapshot(). None disables snapshots. Only
+    # registers without side effects upon reading may lie in this window.
+    _register_window = None
+    # (offset, length in bytes) of registers inside the window that are
+    # always read from the board: readbacks of live signals and registers
+    # that are shared with other modules. Writes still update the local copy.
+    _live_registers = ()
+    _snapshot_level = 0  # nesting depth of RegisterSnapshot contexts
+    _snapshot_data = None  # local copy of the register window
+
     def __init__(self, parent, name=None):
         """ Creates the prototype of a RedPitaya Module interface
 
         if no name provided, will use cls.name
         """
-        self._client = parent.client
+        pool = getattr(parent, 'client_pool', None)
+        if pool is None:
+            self._client = parent.client
+        else:
+            self._client = pool.get(self._client_channel)
         self._addr_base = self.addr_base
         self._rp = parent
         super(HardwareModule, self).__init__(parent, name=name)
@@ -766,10 +843,67 @@ class HardwareModule(Module):
                                  "'frequency_correction'. ", self.name)
             return 1.0
 
-    def _reads(self, addr, length):
-        return self._client.reads(self._addr_base + addr, length)
+    def _batch(self):
+        """
+        Returns a context manager that defers register writes until the end
+        of the block or the next read (see :meth:`MonitorClient.batch`).
+        """
+        return self._client.batch()
+
+    def _snapshot(self):
+        if self._register_window is None:
+            return nullcontext()
+        return RegisterSnapshot(self)
+
+    def _in_register_window(self, addr, length):
+        """ returns the index range of [addr, addr+4*length) in the window,
+        or None if the range is not entirely contained in the window """
+        start, size = self._register_window
+        first = (addr - start) // 4
+        if addr % 4 == 0 and 0 <= first and (first + length) * 4 <= size:
+            return first, first + length
+        return None
+
+    def _is_live(self, addr, length):
+        """ whether [addr, addr+4*length) overlaps one of _live_registers """
+        for start, size in self._live_registers:
+            if addr < start + size and addr + 4 * length > start:
+                return True
+        return False
+
+    def _reads(self, addr, length, out=None):
+        """
+        reads length registers starting at addr. out is an optional
+        contiguous array of uint32 that receives the data, such that large
+        transfers can reuse a preallocated buffer.
+        """
+        if self._snapshot_level > 0:
+            indices = self._in_register_window(addr, length)
+            if indices is not None and not self._is_live(addr, length):
+                if self._snapshot_data is None:
+                    start, size = self._register_window
+                    self._snapshot_data = np.array(
+                        self._client.reads(self._addr_base + start,
+                                           size // 4), dtype=np.uint32)
+                data = self._snapshot_data[indices[0]:indices[1]]
+                if out is None:
+                    return data.copy()
+                out[:length] = data
+                return out[:length]
+        if out is None:
+            return self._client.reads(self._addr_base + addr, length)
+        return self._client.reads(self._addr_base + addr, length, out=out)
 
     def _writes(self, addr, values):
+        if self._snapshot_data is not None:
+            indices = self._in_register_window(addr, len(values))
+            if indices is not None:
+                self._snapshot_data[indices[0]:indices[1]] = values
+            else:
+                # a partially overlapping write invalidates the local copy
+                start, size = self._register_window
+                if addr < start + size and addr + 4 * len(values) > start:
+                    self._snapshot_data = None
         self._client.writes(self._addr_base + addr, values)
 
     def _read(self, addr):
@@ -778,6 +912,105 @@ class HardwareModule(Module):
     def _write(self, addr, value):
         self._writes(addr, [int(value)])
 
+    def _reads_many(self, requests):
+        """
+        reads several register ranges, given as a list of (addr, length),
+        in a single transaction and returns the list of data arrays
+        """
+        return self._execute([('r', addr, length)
+                              for addr, length in requests])
+
+    def _execute(self, operations):
+        """
+        executes a list of register operations ('r', addr, length) or
+        ('w', addr, values) in a single transaction, in the given order, and
+        returns the list of results (see :meth:`MonitorClient.execute`)
+        """
+        return self._execute_modules([(self, command, addr, arg)
+                                      for command, addr, arg in operations])
+
+    @staticmethod
+    def _execute_modules(operations):
+        """
+        executes a list of register operations (module, command, addr, arg)
+        of several modules in the given order and returns the list of
+        results. Consecutive operations of modules that share a connection
+        to the board are executed in a single transaction.
+        """
+        results = []
+        for client, group in groupby(operations,
+                                     key=lambda operation: operation[0]._client):
+            group = list(group)
+            for module, command, _, _ in group:
+                if command != 'r':
+                    module.invalidate_snapshot()
+            replies = client.execute([(command, module._addr_base + addr, arg)
+                                      for module, command, addr, arg in group])
+            if replies is None:
+                raise IOError("Transaction with the board failed.")
+            results += replies
+        return results
+
+    def invalidate_snapshot(self):
+        """
+        Discards the local copy of the register window, such that the
+        registers are read from the board again, e.g. after they were
+        written by another client.
+        """
+        self._snapshot_data = None
+
+    async def _reads_many_async(self, requests):
+        """ coroutine version of _reads_many() """
+        return await self._execute_async([('r', addr, length)
+                                          for addr, length in requests])
+
+    async def _execute_async(self, operations, duration=0.):
+        """
+        coroutine version of _execute(). duration is the maximum execution
+        time of the operations on the board (see
+        :meth:`AsyncMonitorClient.execute_async`).
+        """
+        client = self._async_client
+        if client is None:
+            return self._execute(operations)
+        if self._snapshot_data is not None and \
+                any(command != 'r' for command, _, _ in operations):
+            self.invalidate_snapshot()
+        self._client.flush()
+        results = await client.execute_async(
+            [(command, self._addr_base + addr, arg)
+             for command, addr, arg in operations], duration=duration)
+        if results is None:
+            raise IOError("Transaction with the board failed.")
+        return results
+
+    @property
+    def _async_client(self):
+        """ asynchronous client of the RedPitaya, or None if unavailable """
+        pool = getattr(self._rp, 'client_pool', None)
+        if pool is None:
+            return None
+        return pool.get_async(self._client_channel)
+
+    async def _reads_async(self, addr, length):
+        """
+        coroutine version of _reads(). The transfer does not block the event
+        loop if the RedPitaya provides an asynchronous client.
+        """
+        client = self._async_client
+        if client is None or self._snapshot_level > 0:
+            return self._reads(addr, length)
+        self._client.flush()  # deferred writes must reach the board first
+        return await client.reads_async(self._addr_base + addr, length)
+
+    async def _writes_async(self, addr, values):
+        """ coroutine version of _writes() """
+        client = self._async_client
+        if client is None or self._snapshot_data is not None:
+            return self._writes(addr, values)
+        self._client.flush()
+        return await client.writes_async(self._addr_base + addr, values)
+
     def _to_pyint(self, v, bitlength=14):
         v = v & (2 ** bitlength - 1)
         if v >> (bitlength - 1):
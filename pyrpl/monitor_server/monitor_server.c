@@ -39,9 +39,14 @@ Communication protocol for the data server:
 
 The program is launched on the redpitaya with 
 
-./monitor-server PORT-NUMBER, where the default port number is 2222.  
+./monitor-server PORT-NUMBER [MEMORY-FILE], where the default port number is 2222.  
+
+The optional memory file replaces /dev/mem, e.g. for tests on a computer 
+without FPGA. It is created if necessary, mapped from offset 0 and extended 
+to the size of the FPGA address space. 
 
 We allow for bidirectional data transfer. The client (python program) connects to the server, which in return accepts the connection. 
+Several clients can be connected at the same time, each one is served by its own thread. 
 The client sends 8 bytes of data:
 Byte 1 is interpreted as a character: 'r' for read and 'w' for write, and 'c' for close. All other messages are ignored. 
 Byte 2 is reserved. 
@@ -50,13 +55,41 @@ Bytes 5-8 are the start address to be written to.
 
 If the command is read, the server will then send the requested 4*n bytes to the client. 
 If the command is write, the server will wait for 4*n bytes of data from the server and write them to the designated FPGA address space. 
-If the command is close, or if the connection is broken, the server program will terminate. 
+If the command is close, or if the connection is broken, the connection to this client is closed. 
+When the last open connection is closed with 'c', the server program terminates, as it did before 
+several clients were supported. 
+Addresses outside of the FPGA address space read as zero and writes to them are ignored. 
 
 After this, the server will wait for the next command. 
+
+Protocol extensions (version 1):
+
+'v' (version): the server replies with the 8 byte header, where byte 2 is 
+replaced by the protocol version. Older servers silently ignore any command 
+with zero length, so a client can send 'v' followed by a normal read to find 
+out whether the extensions are available without risking a server shutdown. 
+
+'s' (statistics): bytes 3+4 are the number n of samples to take from the 
+register at the address in bytes 5-8. Byte 2 is the bit width of the signed 
+register value (0 for 32 bits). The server reads the register n times and 
+replies with the header followed by 24 bytes: the sum (int64), the sum of 
+squares (uint64), the minimum (int32) and the maximum (int32) of all samples. 
+
+Version 2: several simultaneous clients are accepted. 
+
+Version 3: 
+
+'n' (network analyzer sweep): the address in bytes 5-8 is the base address 
+of an iq module and bytes 3+4 the number n of data words that follow the 
+header: the number of sleep cycles, the number of averages and one value of 
+the frequency register per point (n-2 points). The server sets up the iq 
+module and, for each point, writes the frequency register and waits until 
+the na data registers are valid. It replies with the header followed by the 
+4 na data words of each point (16*(n-2) bytes). A point that did not become 
+valid within 10 ms after the expected acquisition time is transmitted as is, 
+i.e. with the validity bits set. 
 */
  
- /* for now the program is utterly unoptimized... */
- 
 #define _GNU_SOURCE
 
 
@@ -64,224 +97,306 @@ After this, the server will wait for the next command.
 #include <stdlib.h>
 #include <unistd.h>
 #include <string.h>
+#include <time.h>
 #include <errno.h>
 #include <signal.h>
 #include <fcntl.h>
 #include <ctype.h>
+#include <pthread.h>
 #include <sys/types.h>
+#include <sys/stat.h>
 #include <sys/mman.h>
 #include <stdint.h>
 #include <sys/socket.h>
 #include <netinet/in.h>
-
-void error(const char *msg);
+#include <netinet/tcp.h>
 
 #define FATAL do { fprintf(stderr,"Error at line %d, file %s (%d) [%s]\n", __LINE__, __FILE__, errno, strerror(errno)); \
-									error("FATAL ERROR"); exit(1); } while(0)
+									exit(1); } while(0)
  
-//#define MAP_SIZE 4096UL
-//#define MAP_SIZE 65536UL
-#define MAP_SIZE 131072UL
 //allowed address space: 0x40000000 to 0x40800000 has size 0x800000 = 128*65536 = 8388608
-//#define MAP_SIZE 8388608UL
-#define MAP_MASK (MAP_SIZE - 1)
+//it is mapped once at startup and shared by all clients
+#define MEM_BASE 0x40000000UL
+#define MEM_SIZE 8388608UL
 #define MAX_LENGTH 65535
 
 #define DEBUG_MONITOR 0
+#define PROTOCOL_VERSION 3
+#define STATS_LENGTH 24
 
-unsigned long read_value(unsigned long a_addr);
-unsigned long* read_values(unsigned long a_addr, unsigned long* a_values_buffer, unsigned long a_len);
-void write_value(unsigned long a_addr, unsigned long a_value);
-void write_values(unsigned long a_addr, unsigned long* a_values, unsigned long a_len);
+//iq module registers used by the network analyzer sweep
+#define NA_FREQUENCY 0x108
+#define NA_AVERAGES 0x130
+#define NA_SLEEPCYCLES 0x134
+#define NA_DATA 0x140
+#define NA_INVALID 0x80000000u
+#define NA_TIMEOUT_NS 10000000LL
 
 //FPGA memory handlers
-void* map_base = (void*)(-1);
-int fd = -1;
-
-//sockets are globally defined for error handling
-int sockfd;
-int newsockfd;
-
-//open and close memory mapping to FPGA registers
-void open_map_base() {
-    int addr = 0x40000000;
-    if((fd = open("/dev/mem", O_RDWR | O_SYNC)) == -1) FATAL;
-    map_base = mmap(0, MAP_SIZE, PROT_READ | PROT_WRITE, MAP_SHARED, fd, addr & ~MAP_MASK);
-	if(map_base == (void *) -1) FATAL;
-}
+volatile uint32_t* map_base = NULL;
+//serializes all accesses to the FPGA memory
+pthread_mutex_t mem_lock = PTHREAD_MUTEX_INITIALIZER;
+//number of open client connections
+int connections = 0;
+pthread_mutex_t connections_lock = PTHREAD_MUTEX_INITIALIZER;
 
-void close_map_base() {
-	/*if (map_base != (void*)(-1)) {
-		if(munmap(map_base, MAP_SIZE) == -1) FATAL;
-		map_base = (void*)(-1);
+//map the FPGA address space (or a file standing in for it)
+void open_map_base(const char* a_filename) {
+	int fd = -1;
+	off_t offset = 0;
+	struct stat st;
+	if((fd = open(a_filename, O_RDWR | O_SYNC | O_CREAT, 0644)) == -1) FATAL;
+	if (fstat(fd, &st) == -1) FATAL;
+	if (S_ISREG(st.st_mode)) {
+		//a fake memory file must cover the whole address space
+		if (st.st_size < (off_t)MEM_SIZE && ftruncate(fd, MEM_SIZE) == -1) FATAL;
 	}
-	if (fd != -1) {
-		close(fd);
-	}
-	*/;
+	else
+		offset = MEM_BASE;
+	map_base = mmap(0, MEM_SIZE, PROT_READ | PROT_WRITE, MAP_SHARED, fd, offset);
+	if(map_base == MAP_FAILED) FATAL;
+	close(fd); //the mapping stays valid
 }
-/*
+
+//returns the memory location of [a_addr, a_addr + 4*a_len), or NULL if it is not entirely in the FPGA address space
+volatile uint32_t* virtual_address(uint32_t a_addr, uint32_t a_len) {
+	if (a_addr < MEM_BASE || (a_addr & 3) || a_addr - MEM_BASE + 4UL*a_len > MEM_SIZE)
+		return NULL;
+	return map_base + (a_addr - MEM_BASE) / 4;
+}
+
 //basic read and write operations
-unsigned long* read_values(unsigned long a_addr, unsigned long* a_values_buffer, unsigned long a_len) {
-	unsigned long* virt_addr = map_base + (a_addr & MAP_MASK);
-	unsigned long i;
-	printf("address to read %d",(int)a_addr);
-	for (i = 0; i < a_len; i++) {;
+void read_values(uint32_t a_addr, uint32_t* a_values_buffer, uint32_t a_len) {
+	volatile uint32_t* virt_addr = virtual_address(a_addr, a_len);
+	uint32_t i;
+	if (virt_addr == NULL) {
+		memset(a_values_buffer, 0, 4*a_len);
+		return;
+	}
+	pthread_mutex_lock(&mem_lock);
+	for (i = 0; i < a_len; i++)
 		a_values_buffer[i] = virt_addr[i];
+	pthread_mutex_unlock(&mem_lock);
+}
+
+void write_values(uint32_t a_addr, uint32_t* a_values, uint32_t a_len) {
+	volatile uint32_t* virt_addr = virtual_address(a_addr, a_len);
+	uint32_t i;
+	if (virt_addr == NULL)
+		return;
+	pthread_mutex_lock(&mem_lock);
+	for (i = 0; i < a_len; i++)
+		virt_addr[i] = a_values[i];
+	pthread_mutex_unlock(&mem_lock);
+}
+
+// reads the same register a_len times
+void sample_statistics(uint32_t a_addr, uint32_t a_len, int a_bits, char* a_result) {
+	volatile uint32_t* virt_addr = virtual_address(a_addr, 1);
+	uint32_t mask = (a_bits > 0 && a_bits < 32) ? ((1u << a_bits) - 1) : 0xFFFFFFFFu;
+	uint32_t sign = (a_bits > 0 && a_bits < 32) ? (1u << (a_bits - 1)) : 0x80000000u;
+	int64_t sum = 0;
+	uint64_t sumsq = 0;
+	int32_t min = INT32_MAX;
+	int32_t max = INT32_MIN;
+	uint32_t i;
+	if (virt_addr == NULL)
+		min = max = 0;
+	else {
+		pthread_mutex_lock(&mem_lock);
+		for (i = 0; i < a_len; i++) {
+			uint32_t raw = (*virt_addr) & mask;
+			// sign extension from a_bits to 32 bits
+			int32_t value = (int32_t)((int64_t)(raw ^ sign) - (int64_t)sign);
+			sum += value;
+			sumsq += (uint64_t)((int64_t)value * (int64_t)value);
+			if (value < min) min = value;
+			if (value > max) max = value;
+		}
+		pthread_mutex_unlock(&mem_lock);
 	}
-	return a_values_buffer;
+	memcpy(a_result, &sum, 8);
+	memcpy(a_result + 8, &sumsq, 8);
+	memcpy(a_result + 16, &min, 4);
+	memcpy(a_result + 20, &max, 4);
 }
 
-void write_values(unsigned long a_addr, unsigned long* a_values, unsigned long a_len) {
-	void* virt_addr = map_base + (a_addr & MAP_MASK);
-	unsigned long i;
-	for (i = 0; i < a_len; i++) {
-		((unsigned long *) virt_addr)[i] = a_values[i];
+static int64_t elapsed_ns(const struct timespec* a_start) {
+	struct timespec now;
+	clock_gettime(CLOCK_MONOTONIC, &now);
+	return (int64_t)(now.tv_sec - a_start->tv_sec) * 1000000000LL
+		+ (now.tv_nsec - a_start->tv_nsec);
+}
+
+// network analyzer sweep with the iq module at a_addr, a_values holds the
+// sleep cycles, the averages and a_points frequency register values
+void na_sweep(uint32_t a_addr, uint32_t* a_values, uint32_t a_points, uint32_t* a_result) {
+	uint64_t cycles = (uint64_t)a_values[0] + a_values[1];
+	//acquisition time of one point at 125 MHz
+	struct timespec wait = {cycles / 125000000, (cycles % 125000000) * 8};
+	struct timespec start;
+	uint32_t i;
+	uint32_t* data;
+	write_values(a_addr + NA_SLEEPCYCLES, &(a_values[0]), 1);
+	write_values(a_addr + NA_AVERAGES, &(a_values[1]), 1);
+	for (i = 0; i < a_points; i++) {
+		data = &(a_result[4*i]);
+		//writing the frequency starts the acquisition of the point
+		write_values(a_addr + NA_FREQUENCY, &(a_values[2+i]), 1);
+		clock_gettime(CLOCK_MONOTONIC, &start);
+		nanosleep(&wait, NULL);
+		//poll until all 4 data words are valid
+		do
+			read_values(a_addr + NA_DATA, data, 4);
+		while (((data[0] | data[1] | data[2] | data[3]) & NA_INVALID)
+			&& elapsed_ns(&start) < (int64_t)cycles * 8 + NA_TIMEOUT_NS);
 	}
 }
-*/
 
 /* server process and error handling */
 
-void error(const char *msg)
-{
-    perror(msg);
-    close(newsockfd); 
-    close(sockfd);
-	//clean up the memory mapping
-	close_map_base();
-    exit(-1);
+//sends the whole buffer, returns 0 on success
+int send_all(int a_sockfd, const char* a_buffer, size_t a_len) {
+	ssize_t n;
+	while (a_len > 0) {
+		n = send(a_sockfd, a_buffer, a_len, 0);
+		if (n <= 0) return -1;
+		a_buffer += n;
+		a_len -= n;
+	}
+	return 0;
 }
 
-int main(int argc, char *argv[])
-{
-     int portno;
-	 unsigned int data_length;
-	 unsigned long address;
-     socklen_t clilen;
-
-     char data_buffer[8+sizeof(unsigned long)*MAX_LENGTH];
-	 unsigned long * rw_buffer =(unsigned long*)&(data_buffer[8]);
-	 char* buffer = (char*)&(data_buffer[0]);
-     
-     struct sockaddr_in serv_addr, cli_addr;
-     int n;
-     if (argc < 2) {
-         fprintf(stderr,"ERROR, no port provided\n");
-         exit(1);
-     }
-     sockfd = socket(AF_INET, SOCK_STREAM, 0);
-     if (sockfd < 0) 
-        error("ERROR opening socket");
-	int enable = 1;
-	if (setsockopt(sockfd,SOL_SOCKET,SO_REUSEADDR,&enable,sizeof(int))<0)
-		error("setsockopt(SO_REUSEADDR) failed");
-     bzero((char *) &serv_addr, sizeof(serv_addr));
-     portno = atoi(argv[1]);
-     serv_addr.sin_family = AF_INET;
-     serv_addr.sin_addr.s_addr = INADDR_ANY;
-     serv_addr.sin_port = htons(portno);
-     if (bind(sockfd, (struct sockaddr *) &serv_addr,
-              sizeof(serv_addr)) < 0) 
-              error("ERROR on binding");
-     listen(sockfd,5);
-     clilen = sizeof(cli_addr);
-     newsockfd = accept(sockfd, 
-                 (struct sockaddr *) &cli_addr, 
-                 &clilen);
-     if (newsockfd < 0) 
-          error("ERROR on accept");
-	 else
-		 printf("Incoming client connection accepted!");
-	
-	//open_map_base();
-	 //service loop
-     while (0==0) {
-		 //read next header from client
-		 bzero(buffer,8);
-		 n = recv(newsockfd,buffer,8,MSG_WAITALL);
-		 if (n < 0) error("ERROR reading from socket");
-		 if (n != 8) error("ERROR reading from socket - incorrect header length");
-		 //confirm control sequence
-	 ////n=send(newsockfd,buffer,8,0); 
-	 ////if (n != 8) error("ERROR control sequence mirror incorreclty transmitted");
-	     //interpret the header
-    	 address = ((unsigned long*)buffer)[1]; //address to be read/written
-		 data_length = buffer[2]+(buffer[3]<<8); //number of "unsigned long" to be read/written
-		 if (data_length > MAX_LENGTH)
-			 data_length = MAX_LENGTH;
-		 if (data_length == 0)
+//service loop for one client, returns 1 when the client closed the connection with 'c'
+int serve_client(int newsockfd, char* data_buffer) {
+	uint32_t data_length;
+	uint32_t address;
+	uint32_t * rw_buffer =(uint32_t*)&(data_buffer[8]);
+	unsigned char* buffer = (unsigned char*)&(data_buffer[0]);
+	ssize_t n;
+	while (0==0) {
+		//read next header from client
+		n = recv(newsockfd,buffer,8,MSG_WAITALL);
+		if (n != 8) return 0; //connection closed or broken
+		//interpret the header
+		memcpy(&address, &(buffer[4]), 4); //address to be read/written
+		data_length = buffer[2]+(buffer[3]<<8); //number of 32 bit words to be read/written
+		if (buffer[0] == 'v') { //report protocol version
+			buffer[1] = PROTOCOL_VERSION;
+			if (send_all(newsockfd,data_buffer,8)) return 0;
 			continue;
-		 //test for various cases Read, Write, Close
-		 else if (buffer[0] == 'r') { //read from FPGA
+		}
+		if (buffer[0] == 'c') return 1; //close connection
+		if (data_length == 0)
+			continue;
+		//test for various cases Read, Write, Statistics
+		else if (buffer[0] == 'r') { //read from FPGA
 			read_values(address, rw_buffer, data_length);
 			//send the data
-			n = send(newsockfd,(void*)data_buffer,data_length*sizeof(unsigned long)+8,0);
-			if (n < 0) error("ERROR writing to socket");
-			if (n != data_length*sizeof(unsigned long)+8) error("ERROR wrote incorrect number of bytes to socket");
-		 }
-		 else if  (buffer[0] == 'w') { //write to FPGA
+			if (send_all(newsockfd,data_buffer,4*data_length+8)) return 0;
+		}
+		else if  (buffer[0] == 'w') { //write to FPGA
 			//read new data from socket
-			n = recv(newsockfd,(void*)rw_buffer,data_length*sizeof(unsigned long),MSG_WAITALL);
-			if (n < 0) error("ERROR reading from socket");
-			if (n != data_length*sizeof(unsigned long)) error("ERROR read incorrect number of bytes to socket");
+			n = recv(newsockfd,(void*)rw_buffer,4*data_length,MSG_WAITALL);
+			if (n != 4*data_length) return 0;
 			//write FPGA memory
 			write_values(address, rw_buffer, data_length);
-			n=send(newsockfd,buffer,8,0);
-			if (n != 8) error("ERROR control sequence mirror incorreclty transmitted");
-		 }
-		 else if (buffer[0] == 'c') break; //close program
-		 else error("ERROR unknown control character - server and client out of sync"); //if an unknown control sequence is received, terminate for security reasons
-	 }
-	 //close the socket
-     close(newsockfd); 
-	 close(sockfd);
-	 //clean up the memory mapping
-	 close_map_base();
-	 return 0; 
-}
-
-
-// old version with steady reinstantiation of mmap (slow)
-unsigned long* read_values(unsigned long a_addr, unsigned long* a_values_buffer, unsigned long a_len) {
-    int fd = -1;
-    if((fd = open("/dev/mem", O_RDWR | O_SYNC)) == -1) FATAL;
-    map_base = mmap(0, MAP_SIZE, PROT_READ | PROT_WRITE, MAP_SHARED, fd, a_addr & ~MAP_MASK);
-	if(map_base == (void *) -1) FATAL;
-	
-	void* virt_addr = map_base + (a_addr & MAP_MASK);
-	unsigned long i;
-	for (i = 0; i < a_len; i++) {
-		a_values_buffer[i] = ((unsigned long*) virt_addr)[i];
+			if (send_all(newsockfd,data_buffer,8)) return 0;
+		}
+		else if (buffer[0] == 's') { //statistics of repeated register reads
+			sample_statistics(address, data_length, buffer[1], &(data_buffer[8]));
+			if (send_all(newsockfd,data_buffer,STATS_LENGTH+8)) return 0;
+		}
+		else if (buffer[0] == 'n') { //network analyzer sweep
+			char* reply;
+			uint32_t points;
+			if (data_length < 2) return 0; //sleep cycles and averages are required
+			points = data_length - 2;
+			n = recv(newsockfd,(void*)rw_buffer,4*data_length,MSG_WAITALL);
+			if (n != 4*data_length) return 0;
+			reply = malloc(8 + 16*points);
+			if (reply == NULL) return 0;
+			memcpy(reply, data_buffer, 8);
+			na_sweep(address, rw_buffer, points, (uint32_t*)&(reply[8]));
+			n = send_all(newsockfd, reply, 8 + 16*points);
+			free(reply);
+			if (n) return 0;
+		}
+		else { //if an unknown control sequence is received, close the connection for security reasons
+			fprintf(stderr, "ERROR unknown control character - server and client out of sync\n");
+			return 0;
+		}
 	}
+}
 
-	if (map_base != (void*)(-1)) {
-		if(munmap(map_base, MAP_SIZE) == -1) FATAL;
-		map_base = (void*)(-1);
-	}
-	if (fd != -1) {
-		close(fd);
+void* client_thread(void* arg) {
+	int newsockfd = (int)(intptr_t)arg;
+	int enable = 1;
+	int closed = 0;
+	char* data_buffer = malloc(8+4*MAX_LENGTH);
+	//small replies must not wait for more data
+	setsockopt(newsockfd,IPPROTO_TCP,TCP_NODELAY,&enable,sizeof(int));
+	if (data_buffer != NULL) {
+		closed = serve_client(newsockfd, data_buffer);
+		free(data_buffer);
 	}
-	return a_values_buffer;
+	close(newsockfd);
+	if (DEBUG_MONITOR) printf("Client connection closed\n");
+	pthread_mutex_lock(&connections_lock);
+	connections--;
+	if (closed && connections == 0) exit(0); //the last client closed the server
+	pthread_mutex_unlock(&connections_lock);
+	return NULL;
 }
 
-void write_values(unsigned long a_addr, unsigned long* a_values, unsigned long a_len) {
-    int fd = -1;
-    if((fd = open("/dev/mem", O_RDWR | O_SYNC)) == -1) FATAL;
-    map_base = mmap(0, MAP_SIZE, PROT_READ | PROT_WRITE, MAP_SHARED, fd, a_addr & ~MAP_MASK);
-	if(map_base == (void *) -1) FATAL;
-	
-	void* virt_addr = map_base + (a_addr & MAP_MASK);
-	unsigned long i;
-	for (i = 0; i < a_len; i++) {
-				((unsigned long *) virt_addr)[i] = a_values[i];
-	}
-	
-	if (map_base != (void*)(-1)) {
-		if(munmap(map_base, MAP_SIZE) == -1) FATAL;
-		map_base = (void*)(-1);
+int main(int argc, char *argv[])
+{
+	int sockfd, newsockfd;
+	int portno;
+	socklen_t clilen;
+	struct sockaddr_in serv_addr, cli_addr;
+	pthread_t thread;
+	pthread_attr_t attr;
+	if (argc < 2) {
+		fprintf(stderr,"ERROR, no port provided\n");
+		exit(1);
 	}
-	if (fd != -1) {
-		close(fd);
+	//a client that disconnects during a transfer must not terminate the server
+	signal(SIGPIPE, SIG_IGN);
+	open_map_base(argc > 2 ? argv[2] : "/dev/mem");
+	sockfd = socket(AF_INET, SOCK_STREAM, 0);
+	if (sockfd < 0) FATAL;
+	int enable = 1;
+	if (setsockopt(sockfd,SOL_SOCKET,SO_REUSEADDR,&enable,sizeof(int))<0) FATAL;
+	memset((char *) &serv_addr, 0, sizeof(serv_addr));
+	portno = atoi(argv[1]);
+	serv_addr.sin_family = AF_INET;
+	serv_addr.sin_addr.s_addr = INADDR_ANY;
+	serv_addr.sin_port = htons(portno);
+	if (bind(sockfd, (struct sockaddr *) &serv_addr, sizeof(serv_addr)) < 0) FATAL;
+	listen(sockfd,5);
+	pthread_attr_init(&attr);
+	pthread_attr_setdetachstate(&attr, PTHREAD_CREATE_DETACHED);
+	//accept loop, one thread per client
+	while (0==0) {
+		clilen = sizeof(cli_addr);
+		newsockfd = accept(sockfd, (struct sockaddr *) &cli_addr, &clilen);
+		if (newsockfd < 0) {
+			if (errno == EINTR) continue;
+			FATAL;
+		}
+		printf("Incoming client connection accepted!\n");
+		fflush(stdout);
+		pthread_mutex_lock(&connections_lock);
+		connections++;
+		pthread_mutex_unlock(&connections_lock);
+		if (pthread_create(&thread, &attr, client_thread, (void*)(intptr_t)newsockfd) != 0) {
+			fprintf(stderr, "ERROR could not create client thread\n");
+			close(newsockfd);
+			pthread_mutex_lock(&connections_lock);
+			connections--;
+			pthread_mutex_unlock(&connections_lock);
+		}
 	}
+	return 0;
 }
@@ -184,6 +184,7 @@ class RedPitaya(object):
         # memorize whether server is running - nearly obsolete
         self._serverrunning = False
         self.client = None  # client class
+        self.client_pool = None  # connections of the individual modules
         self._slaves = []  # slave interfaces to same redpitaya
         self.modules = OrderedDict()  # all submodules
 
@@ -494,6 +495,9 @@ class RedPitaya(object):
         self._serverrunning = False
 
     def endclient(self):
+        if self.client_pool is not None:
+            self.client_pool.close()
+            self.client_pool = None
         del self.client
         self.client = None
 
@@ -543,8 +547,9 @@ class RedPitaya(object):
     "LICENSE" in the source directory for details.\r\n""")
 
     def startclient(self):
-        self.client = redpitaya_client.MonitorClient(
+        self.client_pool = redpitaya_client.ClientPool(
             self.parameters['hostname'], self.parameters['port'], restartserver=self.restartserver)
+        self.client = self.client_pool.client
         self.makemodules()
         self.logger.debug("Client started successfully. ")
 
@@ -566,6 +571,11 @@ class RedPitaya(object):
             self.makemodule(name, cls)
 
     def make_a_slave(self, port=None, monitor_server_name=None, gui=False):
+        """
+        Creates another RedPitaya interface with its own monitor_server
+        process. Only needed with servers that accept a single client,
+        otherwise each module obtains its own connection from client_pool.
+        """
         if port is None:
             port = self.parameters['port'] + len(self._slaves)*10 + 1
         if monitor_server_name is None:
@@ -18,8 +18,12 @@
 
 
 import numpy as np
+import asyncio
 import socket
+import struct
 import logging
+from collections import OrderedDict, deque
+from contextlib import contextmanager
 try:
     raise  # disable sound output for now
     from pysine import sine  # for debugging read/write calls
@@ -33,8 +37,160 @@ from .pyrpl_utils import time
 # only used for debugging purposes
 CLIENT_NUMBER = 0
 
+# maximum number of request bytes that are sent to the server in one go
+# during a batched transaction. Longer batches are split into several
+# round trips to make sure that neither side blocks on a full socket buffer.
+MAX_BATCH_REQUEST_LENGTH = 16384
 
-class MonitorClient(object):
+# address of a register that can always be read safely (housekeeping id),
+# used to find out which protocol extensions the server supports
+PROBE_ADDRESS = 0x40000000
+
+# servers from this protocol version on accept several simultaneous client
+# connections, which is required for AsyncMonitorClient next to MonitorClient
+MULTI_CLIENT_PROTOCOL_VERSION = 2
+
+# servers from this protocol version on can run network analyzer sweeps on
+# the board, i.e. execute operations ('n', iq_addr, values)
+NA_SWEEP_PROTOCOL_VERSION = 3
+
+# maximum number of points of an na sweep: the request of the command 'n'
+# holds the sleep and averaging cycles in front of the frequencies
+NA_SWEEP_MAX_POINTS = 65535 - 2
+
+# maximum time in seconds that monitor_server waits for an na point beyond
+# its sleep and averaging cycles (NA_TIMEOUT_NS of monitor_server.c)
+NA_SWEEP_POINT_TIMEOUT = 10e-3
+
+# protocol version of pyrpl/monitor_server/monitor_server.c
+PROTOCOL_VERSION = NA_SWEEP_PROTOCOL_VERSION
+
+
+def sample_stats(values, bits=32):
+    """
+    returns the tuple (n, sum, sumsq, min, max) of the register values,
+    interpreted as signed numbers of the given bit width. This is the
+    python equivalent of the 's' command of monitor_server.
+    """
+    values = np.asarray(values, dtype=np.int64) & ((1 << bits) - 1)
+    values -= (values >> (bits - 1)) << bits
+    return (len(values), int(values.sum()), int((values * values).sum()),
+            int(values.min()), int(values.max()))
+
+
+class BaseMonitorClient(object):
+    """
+    encoding and decoding of the monitor_server protocol, shared by the
+    blocking and the asynchronous client
+    """
+    def _header(self, command, addr, length, option=0):
+        return command + bytes(bytearray([option,
+                                          length & 0xFF,
+                                          (length >> 8) & 0xFF,
+                                          addr & 0xFF,
+                                          (addr >> 8) & 0xFF,
+                                          (addr >> 16) & 0xFF,
+                                          (addr >> 24) & 0xFF]))
+
+    def _coalesce(self, operations):
+        """
+        merges consecutive writes to adjacent addresses into one burst.
+        The order of operations is preserved, such that writes to the same
+        register (e.g. a synchronisation pulse) are never merged.
+        """
+        coalesced = []
+        for operation in operations:
+            if operation[0] == 'w' and coalesced and coalesced[-1][0] == 'w':
+                _, addr, values = coalesced[-1]
+                if operation[1] == addr + 4 * len(values) and \
+                        len(values) + len(operation[2]) <= 65535 - 2:
+                    coalesced[-1] = ('w', addr, np.concatenate(
+                        (values, np.asarray(operation[2], dtype=np.uint32))))
+                    continue
+            coalesced.append(operation)
+        return coalesced
+
+    def _split_operations(self, operations):
+        """ splits operations into chunks of limited request length """
+        chunk, chunklength = [], 0
+        for operation in operations:
+            length = 8
+            if operation[0] in ('w', 'n'):
+                length += 4 * len(operation[2])
+            if chunk and chunklength + length > MAX_BATCH_REQUEST_LENGTH:
+                yield chunk
+                chunk, chunklength = [], 0
+            chunk.append(operation)
+            chunklength += length
+        if chunk:
+            yield chunk
+
+    def _encode(self, operations):
+        """
+        returns the request bytes for a list of operations, the expected
+        reply header and data length of each operation and the total
+        length of the reply
+        """
+        request = []
+        headers = []
+        replylength = 0
+        for command, addr, arg in operations:
+            if command == 'r':
+                length = arg
+                if length > 65535:
+                    length = 65535
+                    self.logger.warning("Maximum read-length is %d", length)
+                header = self._header(b'r', addr, length)
+                request.append(header)
+                replylength += 8 + 4 * length
+            elif command == 'w':
+                values = np.asarray(arg, dtype=np.uint32)[:65535 - 2]
+                length = len(values)
+                header = self._header(b'w', addr, length)
+                request += [header, values.tobytes()]
+                replylength += 8
+            elif command == 'n':
+                # sleep cycles, averages and one frequency value per point
+                values = np.asarray(arg, dtype=np.uint32)[:65535]
+                length = len(values)
+                header = self._header(b'n', addr, length)
+                request += [header, values.tobytes()]
+                replylength += 8 + 16 * (length - 2)
+            else:
+                raise ValueError("Unknown operation %s. Allowed are 'r', "
+                                 "'w' and 'n'." % command)
+            headers.append((header, length))
+        return b''.join(request), headers, replylength
+
+    def _decode(self, data, headers):
+        """
+        returns the list of results from the reply data, or None if the
+        transmission is out of sync
+        """
+        results = []
+        offset = 0
+        for header, length in headers:
+            if data[offset:offset + 8] != header:  # in-sync transmission?
+                self.logger.error("Wrong control sequence from server: %s",
+                                  data[offset:offset + 8])
+                return None
+            offset += 8
+            if header[:1] == b'r':
+                results.append(np.frombuffer(data, dtype=np.uint32,
+                                             count=length, offset=offset))
+                offset += 4 * length
+            elif header[:1] == b'n':
+                # the 4 na data words of each point
+                results.append(np.frombuffer(
+                    data, dtype=np.uint32, count=4 * (length - 2),
+                    offset=offset).reshape(-1, 4))
+                offset += 16 * (length - 2)
+            else:
+                results.append(True)
+        return results
+
+
+class MonitorClient(BaseMonitorClient):
     def __init__(self, hostname="192.168.1.0", port=2222, restartserver=None):
         """initiates a client connected to monitor_server
 
@@ -54,6 +210,12 @@ class MonitorClient(object):
         self._port = port
         self._read_counter = 0 # For debugging and unittests
         self._write_counter = 0 # For debugging and unittests
+        self._transaction_counter = 0 # number of network round trips
+        self._batch_level = 0  # nesting depth of batch() contexts
+        self._pending_writes = []  # writes deferred by batch()
+        self._protocol_version = None  # determined upon first use
+        self._siblings = []  # other clients of the same ClientPool
+        self._header_buffer = bytearray(8)  # reused for every read reply
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         # try to connect at least 5 times
         for i in range(5):
@@ -91,57 +253,241 @@ class MonitorClient(object):
         self.close()
         
     # the public methods to use which will recover from connection problems
-    def reads(self, addr, length):
+    def reads(self, addr, length, out=None):
+        """
+        reads length 32 bit words starting at addr. If given, the data is
+        received directly into out, a contiguous numpy array of uint32 with
+        at least length elements, and a view of out is returned.
+        """
         self._read_counter+=1
         if hasattr(self, '_sound_debug') and self._sound_debug:
             sine(440, 0.05)
-        return self.try_n_times(self._reads, addr, length)
+        if self._pending_writes:
+            # deferred writes must reach the board before the read
+            results = self.execute([('r', addr, length)])
+            if results is None:
+                return None
+            if out is None:
+                return results[-1]
+            out[:len(results[-1])] = results[-1]
+            return out[:len(results[-1])]
+        self._flush_siblings()
+        self._transaction_counter += 1
+        return self.try_n_times(self._reads, addr, length, out)
 
     def writes(self, addr, values):
         self._write_counter += 1
         if hasattr(self, '_sound_debug') and self._sound_debug:
             sine(880, 0.05)
+        if self._batch_level > 0:
+            # copy the values since the caller may modify them before flush
+            self._pending_writes.append(
+                ('w', addr, np.array(values, dtype=np.uint32)))
+            return True
+        self._flush_siblings()
+        self._transaction_counter += 1
         return self.try_n_times(self._writes, addr, values)
-    
+
+    def execute(self, operations):
+        """
+        Executes a list of register operations with as few network round
+        trips as possible (usually only one).
+
+        operations: list of tuples ('r', addr, length) or ('w', addr, values)
+        or, if protocol_version >= NA_SWEEP_PROTOCOL_VERSION, ('n', addr,
+        values) for a network analyzer sweep of the iq module at addr (see
+        monitor_server.c)
+
+        Returns a list with one entry per operation: the read data as a
+        numpy array of uint32 for reads, True for writes and an array of
+        shape (points, 4) with the na data words for sweeps. Pending writes
+        from an enclosing batch() are executed before the operations.
+        """
+        operations = self._coalesce(self._pending_writes + list(operations))
+        self._pending_writes = []
+        self._flush_siblings()
+        results = []
+        for chunk in self._split_operations(operations):
+            self._transaction_counter += 1
+            result = self.try_n_times(self._execute, chunk)
+            if result is None:
+                return None
+            results += result
+        return results
+
+    @contextmanager
+    def batch(self):
+        """
+        Context manager that defers all writes until the end of the block
+        or until the next read, such that a sequence of register writes
+        only costs one network round trip::
+
+            with client.batch():
+                client.writes(0x40300000, [1])
+                client.writes(0x40300004, [2])
+            # both writes have been transmitted at this point
+
+        Reads are still executed immediately, together with all writes that
+        precede them, so the order of operations on the board is preserved.
+        Batches can be nested, only the outermost one flushes.
+        """
+        self._batch_level += 1
+        try:
+            yield self
+        finally:
+            self._batch_level -= 1
+            if self._batch_level == 0:
+                self.flush()
+
+    def flush(self):
+        """
+        transmits all writes that have been deferred by batch(), including
+        those of the other clients of the same ClientPool
+        """
+        if self._pending_writes:
+            self.execute([])
+        else:
+            self._flush_siblings()
+
+    def _flush_siblings(self):
+        # writes deferred by another connection to the same board must be
+        # executed before this client transmits anything
+        for client in self._siblings:
+            if client._pending_writes:
+                client.execute([])
+
+    @property
+    def protocol_version(self):
+        """
+        version of the protocol extensions supported by monitor_server.
+        0 means that the server only knows the commands 'r', 'w' and 'c'.
+        """
+        if self._protocol_version is None:
+            version = self.try_n_times(self._get_version)
+            if version is None:
+                return 0  # try again next time
+            if version < PROTOCOL_VERSION:
+                self.logger.warning(
+                    "monitor_server supports protocol version %d instead of "
+                    "%d. The binaries in pyrpl/monitor_server must be rebuilt "
+                    "from monitor_server.c (see the Makefile) to enable all "
+                    "features.", version, PROTOCOL_VERSION)
+            self._protocol_version = version
+        return self._protocol_version
+
+    def stats(self, addr, samples, bits=32):
+        """
+        Reads the register at addr samples times (at most 65535) and returns
+        the tuple (n, sum, sumsq, min, max) of the signed register values
+        with the given bit width.
+
+        If the server supports it, the register is sampled on the board and
+        only the result is transmitted. Otherwise, all samples are read in
+        one pipelined transaction and evaluated in python.
+        """
+        samples = max(1, min(int(samples), 65535))
+        self.flush()
+        if self.protocol_version >= 1:
+            self._transaction_counter += 1
+            result = self.try_n_times(self._stats, addr, samples, bits)
+            if result is not None:
+                return result
+        results = self.execute([('r', addr, 1)] * samples)
+        if results is None:
+            return None
+        return sample_stats(np.concatenate(results), bits)
+
     # the actual code
-    def _reads(self, addr, length):
+    def _recv_into(self, view):
+        """ fills the writable memoryview with data from the socket """
+        received = 0
+        while received < len(view):
+            n = self.socket.recv_into(view[received:])
+            if n == 0:
+                raise socket.error("Connection closed by server")
+            received += n
+
+    def _recv(self, length):
+        """ receives exactly length bytes from the socket """
+        data = bytearray(length)
+        self._recv_into(memoryview(data))
+        return data
+
+    def _get_version(self):
+        # old servers silently skip commands of zero length, therefore the
+        # version request is followed by a read that is always answered
+        version_header = self._header(b'v', 0, 0)
+        read_header = self._header(b'r', PROBE_ADDRESS, 1)
+        self.socket.sendall(version_header + read_header)
+        data = self._recv(8)
+        version = 0
+        if data[:1] == b'v' and data[2:] == version_header[2:]:
+            version = bytearray(data)[1]
+            data = self._recv(8)
+        if data != read_header:
+            self.logger.error("Wrong control sequence from server: %s", data)
+            self.emptybuffer()
+            return None
+        self._recv(4)
+        return version
+
+    def _stats(self, addr, samples, bits):
+        header = self._header(b's', addr, samples, option=bits % 32)
+        self.socket.sendall(header)
+        data = self._recv(8 + 24)
+        if data[:8] != header:  # check for in-sync transmission
+            self.logger.error("Wrong control sequence from server: %s",
+                              data[:8])
+            self.emptybuffer()
+            return None
+        return (samples,) + struct.unpack('<qQii', data[8:])
+
+    def _reads(self, addr, length, out=None):
         if length > 65535:
             length = 65535
             self.logger.warning("Maximum read-length is %d", length)
-        header = b'r' + bytes(bytearray([0,
-                                         length & 0xFF, (length >> 8) & 0xFF,
-                                         addr & 0xFF, (addr >> 8) & 0xFF, (addr >> 16) & 0xFF, (addr >> 24) & 0xFF]))
-        self.socket.send(header)
-        data = self.socket.recv(length * 4 + 8)
-        while (len(data) < length * 4 + 8):
-            data += self.socket.recv(length * 4 - len(data) + 8)
-        if data[:8] == header:  # check for in-sync transmission
-            return np.frombuffer(data[8:], dtype=np.uint32)
-        else:  # error handling
-            self.logger.error("Wrong control sequence from server: %s", data[:8])
+        if out is None:
+            out = np.empty(length, dtype=np.uint32)
+        header = self._header(b'r', addr, length)
+        self.socket.sendall(header)
+        self._recv_into(memoryview(self._header_buffer))
+        if self._header_buffer != header:  # check for in-sync transmission
+            self.logger.error("Wrong control sequence from server: %s",
+                              bytes(self._header_buffer))
             self.emptybuffer()
             return None
+        # the data is received without intermediate bytes objects
+        data = out[:length]
+        self._recv_into(memoryview(data).cast('B'))
+        return data
 
     def _writes(self, addr, values):
         values = values[:65535 - 2]
         length = len(values)
-        header = b'w' + bytes(bytearray([0,
-                                         length & 0xFF,
-                                         (length >> 8) & 0xFF,
-                                         addr & 0xFF,
-                                         (addr >> 8) & 0xFF,
-                                         (addr >> 16) & 0xFF,
-                                         (addr >> 24) & 0xFF]))
+        header = self._header(b'w', addr, length)
         # send header+body
-        self.socket.send(header +
-                         np.array(values, dtype=np.uint32).tobytes())
-        if self.socket.recv(8) == header:  # check for in-sync transmission
+        self.socket.sendall(header +
+                            np.array(values, dtype=np.uint32).tobytes())
+        if self._recv(8) == header:  # check for in-sync transmission
             return True  # indicate successful write
         else:  # error handling
             self.logger.error("Error: wrong control sequence from server")
             self.emptybuffer()
             return None
 
+    def _execute(self, operations):
+        """
+        sends all operations in a single packet and parses all replies.
+        The server processes commands in order, so the replies arrive in
+        the same order as the requests.
+        """
+        request, headers, replylength = self._encode(operations)
+        self.socket.sendall(request)
+        results = self._decode(self._recv(replylength), headers)
+        if results is None:
+            self.emptybuffer()
+        return results
+
     def emptybuffer(self):
         for i in range(100):
             n = len(self.socket.recv(16384))
@@ -149,32 +495,303 @@ class MonitorClient(object):
                 return
             self.logger.debug("Read %d bytes from socket...", n)
 
-    def try_n_times(self, function, addr, value, n=5):
+    def try_n_times(self, function, *args, n=5):
         for i in range(n):
             try:
-                value = function(addr, value)
+                result = function(*args)
             except (socket.timeout, socket.error):
-                self.logger.error("Error occured in reading attempt %s. "
-                                  "Reconnecting at addr %s to %s value %s by "
-                                  "client %s"
+                self.logger.error("Error occured in attempt %s of %s with "
+                                  "arguments %s by client %s. Reconnecting..."
                                   % (i,
-                                     hex(addr),
                                      function.__name__,
-                                     value,
+                                     self._format_args(args),
                                      self.client_number))
                 if self._restartserver is not None:
                     self.restart()
             else:
-                if value is not None:
-                    return value
+                if result is not None:
+                    return result
+
+    def _format_args(self, args):
+        """ formats addresses as hex numbers for logging """
+        formatted = []
+        for arg in args:
+            if isinstance(arg, int):
+                formatted.append(hex(arg))
+            elif isinstance(arg, np.ndarray) and arg.size > 16:
+                formatted.append("<array of %d values>" % arg.size)
+            else:
+                formatted.append(str(arg))
+        return ", ".join(formatted)
 
     def restart(self):
         self.close()
         port = self._restartserver()
+        # an ongoing batch must survive the reconnection
+        batch_level, pending_writes = self._batch_level, self._pending_writes
+        siblings = self._siblings
         self.__init__(
             hostname=self._hostname,
             port=port,
             restartserver=self._restartserver)
+        self._batch_level, self._pending_writes = batch_level, pending_writes
+        self._siblings = siblings
+
+
+class _LoopLock(object):
+    """
+    asyncio.Lock for the coroutines of an explicit event loop. asyncio.Lock
+    looks up the running loop, which pyrpl's LOOP is not, as it is driven
+    by Qt (see async_utils).
+    """
+    def __init__(self, loop):
+        self._loop = loop
+        self._locked = False
+        self._waiters = deque()
+
+    async def __aenter__(self):
+        if not self._locked and all(w.cancelled() for w in self._waiters):
+            self._locked = True
+            return
+        waiter = self._loop.create_future()
+        self._waiters.append(waiter)
+        try:
+            try:
+                await waiter
+            finally:
+                self._waiters.remove(waiter)
+        except asyncio.CancelledError:
+            if not self._locked:
+                self._wake_up_first()
+            raise
+        self._locked = True
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._locked = False
+        self._wake_up_first()
+
+    def _wake_up_first(self):
+        if self._waiters and not self._waiters[0].done():
+            self._waiters[0].set_result(True)
+
+
+class AsyncMonitorClient(BaseMonitorClient):
+    def __init__(self, hostname="192.168.1.0", port=2222, timeout=1.0):
+        """
+        client for monitor_server based on asyncio streams. The coroutines
+        reads_async() and writes_async() do not block the event loop during
+        the transfer, such that several instruments can exchange data with
+        the board at the same time without freezing the gui.
+
+        The connection is opened on the event loop of the first coroutine
+        that uses the client, which is pyrpl's LOOP unless the coroutine
+        runs in another running asyncio loop. Transactions of concurrent
+        coroutines are executed one after the other, each in as few round
+        trips as possible.
+
+        hostname: server address, e.g. "localhost" or "192.168.1.0"
+        port:    the port that the server is running on. 2222 by default
+        timeout: timeout in seconds for connection and transactions
+        """
+        self.logger = logging.getLogger(name=__name__)
+        self._hostname = hostname
+        self._port = port
+        self._timeout = timeout
+        self._reader = None
+        self._writer = None
+        self._lock = None  # serves the coroutines of _loop
+        self._loop = None
+        self._transaction_counter = 0  # number of network round trips
+
+    async def reads_async(self, addr, length):
+        results = await self.execute_async([('r', addr, length)])
+        return None if results is None else results[0]
+
+    async def writes_async(self, addr, values):
+        results = await self.execute_async([('w', addr, values)])
+        return None if results is None else results[0]
+
+    async def execute_async(self, operations, n=5, duration=0.):
+        """
+        coroutine version of :meth:`MonitorClient.execute`: executes a list
+        of operations ('r', addr, length) or ('w', addr, values) and returns
+        the list of results, or None if all n attempts failed.
+
+        duration: maximum time in seconds that the server may need to
+        execute the operations, e.g. for an na sweep, which is added to the
+        timeout of each round trip
+        """
+        loop = self._event_loop()
+        if self._loop is not loop:
+            # the lock and the connection only serve one event loop
+            self._disconnect()
+            self._lock, self._loop = _LoopLock(loop), loop
+        operations = self._coalesce(operations)
+        async with self._lock:
+            for i in range(n):
+                try:
+                    if self._writer is None:
+                        self._reader, self._writer = await self._wait_for(
+                            self._open_connection(), self._timeout)
+                    results = []
+                    for chunk in self._split_operations(operations):
+                        self._transaction_counter += 1
+                        result = await self._wait_for(
+                            self._execute_async(chunk),
+                            self._timeout + duration)
+                        if result is None:
+                            break
+                        results += result
+                    else:
+                        return results
+                except asyncio.CancelledError:
+                    # an interrupted transaction leaves the stream out of sync
+                    self._disconnect()
+                    raise
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError,
+                        OSError) as e:
+                    self.logger.error("Error occured in attempt %s of "
+                                      "execute_async: %s. Reconnecting...",
+                                      i, e)
+                # the stream is out of sync or broken
+                self._disconnect()
+        return None
+
+    @staticmethod
+    def _event_loop():
+        """ the event loop of the calling coroutine """
+        try:
+            return asyncio.get_running_loop()
+        except RuntimeError:  # LOOP is driven by Qt and not running
+            from .async_utils import LOOP
+            return LOOP
+
+    async def _wait_for(self, awaitable, timeout):
+        """ asyncio.wait_for() on _loop """
+        task = asyncio.ensure_future(awaitable, loop=self._loop)
+        expired = []
+
+        def expire():
+            expired.append(True)
+            task.cancel()
+        handle = self._loop.call_later(timeout, expire)
+        try:
+            return await task
+        except asyncio.CancelledError:
+            if expired:
+                raise asyncio.TimeoutError()
+            raise
+        finally:
+            handle.cancel()
+
+    async def _open_connection(self):
+        """ asyncio.open_connection() on _loop """
+        # the address is resolved here, as the executor of qasync's
+        # getaddrinfo() needs a current event loop
+        address = socket.getaddrinfo(self._hostname, self._port,
+                                     type=socket.SOCK_STREAM)[0][4]
+        reader = asyncio.StreamReader(loop=self._loop)
+        protocol = asyncio.StreamReaderProtocol(reader, loop=self._loop)
+        transport, _ = await self._loop.create_connection(
+            lambda: protocol, address[0], address[1])
+        writer = asyncio.StreamWriter(transport, protocol, reader, self._loop)
+        return reader, writer
+
+    async def _execute_async(self, operations):
+        request, headers, replylength = self._encode(operations)
+        self._writer.write(request)
+        await self._writer.drain()
+        # the decoded arrays are writable, as for MonitorClient
+        data = bytearray(await self._reader.readexactly(replylength))
+        return self._decode(data, headers)
+
+    def _disconnect(self):
+        if self._writer is not None:
+            try:
+                self._writer.close()
+            except RuntimeError:  # event loop already closed
+                pass
+        self._reader, self._writer = None, None
+
+    def close(self):
+        if self._writer is not None:
+            try:
+                self._writer.write(self._header(b'c', 0, 0))
+            except (OSError, RuntimeError):
+                pass
+        self._disconnect()
+
+
+class ClientPool(object):
+    def __init__(self, hostname="192.168.1.0", port=2222, restartserver=None):
+        """
+        persistent connections to one monitor_server. Each channel, e.g.
+        'scope' or 'sampler', gets its own connection upon first use, such
+        that a long transfer on one channel does not delay the short
+        transactions of another one. If the server only accepts a single
+        client, all channels share the default connection.
+
+        hostname: server address, e.g. "localhost" or "192.168.1.0"
+        port:    the port that the server is running on. 2222 by default
+        restartserver: a function to call that restarts the server in case
+                       of problems. It is only called by the default
+                       connection, the others merely reconnect.
+        """
+        self._hostname = hostname
+        self._port = port
+        self._restartserver = restartserver
+        self._clients = OrderedDict()
+        self._async_clients = OrderedDict()
+        self.client = MonitorClient(hostname, port,
+                                    restartserver=self._restart)
+
+    @property
+    def multi_client(self):
+        """ whether the server accepts several connections """
+        return self.client.protocol_version >= MULTI_CLIENT_PROTOCOL_VERSION
+
+    def get(self, channel=None):
+        """ returns the MonitorClient for channel (None for default) """
+        if channel is None or not self.multi_client:
+            return self.client
+        if channel not in self._clients:
+            client = MonitorClient(self._hostname, self._port,
+                                   restartserver=self._reconnect)
+            for other in [self.client] + list(self._clients.values()):
+                other._siblings.append(client)
+                client._siblings.append(other)
+            self._clients[channel] = client
+        return self._clients[channel]
+
+    def get_async(self, channel=None):
+        """
+        returns the AsyncMonitorClient for channel, or None if the server
+        only accepts a single client
+        """
+        if not self.multi_client:
+            return None
+        if channel not in self._async_clients:
+            self._async_clients[channel] = AsyncMonitorClient(
+                self._hostname, self._port)
+        return self._async_clients[channel]
+
+    def _restart(self):
+        if self._restartserver is None:
+            return self._port
+        self._port = self._restartserver()
+        for client in self._async_clients.values():
+            client._port = self._port
+        return self._port
+
+    def _reconnect(self):
+        return self._port
+
+    def close(self):
+        for client in list(self._async_clients.values()) + \
+                list(self._clients.values()) + [self.client]:
+            client.close()
+        self._async_clients.clear()
+        self._clients.clear()
 
 
 class DummyClient(object):  # pragma: no cover
@@ -183,6 +800,7 @@ class DummyClient(object):  # pragma: no cover
         def __missing__(self, key):
             return 1 # 0 (1 is needed to avoid division_by_zero errors for some registers)
     fpgamemory = fpgadict({str(0x40100014): 1})  # scope decimation initial value
+    protocol_version = 0
 
     def read_fpgamemory(self, addr):
         # here we implement a fraction of the memory map to simulate the actual redpitaya
@@ -201,13 +819,15 @@ class DummyClient(object):  # pragma: no cover
         # scope control register - trigger armed, trigger source etc.
         if offset == 0:
             return 0
+        if offset == 0x18:  # current write pointer, advances with time
+            decimation = self.fpgamemory[str(0x40100014)]
+            return int(time() * 125e6 / decimation) % 2**14
         if offset == 0x15C:  # current_timestamp lv part
             t = int(time()*125e6)
             return t % (2**32)
         if offset == 0x160:  # current_timestamp mv part
-            return 0
             t = int(time()*125e6)
-            return t - (t % (2**32))
+            return t >> 32
         if offset == 0x164:  # trigger_timestamp lv part
             return 0
         if offset == 0x168:  # trigger_timestamp mv part
@@ -254,15 +874,39 @@ class DummyClient(object):  # pragma: no cover
         # everything else is restored from the dict
         return self.fpgamemory[str(addr)]
 
-    def reads(self, addr, length):
+    def reads(self, addr, length, out=None):
         val = []
         for i in range(length):
             val.append(self.read_fpgamemory(addr+0x4*i))
-        return np.array(val, dtype=np.uint32)
+        if out is None:
+            return np.array(val, dtype=np.uint32)
+        out[:length] = val
+        return out[:length]
     
     def writes(self, addr, values): # pragma: no-cover
         for i, v in enumerate(values):
             self.fpgamemory[str(addr+0x4*i)]=v
+
+    def execute(self, operations):
+        results = []
+        for command, addr, arg in operations:
+            if command == 'r':
+                results.append(self.reads(addr, arg))
+            else:
+                self.writes(addr, arg)
+                results.append(True)
+        return results
+
+    def stats(self, addr, samples, bits=32):
+        return sample_stats([self.read_fpgamemory(addr)
+                             for i in range(samples)], bits)
+
+    @contextmanager
+    def batch(self):
+        yield self
+
+    def flush(self):
+        pass
     
     def restart(self):
         pass
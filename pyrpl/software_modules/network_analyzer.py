@@ -15,6 +15,8 @@ from ..modules import SignalModule
 from ..acquisition_module import AcquisitionModule
 from ..widgets.module_widgets import NaWidget
 from ..hardware_modules.iq import Iq
+from .module_managers import InsufficientResourceError
+from ..redpitaya_client import NA_SWEEP_MAX_POINTS
 
 # timeit.default_timer() is THE precise timer to use (microsecond precise vs
 # milliseconds for time.time()). see
@@ -70,6 +72,36 @@ class LogScaleProperty(BoolProperty):
         module._signal_launcher.x_log_toggled.emit()
 
 
+class NaSweepPlan(object):
+    """
+    Everything the network analyzer needs to know about the points of a
+    trace: frequencies, resolution bandwidths, transfer function correction
+    factors and output amplitude. The plan is computed once per setup, such
+    that acquiring a point merely indexes into its arrays. The sleep and
+    averaging cycles are derived from the bandwidth that is read back from
+    the iq module whenever the bandwidth changes.
+    """
+    def __init__(self, na):
+        self.frequencies = na._get_frequencies()
+        if na.auto_bandwidth:
+            bandwidths = na._auto_bandwidths(self.frequencies)
+        else:
+            bandwidths = np.full(len(self.frequencies), float(na.rbw))
+        # bandwidths as they end up in the register
+        register = na.iq.__class__.bandwidth
+        values, indices = np.unique(bandwidths, return_inverse=True)
+        self.bandwidths = np.array(
+            [float(register.validate_and_normalize(na.iq, value))
+             for value in values])[indices]
+        self.tf_values = na.transfer_function(self.frequencies)
+        # amplitude as it ends up in the register (start value if
+        # auto_amplitude is on)
+        register = na.iq.__class__.amplitude
+        amplitude = register.validate_and_normalize(na.iq, na.amplitude)
+        self.amplitude = register.to_python(
+            na.iq, register.from_python(na.iq, amplitude))
+
+
 class NetworkAnalyzer(AcquisitionModule, SignalModule):
     """
     Using an IQ module, the network analyzer can measure the complex coherent
@@ -94,6 +126,7 @@ class NetworkAnalyzer(AcquisitionModule, SignalModule):
         na.start_freq = 2e4
         na.stop_freq = 5e5
 
+        na.parallel_iqs = 3                           # measures 3 interleaved sub-sweeps at once with 3 iq modules
         na.auto_bandwidth = True                      # adapts the resolution bandwidth so that the q=rbw/frequency ratio stays constant 
         na.q_factor_min = q_factor_min                # min value of the q=rbw/frequency ratio
         na.rbw = rbw                                  # Starting resolution bandwidth value 
@@ -120,6 +153,7 @@ class NetworkAnalyzer(AcquisitionModule, SignalModule):
                        "stop_freq",
                        "rbw",
                        "average_per_point",
+                       "parallel_iqs",
                        "points",
                        "amplitude",
                        "logscale",
@@ -167,6 +201,16 @@ class NetworkAnalyzer(AcquisitionModule, SignalModule):
     stop_freq = FrequencyProperty(default=1e6, call_setup=True, min=Iq.frequency.increment)
     rbw = RbwAttribute(default=500.0, call_setup=True)
     average_per_point = IntProperty(min=1, default=1, call_setup=True)
+    parallel_iqs = IntProperty(min=1, max=3, default=1, call_setup=True,
+                               doc="number of iq modules that measure "
+                                   "interleaved sub-sweeps at the same "
+                                   "time, each with its own output tone, "
+                                   "such that the tones are about "
+                                   "span/parallel_iqs apart. Only used if "
+                                   "enough iq modules are free, neither "
+                                   "auto_bandwidth nor auto_amplitude is "
+                                   "on and the sum of the amplitudes does "
+                                   "not exceed 1.")
     amplitude = NaAmplitudeProperty(default=0.1,
                                     min=0,
                                     max=1,
@@ -184,6 +228,11 @@ class NetworkAnalyzer(AcquisitionModule, SignalModule):
         self._current_bandwidth = -1
         self.measured_time_per_point = np.nan
         self.amplitude_list = None
+        self._iq_amplitude = 0  # cached iq amplitude
+        self._pipelined_point = None  # point started by the previous readout
+        self._sweep_plan = None  # computed from the setup attributes
+        self._extra_iqs = []  # further iq modules of a parallel sweep
+        self._parallel_stride = None  # length of the parallel sub-sweeps
         #self._data_x = None
         super(NetworkAnalyzer, self).__init__(parent, name=name)
 
@@ -216,10 +265,6 @@ class NetworkAnalyzer(AcquisitionModule, SignalModule):
     def inputs(self):
         return self.iq.inputs
 
-    def _time_per_point(self):
-        return float(self.iq._na_sleepcycles + self.iq._na_averages) \
-               / (125e6 * self.iq._frequency_correction)
-
     def signal(self):
         return self.iq.signal()
 
@@ -301,6 +346,9 @@ class NetworkAnalyzer(AcquisitionModule, SignalModule):
     MIN_DELAY_SINGLE_MS = 0
     MIN_DELAY_CONTINUOUS_MS = 0
     # na should be as fast as possible
+    # duration of the points measured by the board per round trip if
+    # monitor_server supports na sweeps, such that the gui stays responsive
+    BOARD_SWEEP_CHUNK_DURATION = 0.1
 
     def is_zero_span(self):
         """
@@ -308,40 +356,67 @@ class NetworkAnalyzer(AcquisitionModule, SignalModule):
         """
         return self.start_freq==self.stop_freq
 
+    def _set_amplitude(self, amplitude):
+        """
+        Sets the iq amplitude and caches the value that ends up in the
+        register, such that it does not need to be read for every point.
+        """
+        register = self.iq.__class__.amplitude
+        amplitude = register.validate_and_normalize(self.iq, amplitude)
+        for iq in [self.iq] + self._extra_iqs:
+            register.set_value(iq, amplitude)
+            register.value_updated(iq, amplitude)
+        self._iq_amplitude = register.to_python(
+            self.iq, register.from_python(self.iq, amplitude))
+
     async def _ramp_iq_amp_async(self, new_val):
-        amp_start = self.iq.amplitude
+        amp_start = self._iq_amplitude
         for amp in np.linspace(amp_start, new_val, 30):
-            self.iq.amplitude = amp
+            self._set_amplitude(amp)
             await sleep_async(0.01)
 
+    def _point_frequency(self, index):
+        # in zero span, all frequencies are start_freq
+        return self.sweep_plan.frequencies[index]
+
+    def _can_pipeline(self, index):
+        """
+        True if point index can be started in the same transaction that
+        reads the previous point, i.e. if nothing but the frequency changes.
+        """
+        if index >= self.points or self.auto_amplitude:
+            # auto_amplitude needs the previous point to choose the amplitude
+            return False
+        return self.sweep_plan.bandwidths[index] == self._current_bandwidth
+
+    def _set_na_cycles(self):
+        """
+        Reads back the bandwidth of the iq module and writes the
+        corresponding sleep and averaging cycles.
+        """
+        self._current_bandwidth = self.iq.bandwidth[0]
+        cycles = 125e6 / self._current_bandwidth
+        self._cached_na_sleepcycles = int(np.round(cycles * self.sleeptimes))
+        self.iq._na_sleepcycles = self._cached_na_sleepcycles
+        self._cached_na_averages = int(np.round(cycles *
+                                                self.average_per_point))
+        self.iq._na_averages = self._cached_na_averages
+        # time_per_point is calculated at setup for speed reasons
+        self.time_per_point = float(self._cached_na_sleepcycles +
+                                    self._cached_na_averages) \
+            / (125e6 * self.iq._frequency_correction)
 
     async def _start_point_acquisition(self, index):
-        if self.is_zero_span():
-            # in zero span, data_x are time, not frequency
-            frequency = self.start_freq
-        else:
-            # normal frequency sweep, get frequency from data_x-array
-            frequency = self.frequencies[index]
-        if self.auto_bandwidth: # RBW should be updated if needed
-            if self.auto_rbw_value(frequency) > self._current_bandwidth + 0.001: # avoid rounding problems
-                self._current_bandwidth*=2
-                self.iq.bandwidth = [self._current_bandwidth, self._current_bandwidth]
-
-                new_sleep_cycles = int(
-                    np.round(125e6 / self._current_bandwidth * self.sleeptimes))
-                self.iq._na_sleepcycles = new_sleep_cycles
-                new_na_averages = int(np.round(125e6 / self._current_bandwidth *
-                                                       self.average_per_point))
-                self.iq._na_averages = new_na_averages
-                self._cached_na_averages = new_na_averages
-
-                self.time_per_point = float(new_sleep_cycles + new_na_averages) \
-                                            / (125e6 * self.iq._frequency_correction)
+        frequency = self._point_frequency(index)
+        bandwidth = self.sweep_plan.bandwidths[index]
+        if bandwidth != self._current_bandwidth:  # only with auto_bandwidth
+            self.iq.bandwidth = [bandwidth, bandwidth]
+            self._set_na_cycles()
         if self.auto_amplitude:
             if self.current_avg==0: # need to determine next amp
                 if index<=self.AUTO_AMP_AVG: # use user-defined amplitude
-                    self.iq.amplitude = self.amplitude
-                    self.amplitude_list[index] = self.iq.amplitude
+                    self._set_amplitude(self.amplitude)
+                    self.amplitude_list[index] = self._iq_amplitude
                 else:
                     last_ratio = np.abs(np.mean(self.data_avg[index - self.AUTO_AMP_AVG:index]))
                     target_v = 10**(self.target_dbv/20)
@@ -349,14 +424,14 @@ class NetworkAnalyzer(AcquisitionModule, SignalModule):
                     last_amp = self.amplitude_list[index - 1]
                     if next_amp/last_amp>2:
                         if last_amp*2 <= self.auto_amp_max:
-                            await self._ramp_iq_amp_async(self.iq.amplitude*2)
-                            self.amplitude_list[index] = self.iq.amplitude
+                            await self._ramp_iq_amp_async(self._iq_amplitude*2)
+                            self.amplitude_list[index] = self._iq_amplitude
                         else:
                             self.amplitude_list[index] = last_amp
                     elif next_amp/last_amp<0.5:
                         if last_amp/2 >= self.auto_amp_min:
-                            await self._ramp_iq_amp_async(self.iq.amplitude/2)
-                            self.amplitude_list[index] = self.iq.amplitude
+                            await self._ramp_iq_amp_async(self._iq_amplitude/2)
+                            self.amplitude_list[index] = self._iq_amplitude
                         else:
                             self.amplitude_list[index] = last_amp
                     else:
@@ -375,6 +450,9 @@ class NetworkAnalyzer(AcquisitionModule, SignalModule):
         #    self.amplitude_list[inde]
 
         self.iq.frequency = frequency
+        self._point_started(frequency)
+
+    def _point_started(self, frequency):
         self._time_last_point = timeit.default_timer()
         # regular print output for travis workaround
         #self._logger.debug("Acquiring first NA point at frequency %.1f Hz..", frequency)
@@ -392,15 +470,46 @@ class NetworkAnalyzer(AcquisitionModule, SignalModule):
                       "delay of %f" % (self._lastpointnumber, frequency, delay))
                 self._lastprinttime = self._time_last_point
 
-    def _get_point(self, index):
+    async def _read_point_async(self, index):
+        """
+        Returns the na data sum of point index. If possible, the next point
+        is started in the same transaction, right after the readout.
+        """
+        self._pipelined_point = None
+        if not self._can_pipeline(index + 1):
+            return self.iq._nadata_total
+        register = self.iq.__class__.frequency
+        frequency = self._point_frequency(index + 1)
+        data, _ = self.iq._execute([
+            ('r', 0x140, 4),
+            ('w', register.address, [register.from_python(self.iq,
+                                                          frequency)])])
+        if not self.iq._nadata_ready(data):
+            # the next point was started too early, measure this one again
+            self._logger.warning('NA data not ready yet. Try again!')
+            self.iq.frequency = self._point_frequency(index)
+            await sleep_async(self.time_per_point)
+            return self.iq._nadata_total
+        register.value_updated(self.iq, frequency)
+        self._point_started(frequency)
+        self._pipelined_point = index + 1
+        return self.iq._nadata_sum(data)
+
+    async def _get_point_async(self, index):
         # get the actual point's (discretized)
         # frequency
-        # only one read operation per point
-        y = self.iq._nadata_total / self._cached_na_averages
+        # only one read operation per point, which also starts the next point
+        return self._normalize_point(index,
+                                     await self._read_point_async(index))
+
+    def _normalize_point(self, index, total):
+        """ Returns the normalized data and the amplitude of point index
+        from the na data sum total. """
+        y = total / self._cached_na_averages
 
-        tf = self._tf_values[index]
+        tf = self.sweep_plan.tf_values[index]
 
-        amp = self.iq.amplitude  # get amplitude for normalization
+        amp = self._iq_amplitude  # cached amplitude for normalization
         if amp == 0:  # normalize immediately
             y *= self._rescale  # avoid division by zero
         else:
@@ -427,11 +536,35 @@ class NetworkAnalyzer(AcquisitionModule, SignalModule):
     def auto_rbw_value(self, freq):
         """
         if freq/q is smaller than rbw, use it instead.
-        Also, round to the smallest non-zero rbw
+        Also, round to the smallest non-zero rbw. freq may be an array.
         """
-        desired_val = min(max(freq / self.q_factor_min, 1.186), self.rbw)
-        valid_bws = self.iq.bandwidth_options
-        return valid_bws[np.argmin(np.abs(np.array(valid_bws) - desired_val))]
+        desired_val = np.minimum(np.maximum(np.asarray(freq, dtype=float)
+                                            / self.q_factor_min, 1.186),
+                                 self.rbw)
+        valid_bws = np.unique(self.iq.bandwidth_options)  # sorted
+        # nearest valid bandwidth, the smaller one in case of a tie
+        right = np.clip(np.searchsorted(valid_bws, desired_val),
+                        1, len(valid_bws) - 1)
+        left = valid_bws[right - 1]
+        right = valid_bws[right]
+        value = np.where(desired_val - left <= right - desired_val,
+                         left, right)
+        return value if np.ndim(value) else float(value)
+
+    def _auto_bandwidths(self, frequencies):
+        """
+        Returns the bandwidth for each point of a sweep over frequencies
+        with auto_bandwidth: the bandwidth starts at the auto_rbw_value of
+        the first point and is doubled whenever a point requires more.
+        """
+        auto_values = self.auto_rbw_value(frequencies)
+        bandwidths = np.empty(len(auto_values))
+        current = auto_values[0]
+        for index, value in enumerate(auto_values):
+            if value > current + 0.001:  # avoid rounding problems
+                current *= 2
+            bandwidths[index] = current
+        return bandwidths
 
     def _start_trace_acquisition(self):
         """
@@ -445,13 +578,12 @@ class NetworkAnalyzer(AcquisitionModule, SignalModule):
 #        x = self._data_x if not self.is_zero_span() else  \
 #                                        self.start_freq*np.ones(self.points)
 
-        self.iq.amplitude = 0 # Set the amplitude at 0 before anything else to avoid glitch
-        if self.auto_bandwidth:
-            self._current_bandwidth = self.auto_rbw_value(self.frequencies[0]) # smallest non-zero bandwidth
-        else:
-            self._current_bandwidth = self.rbw
+        self._set_amplitude(0) # Set the amplitude at 0 before anything else to avoid glitch
+        self._pipelined_point = None
+        plan = self.sweep_plan
+        self._current_bandwidth = plan.bandwidths[0]
 
-        self.iq.setup(frequency=self.frequencies[0],
+        self.iq.setup(frequency=plan.frequencies[0],
                       bandwidth=[self._current_bandwidth, self._current_bandwidth],
                       gain=0,
                       phase=0,
@@ -459,31 +591,23 @@ class NetworkAnalyzer(AcquisitionModule, SignalModule):
                       input=self.input,
                       output_direct=self.output_direct,
                       output_signal='output_direct')
-        self._current_bandwidth = self.iq.bandwidth[0]
 
         # setup averaging
-        self.iq._na_averages = int(np.round(125e6 / self._current_bandwidth *
-                                               self.average_per_point))
-        self._cached_na_averages = self.iq._na_averages
-        self.iq._na_sleepcycles = int(
-            np.round(125e6 / self._current_bandwidth * self.sleeptimes))
-        # time_per_point is calculated at setup for speed reasons
-        self.time_per_point = self._time_per_point()
+        self._set_na_cycles()
+        self._setup_parallel_iqs()
         self._time_first_point = None # for 0-span mode, we need to record
         # times
         # compute rescaling factor of raw data
         # 4 is artefact of fpga code
         self._rescale = 2.0 ** (-self.iq._LPFBITS) * 4.0
         # to avoid reading it at every single point
-        self.iq.frequency = self.frequencies[0]  # this triggers the NA acquisition
-        self.iq.amplitude = self.amplitude  # Set the amplitude to non-zero at the last moment to avoid glitch
+        self.iq.frequency = plan.frequencies[0]  # this triggers the NA acquisition
+        self._set_amplitude(plan.amplitude)  # Set the amplitude to non-zero at the last moment to avoid glitch
         if self.auto_amplitude:
             self.amplitude_list = np.zeros(self.points)
         else:
-            self.amplitude_list = self.iq.amplitude
+            self.amplitude_list = self._iq_amplitude
         self._time_last_point = timeit.default_timer()
-        # pre-calculate transfer_function values for speed
-        self._tf_values = self.transfer_function(self.frequencies)
         self.iq.on = True
         # Warn the user if time_per_point is too small:
         # < 1 ms measurement time will make acquisition inefficient.
@@ -498,7 +622,7 @@ class NetworkAnalyzer(AcquisitionModule, SignalModule):
         """
         Stop the iq.
         """
-        self.iq.amplitude = 0
+        self._set_amplitude(0)
 
     def _data_ready(self):
         return self._remaining_time()<=0
@@ -506,36 +630,263 @@ class NetworkAnalyzer(AcquisitionModule, SignalModule):
     async def _point_async(self, index, min_delay_ms):
         if self.running_state == 'paused':
             await self._resume_event.wait()
-        await self._start_point_acquisition(index)
+        if self._pipelined_point != index:
+            await self._start_point_acquisition(index)
+        await self._data_ready_async(min_delay_ms)
+        return await self._get_point_async(index)
+
+    def _board_sweep_allowed(self):
+        """
+        True if the next points can be measured by monitor_server on the
+        board, i.e. if only the frequency changes from point to point.
+        """
+        return self.current_point > 0 \
+            and not self.auto_amplitude \
+            and not self.auto_bandwidth \
+            and not self.is_zero_span() \
+            and self._parallel_stride is None \
+            and self.time_per_point < self.BOARD_SWEEP_CHUNK_DURATION \
+            and self.iq._na_sweep_available
+
+    async def _board_sweep_async(self):
+        """
+        Measures the next points of the trace in a single round trip with
+        the sweep executor of monitor_server and returns the number of
+        points.
+        """
+        start = self.current_point
+        count = min(self.points - start,
+                    int(self.BOARD_SWEEP_CHUNK_DURATION / self.time_per_point),
+                    NA_SWEEP_MAX_POINTS)
+        # the sweep leaves the iq at the last frequency of the chunk
+        self._pipelined_point = None
+        data = await self.iq._na_sweep_async(
+            self.frequencies[start:start + count],
+            self._cached_na_sleepcycles, self._cached_na_averages)
+        self._point_started(self.frequencies[start + count - 1])
+        for index in range(start, start + count):
+            if self.iq._nadata_ready(data[index - start]):
+                y, amp = self._normalize_point(
+                    index, self.iq._nadata_sum(data[index - start]))
+            else:  # timeout on the board, measure the point again
+                self._logger.warning('NA data not ready yet. Try again!')
+                y, amp = await self._point_async(index, 0)
+            self._add_point(y)
+        return count
+
+    def _parallel_allowed(self):
+        """
+        True if the points can be measured with several iq modules, i.e. if
+        only the frequency changes from point to point and the input signal
+        carries the output tones of all iq modules.
+        """
+        return self.parallel_iqs > 1 \
+            and not self.auto_amplitude \
+            and not self.auto_bandwidth \
+            and not self.is_zero_span() \
+            and self.iq.input not in self.pyrpl.iqs.hardware_module_names
+
+    def _setup_parallel_iqs(self):
+        """
+        Reserves the additional iq modules of a parallel sweep and configures
+        them like the na's iq module, with zero amplitude. At the start of a
+        trace, the sweep is divided into one sub-sweep per iq module.
+        """
+        wanted = self.parallel_iqs - 1 if self._parallel_allowed() else 0
+        amplitude = self.sweep_plan.amplitude
+        if amplitude > 0 and (wanted + 1) * amplitude > 1:
+            # the tones of all iq modules add up on output_direct
+            wanted = max(int(1. / amplitude) - 1, 0)
+            self._logger.warning("Only %d iq modules can measure in "
+                                 "parallel with an amplitude of %.3f V "
+                                 "without saturating the output.",
+                                 wanted + 1, amplitude)
+        if self.current_point > 0:
+            # the sub-sweeps of the running trace are kept
+            wanted = 0 if self._parallel_stride is None else \
+                min(wanted, self._parallel_sweeps() - 1)
+        while len(self._extra_iqs) > wanted:
+            self.pyrpl.iqs.free(self._extra_iqs.pop())
+        while len(self._extra_iqs) < wanted:
+            try:
+                self._extra_iqs.append(self.pyrpl.iqs.pop(owner=self.name))
+            except InsufficientResourceError:
+                self._logger.warning("Only %d iq modules are available for "
+                                     "the parallel sweep.",
+                                     len(self._extra_iqs) + 1)
+                break
+        if self.current_point == 0:
+            self._parallel_stride = -(-self.points //
+                                      (len(self._extra_iqs) + 1)) \
+                if self._extra_iqs else None
+        if not self._extra_iqs:
+            return
+        for iq in self._extra_iqs:
+            iq.setup(frequency=self.sweep_plan.frequencies[0],
+                     bandwidth=[self._current_bandwidth,
+                                self._current_bandwidth],
+                     gain=0,
+                     phase=0,
+                     amplitude=0,
+                     acbandwidth=self.acbandwidth,
+                     input=self.iq.input,
+                     output_direct=self.output_direct,
+                     output_signal='output_direct')
+            iq._na_sleepcycles = self._cached_na_sleepcycles
+            iq._na_averages = self._cached_na_averages
+            iq.on = True
+        frequencies = self.sweep_plan.frequencies
+        stride = self._parallel_stride
+        spacing = np.min(np.abs(frequencies[stride:] - frequencies[:-stride])) \
+            if stride < self.points else np.inf
+        if spacing < 10 * self._current_bandwidth:
+            self._logger.warning("Frequency spacing of %.1f Hz between "
+                                 "simultaneous points is not much larger "
+                                 "than the bandwidth of %.1f Hz. The output "
+                                 "tones of the parallel sweep may disturb "
+                                 "each other.", spacing,
+                                 self._current_bandwidth)
+
+    def _free_parallel_iqs(self):
+        while self._extra_iqs:
+            self.pyrpl.iqs.free(self._extra_iqs.pop())
+
+    def _parallel_sweeps(self):
+        """ number of sub-sweeps of the parallel sweep """
+        return -(-self.points // self._parallel_stride)
+
+    def _parallel_indices(self, position, count):
+        """
+        Returns the indices of at most count points that are measured at
+        the same time from position on, where position counts the points
+        of the trace in the order of the parallel sweep. The points
+        i + k * _parallel_stride of all sub-sweeps k are measured together.
+        """
+        stride = self._parallel_stride
+        sweeps = self._parallel_sweeps()
+        # number of steps with a point in every sub-sweep, the last
+        # sub-sweep may be shorter
+        full = self.points - (sweeps - 1) * stride
+        if position < sweeps * full:
+            step, offset = divmod(position, sweeps)
+        else:
+            step, offset = divmod(position - sweeps * full, sweeps - 1)
+            step += full
+        return [index for index in range(step + offset * stride, self.points,
+                                          stride)][:count]
+
+    def _frequency_writes(self, iqs, indices):
+        """ operations that start the points indices on iqs """
+        register = self.iq.__class__.frequency
+        return [(iq, 'w', register.address,
+                 [register.from_python(iq, self._point_frequency(index))])
+                for index, iq in zip(indices, iqs)]
+
+    def _start_parallel_points(self, iqs, indices):
+        self.iq._execute_modules(self._frequency_writes(iqs, indices))
+        register = self.iq.__class__.frequency
+        for index, iq in zip(indices, iqs):
+            register.value_updated(iq, self._point_frequency(index))
+        self._point_started(self._point_frequency(indices[0]))
+
+    async def _read_parallel_points_async(self, iqs, start, indices):
+        """
+        Returns the na data sums of the points indices measured by iqs from
+        position start of the parallel sweep on. If possible, the next
+        points are started in the same transaction, right after the
+        readout.
+        """
+        self._pipelined_point = None
+        next_start = start + len(indices)
+        operations = [(iq, 'r', 0x140, 4) for iq in iqs]
+        pipeline = self._can_pipeline(next_start)
+        if pipeline:
+            next_indices = self._parallel_indices(next_start, len(iqs))
+            operations += self._frequency_writes(iqs, next_indices)
+        data = self.iq._execute_modules(operations)[:len(iqs)]
+        if not all(self.iq._nadata_ready(d) for d in data):
+            # the next points were started too early, measure these again
+            self._logger.warning('NA data not ready yet. Try again!')
+            self._start_parallel_points(iqs, indices)
+            await sleep_async(self.time_per_point)
+            return [iq._nadata_total for iq in iqs]
+        if pipeline:
+            register = self.iq.__class__.frequency
+            for index, iq in zip(next_indices, iqs):
+                register.value_updated(iq, self._point_frequency(index))
+            self._point_started(self._point_frequency(next_indices[0]))
+            self._pipelined_point = next_start
+        return [self.iq._nadata_sum(d) for d in data]
+
+    async def _parallel_points_async(self, min_delay_ms):
+        """
+        Measures the next points of the sub-sweeps at the same time with the
+        iq modules of a parallel sweep and returns the number of points.
+        """
+        start = self.current_point
+        indices = self._parallel_indices(start, len(self._extra_iqs) + 1)
+        while len(self._extra_iqs) >= len(indices):
+            # the sub-sweep of this iq module is finished
+            iq = self._extra_iqs.pop()
+            iq.amplitude = 0
+            self.pyrpl.iqs.free(iq)
+        iqs = [self.iq] + self._extra_iqs
+        if self._pipelined_point != start:
+            self._start_parallel_points(iqs, indices)
         await self._data_ready_async(min_delay_ms)
-        return self._get_point(index)
+        totals = await self._read_parallel_points_async(iqs, start, indices)
+        for index, total in zip(indices, totals):
+            y, amp = self._normalize_point(index, total)
+            self._add_point(y, index)
+        return len(indices)
+
+    def _add_point(self, y, index=None):
+        """
+        Adds the normalized data y of point index (by default the current
+        point) to the trace
+        """
+        if index is None:
+            index = self.current_point
+        if self.is_zero_span():
+            now = timeit.default_timer()
+            if self._time_first_point is None:
+                self._time_first_point = now
+            self.data_x[self.current_point] = now - self._time_first_point
+
+        self._emit_signal_by_name("update_point", self.current_point)
+
+        self.data_avg[index] = (self.data_avg[index]*(self.current_avg) \
+                             + y)/(self.current_avg + 1)
+        self.current_point+=1
 
     async def _trace_async(self, min_delay_ms):
         if self.current_point==0:
             self._start_trace_acquisition()
         else:
-            self.iq.amplitude = self.amplitude # go from pause to resume
+            self._setup_parallel_iqs()
+            self._set_amplitude(self.amplitude) # go from pause to resume
+            self._pipelined_point = None
+        points = 1  # number of points measured in the last iteration
         while (self.current_point<self.points):
             if self._last_time_benchmark is not None:
                 new_time = timeit.default_timer()
                 self.measured_time_per_point = \
-                    new_time - self._last_time_benchmark
+                    (new_time - self._last_time_benchmark) / points
             self._last_time_benchmark = timeit.default_timer()
             if self.running_state in ["paused_continuous", "paused_single"]:
                 await self._resume_event.wait()
-                self.iq.amplitude = self.amplitude
+                self._setup_parallel_iqs()
+                self._set_amplitude(self.amplitude)
+                self._pipelined_point = None
+            if self._board_sweep_allowed():
+                points = await self._board_sweep_async()
+                continue
+            if self._parallel_stride is not None:
+                points = await self._parallel_points_async(min_delay_ms)
+                continue
+            points = 1
             y, amp = await self._point_async(self.current_point, min_delay_ms)
-            if self.is_zero_span():
-                now = timeit.default_timer()
-                if self._time_first_point is None:
-                    self._time_first_point = now
-                self.data_x[self.current_point] = now - self._time_first_point
-
-            self._emit_signal_by_name("update_point", self.current_point)
-
-            self.data_avg[self.current_point] = (self.data_avg[self.current_point]*(self.current_avg) \
-                                 + y)/(self.current_avg + 1)
-            self.current_point+=1
+            self._add_point(y)
         self.current_avg = min(self.current_avg + 1, self.trace_average)
         self._emit_signal_by_name("scan_finished")
         self.current_point = 0
@@ -565,23 +916,27 @@ class NetworkAnalyzer(AcquisitionModule, SignalModule):
         await self._do_average_continuous_async()
 
 
+    @property
+    def sweep_plan(self):
+        """
+        NaSweepPlan with the precalculated settings of all points, updated
+        upon the next use after a change of the setup attributes.
+        """
+        if self._sweep_plan is None:
+            self._sweep_plan = NaSweepPlan(self)
+        return self._sweep_plan
+
     @property
     def frequencies(self):
         """
-        Since calculating frequency (normalized to fit in the hardware) might
-        be long, we cash the result.
+        Frequencies of the points (normalized to fit in the hardware).
         """
-        if self._frequencies is None:
-            self._frequencies = self._get_frequencies()
-        return self._frequencies
+        return self.sweep_plan.frequencies
 
     def _get_frequencies(self):
         if self.is_zero_span():
-            return self.iq.__class__.frequency.validate_and_normalize(self,
-                                                self.start_freq)*np.ones(
-                                                                self.points)
-
-        if self.logscale:
+            raw_values = self.start_freq * np.ones(self.points)
+        elif self.logscale:
             raw_values = np.logspace(
                 np.log10(self.start_freq),
                 np.log10(self.stop_freq),
@@ -592,11 +947,12 @@ class NetworkAnalyzer(AcquisitionModule, SignalModule):
                                self.stop_freq,
                                self.points,
                                endpoint=True)
-        values = np.zeros(len(raw_values))
-        for index, val in enumerate(raw_values):
-            values[index] = self.iq.__class__.frequency. \
-                validate_and_normalize(self, val)  # retrieve the real freqs...
-        return values
+        # retrieve the real freqs, i.e. validate_and_normalize of the
+        # frequency register for all values at once
+        register = self.iq.__class__.frequency
+        values = np.round(raw_values / register.increment) \
+            * register.increment
+        return np.clip(values, register.min, register.max)
 
     def _remaining_time(self):
         """Remaining time in seconds until current point is ready"""
@@ -627,13 +983,15 @@ class NetworkAnalyzer(AcquisitionModule, SignalModule):
 
     def _setup(self):
         #self._update_data_x()  # precalculate frequency values
-        self._frequencies = None # forget precalculated frequencies
+        self._sweep_plan = None  # forget precalculated sweep settings
         super(NetworkAnalyzer, self)._setup()
 
     # overwrite default behavior to return only valid points
 
     def _free_up_resources(self):
-        self.iq.amplitude = 0
+        self._set_amplitude(0)
+        self._free_parallel_iqs()
+        self._pipelined_point = None
 
     @property
     def last_valid_point(self):
@@ -110,10 +110,10 @@ from ..hardware_modules import Scope
 from ..hardware_modules.dsp import all_inputs, InputSelectProperty
 from ..acquisition_module import AcquisitionModule
 from ..widgets.module_widgets import SpecAnWidget
+from .. import fft_utils
 
 import sys
 import scipy.signal as sig
-import scipy.fftpack as fft
 
 
 # Some initial remarks about spectrum estimation:
@@ -212,6 +212,15 @@ class WindowProperty(SelectProperty):
         obj.__class__.rbw.refresh_options(obj)
 
 
+class SegmentLengthProperty(WindowProperty):
+    """
+    Picks the closest available segment length
+    """
+    def validate_and_normalize(self, obj, value):
+        options = list(self.options(obj).keys())
+        return min(options, key=lambda x: abs(x - float(value)))
+
+
 
 class SpectrumAnalyzer(AcquisitionModule):
     """
@@ -226,6 +235,8 @@ class SpectrumAnalyzer(AcquisitionModule):
                        "rbw",
                        #"points",
                        "window",
+                       "segment_length",
+                       "overlap",
                        "acbandwidth",
                        "display_unit",
                        "display_input1_baseband",
@@ -233,6 +244,7 @@ class SpectrumAnalyzer(AcquisitionModule):
                        "input1_baseband",
                        "input2_baseband",
                        "display_cross_amplitude",
+                       "average_mode",
                        ]#"display_cross_phase"]
     _setup_attributes =["input",
                        "center",
@@ -244,6 +256,8 @@ class SpectrumAnalyzer(AcquisitionModule):
                        #"rbw",
                        #"points",
                        "window",
+                       "segment_length",
+                       "overlap",
                        "acbandwidth",
                        "display_unit",
                        "curve_unit",
@@ -251,13 +265,16 @@ class SpectrumAnalyzer(AcquisitionModule):
                        "display_input2_baseband",
                        "input1_baseband",
                        "input2_baseband",
-                       "display_cross_amplitude",]
+                       "display_cross_amplitude",
+                       "average_mode",
+                       "trace_variance"]
                        #"display_cross_phase"]
     PADDING_FACTOR = 16
     # numerical values
     nyquist_margin = 1.0
     if_filter_bandwidth_per_span = 1.0
     _enb_cached = dict() # Equivalent noise bandwidth for filter windows
+    # and segment lengths
 
     quadrature_factor = 1.# 0.1*1024
 
@@ -308,6 +325,19 @@ class SpectrumAnalyzer(AcquisitionModule):
     center = CenterAttribute(call_setup=True)
     # points = IntProperty(default=16384, call_setup=True)
     window = WindowProperty(options=windows, call_setup=True)
+    segment_length = SegmentLengthProperty(
+        options=[2**n for n in range(8, 15)],
+        default=2**14,
+        doc="Number of samples per FFT. Shorter segments than the scope "
+            "trace are taken with the given overlap and their spectra "
+            "averaged (Welch's method), which gives a lower variance at the "
+            "expense of a larger rbw.",
+        call_setup=True)
+    overlap = FloatProperty(min=0, max=0.95, default=0.5,
+                            increment=0.05,
+                            doc="Overlap of successive segments as a "
+                                "fraction of segment_length.",
+                            call_setup=True)
     input = InputSelectProperty(options=all_inputs,
                                 default='in1',
                                 call_setup=True,
@@ -347,9 +377,15 @@ class SpectrumAnalyzer(AcquisitionModule):
 
     acbandwidth = SpecAnAcBandwidth(call_setup=True)
 
+    fft_backend = SelectProperty(options=list(fft_utils.BACKENDS),
+                                 default=list(fft_utils.BACKENDS)[0],
+                                 doc="Library that computes the FFTs, the "
+                                     "fastest available one by default "
+                                     "(see pyrpl.fft_utils).")
+
     def __init__(self, parent, name=None):
+        self._clear_caches()
         super(SpectrumAnalyzer, self).__init__(parent, name=name)
-        self._transfer_function_square_cached = None
 
     @property
     def iq(self):
@@ -372,6 +408,11 @@ class SpectrumAnalyzer(AcquisitionModule):
         return self.scope.data_length
         #return int(self.points)  # *self.nyquist_margin)
 
+    @property
+    def _samples_per_segment(self):
+        """ number of samples per FFT, at most data_length """
+        return min(int(self.segment_length), self.data_length)
+
     @property
     def sampling_time(self):
         return 1. / self.nyquist_margin / self.span
@@ -390,16 +431,45 @@ class SpectrumAnalyzer(AcquisitionModule):
     def duration(self):
         return self.scope.duration
 
+    def _clear_caches(self):
+        # (key, value) pairs of the settings and the cached arrays
+        self._filter_window_cached = None
+        self._complex_filter_window_cached = None
+        self._inverse_tf_square_cached = None
+
+    def _cached(self, name, key, compute):
+        """
+        :return: the value of the cache self._<name>_cached, computed with
+        compute() if the cache is empty or was made for another key
+        """
+        cached = getattr(self, '_' + name + '_cached')
+        if cached is None or cached[0] != key:
+            cached = (key, compute())
+            setattr(self, '_' + name + '_cached', cached)
+        return cached[1]
+
     def filter_window(self):
         """
         :return: filter window
         """
+        return self._cached('filter_window',
+                            (self.window, self._samples_per_segment),
+                            self._compute_filter_window)
+
+    def _complex_filter_window(self):
+        return self._cached('complex_filter_window',
+                            (self.window, self._samples_per_segment),
+                            lambda: np.asarray(self.filter_window(),
+                                               dtype=complex))
+
+    def _compute_filter_window(self):
         if self.window=='gaussian':
             #  a tuple with the std is needed for Gaussian window
-            window_name = ('gaussian', self.data_length/10)
+            window_name = ('gaussian', self._samples_per_segment/10)
         else:
             window_name = self.window
-        window = sig.get_window(window_name, self.data_length, fftbins=False)
+        window = sig.get_window(window_name, self._samples_per_segment,
+                                fftbins=False)
         # empirical value for scaling flattop to sqrt(W)/V
         window/=(np.sum(window)/2)
         return window
@@ -419,10 +489,19 @@ class SpectrumAnalyzer(AcquisitionModule):
 
     def _get_filtered_iq_data(self):
         """
-        :return: the product between the complex iq data and the filter_window
+        :return: the products between the segments of the complex iq data
+        and the filter_window, one segment per row
         """
-        return self._get_iq_data() * np.asarray(self.filter_window(),
-                                            dtype=complex)
+        iq_data = self._get_iq_data()
+        length = self._samples_per_segment
+        step = max(1, int(round(length * (1. - self.overlap))))
+        # strided view, no copy of the overlapping samples
+        # (sliding_window_view requires numpy >= 1.20)
+        stride, = iq_data.strides
+        segments = np.lib.stride_tricks.as_strided(
+            iq_data, shape=((len(iq_data) - length) // step + 1, length),
+            strides=(stride * step, stride), writeable=False)
+        return segments * self._complex_filter_window()
 
     def useful_index_obsolete(self):
         """
@@ -445,7 +524,7 @@ class SpectrumAnalyzer(AcquisitionModule):
         In baseband, only half of the points are returned
         :return: the real number of points that will eventually be returned
         """
-        points = int(self.data_length * self.PADDING_FACTOR)
+        points = int(self._samples_per_segment * self.PADDING_FACTOR)
         return points//2 + 1 if self.baseband else points
 
     @property
@@ -454,11 +533,11 @@ class SpectrumAnalyzer(AcquisitionModule):
         :return: frequency array
         """
         if self.baseband:
-            return np.fft.rfftfreq(self.data_length*self.PADDING_FACTOR,
+            return np.fft.rfftfreq(self._samples_per_segment*self.PADDING_FACTOR,
                                    self.sampling_time)
         else:
-            return self.center + fft.fftshift( fft.fftfreq(
-                                  self.data_length*self.PADDING_FACTOR,
+            return self.center + np.fft.fftshift(np.fft.fftfreq(
+                                  self._samples_per_segment*self.PADDING_FACTOR,
                                   self.sampling_time)) #[self.useful_index()]
 
     def data_to_dBm(self, data): # will become obsolete
@@ -551,6 +630,16 @@ class SpectrumAnalyzer(AcquisitionModule):
         return self.transfer_function_iq(frequencies) * \
                self.transfer_function_scope(frequencies)
 
+    def _inverse_tf_square(self):
+        """
+        :return: 1/abs(transfer_function(frequencies))**2, the correction
+        of the power spectrum, cached for the current settings
+        """
+        key = (self.window, self.span, self._samples_per_segment, self.baseband,
+               self.center, self.acbandwidth, self.rbw)
+        return self._cached('inverse_tf_square', key, lambda:
+                            abs(self.transfer_function(self.frequencies))**-2)
+
 
     # Concrete implementation of AcquisitionModule methods
     # ----------------------------------------------------
@@ -578,6 +667,7 @@ class SpectrumAnalyzer(AcquisitionModule):
         :return:
         """
         iq_data = self._get_filtered_iq_data() # get iq data (from scope)
+        fft_backend = fft_utils.get_backend(self.fft_backend)
         if not self.running_state in ["running_single", "running_continuous"]:
             self.pyrpl.scopes.free(self.scope) # free scope if not continuous
         if self.baseband:
@@ -594,33 +684,33 @@ class SpectrumAnalyzer(AcquisitionModule):
             # negative/positive/real/imaginary part of the complex fft,
             # however, an optimized function for real FFT is already provided:
             # %timeit fft.rfft(x)       # --> 63 us (72.7 us with numpy)
-            # --> In fact, we will use numpy.rfft insead of
-            # scipy.fft.rfft because the output
-            # format is directly a complex array, and thus, easier to handle.
-            fft1 = np.fft.rfft(np.real(iq_data),
-                                       self.data_length*self.PADDING_FACTOR)
-            fft2 = np.fft.rfft(np.imag(iq_data),
-                                       self.data_length*self.PADDING_FACTOR)
-            cross_spectrum = np.conjugate(fft1)*fft2
-
-            res = np.array([abs(fft1)**2,
-                            abs(fft2)**2,
+            # --> We stack the real and imaginary parts of all segments and
+            # transform them with a single batched real FFT. The segment
+            # spectra are then averaged.
+            segments = len(iq_data)
+            spectra = fft_backend.rfft(
+                np.concatenate([iq_data.real, iq_data.imag]),
+                self._samples_per_segment*self.PADDING_FACTOR)
+            fft1, fft2 = spectra[:segments], spectra[segments:]
+            cross_spectrum = np.mean(np.conjugate(fft1)*fft2, axis=0)
+
+            res = np.array([np.mean(abs(fft1)**2, axis=0),
+                            np.mean(abs(fft2)**2, axis=0),
                             np.real(cross_spectrum),
                             np.imag(cross_spectrum)])
-            # at some point, we need to cache the tf for performance
             self._last_curve_raw = res # for debugging purpose
-            return res/abs(self.transfer_function(self.frequencies))**2
+            return res*self._inverse_tf_square()
         else:
             # Realize the complex fft of iq data
-            res = fft.fftshift(fft.fft(iq_data,
-                                        self.data_length*self.PADDING_FACTOR))
-            # at some point we need to cache the tf for performance
-            self._last_curve_raw = np.abs(res)**2 # for debugging purpose
-            return self._last_curve_raw/abs(self.transfer_function(
-                self.frequencies))**2
-            #/ abs(self.transfer_function(
-                #self.frequencies))**2
-            # [self.useful_index()]
+            res = np.fft.fftshift(fft_backend.fft(
+                iq_data, self._samples_per_segment*self.PADDING_FACTOR),
+                axes=-1)
+            self._last_curve_raw = np.mean(np.abs(res)**2, axis=0) # for debugging purpose
+            return self._last_curve_raw*self._inverse_tf_square()
+
+    def _setup(self):
+        self._clear_caches()  # recompute the cached arrays upon next use
+        super(SpectrumAnalyzer, self)._setup()
 
     def _remaining_time(self):
         """
@@ -724,9 +814,10 @@ class SpectrumAnalyzer(AcquisitionModule):
         get the residual bandwidth, this number has to be multiplied by the
         sample rate."""
 
-        if not self.window in self._enb_cached:
+        key = (self.window, self._samples_per_segment)
+        if not key in self._enb_cached:
             filter_window = self.filter_window()
-            self._enb_cached[self.window] = (sum(filter_window ** 2)) / \
-                                            (sum(filter_window) ** 2)
+            self._enb_cached[key] = (sum(filter_window ** 2)) / \
+                                    (sum(filter_window) ** 2)
 
-        return self._enb_cached[self.window]
+        return self._enb_cached[key]
@@ -0,0 +1,97 @@
+import os
+import time
+import numpy as np
+from ..curvedb import CurveDB
+
+
+class TestCurveDB(object):
+    def test_npy_format(self):
+        x = np.linspace(0, 1, 16384)
+        y = np.exp(1j * x)
+        c = CurveDB.create(x, y, name='test_npy_format', autosave=False)
+        c.data_format = 'npy'
+        c.save()
+        try:
+            c2 = CurveDB.get(c.pk)
+            assert c2.name == 'test_npy_format'
+            assert isinstance(c2.data[1], np.memmap)
+            assert c2.data[1].dtype == complex
+            assert (c2.data[0] == x).all() and (c2.data[1] == y).all()
+            # the .dat file only contains pk and params
+            assert os.path.getsize(os.path.join(CurveDB._dirname, '%d.dat'
+                                                % c.pk)) < 1000
+            # changing the params does not touch the memory-mapped data
+            c2.params['comment'] = 'changed'
+            c2.save()
+            c3 = CurveDB.get(c.pk)
+            assert c3.params['comment'] == 'changed'
+            assert (c3.data[1] == y).all()
+            # in-place changes only affect the copy in memory until saved
+            c3.data[1][0] = 2.
+            assert CurveDB.get(c.pk).data[1][0] == y[0]
+            c3.save()
+            assert CurveDB.get(c.pk).data[1][0] == 2.
+            # the mapped files are not overwritten, but replaced by new ones
+            c2.data = (x[:10], y[:10])
+            c2.save()
+            assert len(CurveDB.get(c.pk).data[0]) == 10
+            assert (c3.data[0] == x).all()
+            assert set(c2._columns.values()) <= set(self.column_files(c.pk))
+        finally:
+            c.delete()
+        assert self.column_files(c.pk) == []
+
+    @staticmethod
+    def column_files(pk):
+        return [f for f in os.listdir(CurveDB._dirname)
+                if f.startswith('%d.' % pk) and f.endswith('.npy')]
+
+    def test_pickle_format(self):
+        c = CurveDB.create([1, 2, 3], [4., 5., 6.], name='test_pickle_format',
+                           autosave=False)
+        c.data_format = 'pickle'
+        c.save()
+        try:
+            assert self.column_files(c.pk) == []
+            c2 = CurveDB.get(c.pk)
+            assert not isinstance(c2.data[1], np.memmap)
+            assert list(c2.data[1]) == [4., 5., 6.]
+        finally:
+            c.delete()
+
+    def test_index(self):
+        before = time.time()
+        parent = CurveDB.create([0], [0], name='test_index_parent',
+                                input='in2')
+        child1 = CurveDB.create([1], [1], name='test_index_child')
+        child2 = CurveDB.create([2], [2], name='test_index_child')
+        unsaved = CurveDB.create([3], [3], name='test_index_child',
+                                 autosave=False)
+        try:
+            parent.add_child(child1)
+            parent.add_child(child2)
+            assert unsaved.pk > child2.pk > child1.pk > parent.pk
+            assert unsaved.pk not in CurveDB.all_pks()
+            assert CurveDB.all_pks()[:3] == [child2.pk, child1.pk, parent.pk]
+            assert CurveDB.search(name='test_index_child',
+                                  parent=parent) == [child2.pk, child1.pk]
+            assert CurveDB.search(input='in2', since=before) == [parent.pk]
+            assert CurveDB.search(input='in2', until=before) == []
+            assert parent.get_child('test_index_child').pk == child1.pk
+            child1.delete()
+            assert CurveDB.get(parent.pk).params['childs'] == [child2.pk]
+            # the index is rebuilt from the curve files
+            CurveDB.rebuild_index()
+            assert CurveDB.search(parent=parent.pk) == [child2.pk]
+            # also if it was lost, without reusing the pk of unsaved curves
+            CurveDB._index_connections.pop(CurveDB._dirname).close()
+            os.remove(os.path.join(CurveDB._dirname, CurveDB.index_filename))
+            assert CurveDB.search(parent=parent.pk) == [child2.pk]
+            new = CurveDB.create([4], [4], name='test_index_child',
+                                 autosave=False)
+            assert new.pk > unsaved.pk
+            new.delete()
+        finally:
+            unsaved.delete()
+            CurveDB.get(parent.pk).delete()
+        assert CurveDB.search(name='test_index_child') == []
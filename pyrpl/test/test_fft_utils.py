@@ -0,0 +1,21 @@
+import numpy as np
+from pyrpl import fft_utils
+
+
+def test_backends_agree():
+    x = np.random.normal(size=(3, 100)) + 1j * np.random.normal(size=(3, 100))
+    assert list(fft_utils.BACKENDS)[-1] == 'numpy'
+    for name in fft_utils.BACKENDS:
+        backend = fft_utils.get_backend(name)
+        assert backend.name == name
+        assert fft_utils.get_backend(name) is backend  # plans are kept
+        for _ in range(2):  # the second call reuses the plans
+            assert np.allclose(backend.fft(x, 400),
+                               np.fft.fft(x, 400, axis=-1))
+            assert np.allclose(backend.rfft(x.real, 400),
+                               np.fft.rfft(x.real, 400, axis=-1))
+
+
+def test_unknown_backend():
+    assert fft_utils.get_backend('unknown').name == \
+        list(fft_utils.BACKENDS)[0]
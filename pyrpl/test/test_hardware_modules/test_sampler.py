@@ -32,3 +32,17 @@ class TestInput(TestPyrpl):
             # needs a small margin to work properly because of rounding off towards negative values in asg
             assert min + 2.0**(-14) >= asg.offset - asg.amplitude, \
                 (mean, std, max, min, min + 2.0**(-14), asg.offset - asg.amplitude)
+
+    def test_stats_without_board_statistics(self):
+        # old servers or failed transactions return None
+        client = self.sampler._client
+        client.stats = lambda *args, **kwargs: None
+        try:
+            self.r.asg0.setup(amplitude=0, offset=0.25, output_direct='off',
+                              trigger_source='immediately')
+            sample = self.sampler.asg0
+            mean, std, max, min = self.sampler.stats('asg0', t=0.01)
+            assert min <= mean <= max, (mean, std, max, min)
+            assert abs(mean - sample) < 0.01, (mean, sample)
+        finally:
+            del client.stats
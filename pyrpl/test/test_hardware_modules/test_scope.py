@@ -1,5 +1,7 @@
 import logging
 logger = logging.getLogger(name=__name__)
+import os
+import tempfile
 import time
 import numpy as np
 from pyrpl.async_utils import ensure_future, wait, sleep
@@ -7,6 +9,7 @@ from qtpy import QtCore, QtWidgets
 from pyrpl.test.test_base import TestPyrpl
 from pyrpl import APP
 from pyrpl.curvedb import CurveDB
+from pyrpl.acquisition_module import TraceAverager
 
 class TestScope(TestPyrpl):
     """
@@ -222,3 +225,76 @@ class TestScope(TestPyrpl):
             for j in range(2):
                 assert len(curves[i].data[j]) == self.pyrpl.rp.scope.data_length
         self.curves += curves  # makes sure teardown will delete the curves
+
+    def test_rawdata_copies(self):
+        # the public raw data must not alias the reused receive buffer
+        first = self.r.scope._rawdata_ch1
+        second = self.r.scope._rawdata_ch1
+        assert not np.shares_memory(first, second)
+        assert not np.shares_memory(first, self.r.scope._rawdata_buffer)
+        assert first.dtype == np.int32
+        assert first.shape == (self.r.scope.data_length,)
+
+    def test_stream(self):
+        self.r.scope.setup(input1='in1',
+                           input2='in2',
+                           ch1_active=True,
+                           ch2_active=False,
+                           duration=0.13,
+                           rolling_mode=True,
+                           running_state='stopped')
+        filename = os.path.join(tempfile.mkdtemp(), 'stream.npy')
+        stream = self.r.scope.stream(duration=0.3, filename=filename)
+        samples = 0
+        for block in stream:
+            # blocks are contiguous up to the reported gaps
+            assert block.start == samples + block.gap
+            assert block.data.shape[0] == 1
+            assert np.all(np.abs(block.data) <= 1)
+            samples = block.start + block.data.shape[1]
+        assert samples == stream.length == stream.samples
+        assert sum(gap for start, gap in stream.gaps) < samples
+        record = np.load(filename)
+        assert record.shape == (1, samples)
+        for start, gap in stream.gaps:
+            assert np.all(np.isnan(record[:, start:start + gap]))
+        # the file of a long stream is limited to the default ring length
+        stream = self.r.scope.stream(duration=1e4, filename=filename)
+        assert stream.ring.shape == (1, stream.default_ring_length)
+        stream.close()
+        del stream
+        self.r.scope.stop()
+
+    def test_trace_averager(self):
+        traces = np.random.normal(size=(20, 2, 100))
+        average = np.zeros((2, 100))
+        averager = TraceAverager(average, 'mean', variance=True)
+        for n, trace in enumerate(traces):
+            assert averager.add(trace, 1. / (n + 1)) is average
+        assert np.allclose(average, traces.mean(axis=0))
+        assert np.allclose(averager.variance, traces.var(axis=0))
+        averager = TraceAverager(average, 'min_hold')
+        for trace in traces:
+            averager.add(trace, 1.)
+        assert np.array_equal(average, traces.min(axis=0))
+
+    def test_average_mode(self):
+        self.r.scope.setup(duration=0.001,
+                           input1='in1',
+                           input2='in2',
+                           trigger_source='immediately',
+                           rolling_mode=False,
+                           trace_average=3,
+                           average_mode='max_hold',
+                           trace_variance=True,
+                           running_state='stopped')
+        data = self.r.scope.single()
+        assert data.shape == (2, self.r.scope.data_length)
+        # no variance for the hold modes
+        assert self.r.scope.data_var is None
+        self.r.scope.setup(average_mode='mean', running_state='stopped')
+        self.r.scope.single()
+        assert self.r.scope.data_var.shape == data.shape
+        assert np.all(self.r.scope.data_var >= 0)
+        self.r.scope.setup(average_mode='mean', trace_variance=False,
+                           trace_average=1, running_state='stopped')
@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+from pyrpl.hardware_modules.iir import iir_simulation
+
+SHIFT, BITS = 29, 32  # as in the fpga design
+COEFFICIENTS = np.array([[0.02, -0.01, 0., 1., -1.9, 0.91],
+                         [-0.005, 0.003, 0., 1., -1.5, 0.6]])
+
+
+def simulate_loop(coefficients, xs, shift=None, bits=None):
+    """ sample-by-sample reference implementation """
+    ys = np.zeros(len(xs), dtype=type(xs[0]))
+    ys_biquad = np.zeros((len(coefficients), 2), dtype=ys.dtype)
+    if shift is None:
+        product = lambda a, b: a * b
+    else:
+        def product(a, b):
+            result = (a * b) // 2**shift
+            if not -2**bits <= result <= 2**bits - 1:
+                raise OverflowError
+            return result
+    for index in range(2, len(xs)):
+        for i, (b0, b1, _, _, a1, a2) in enumerate(coefficients):
+            y = product(-a1, ys_biquad[i, 0]) + product(-a2, ys_biquad[i, 1])\
+                + product(b0, xs[index]) + product(b1, xs[index - 1])
+            ys[index] += y
+            ys_biquad[i, 1] = ys_biquad[i, 0]
+            ys_biquad[i, 0] = y
+    return ys
+
+
+def test_simulate_float():
+    xs = np.random.normal(size=(3, 200))
+    ys = iir_simulation.simulate_float(COEFFICIENTS, xs)
+    assert ys.shape == xs.shape
+    for x, y in zip(xs, ys):
+        assert np.allclose(y, simulate_loop(COEFFICIENTS, x))
+
+
+def test_simulate_int():
+    coefficients = np.asarray(COEFFICIENTS * 2**SHIFT, dtype=np.int64)
+    xs = np.random.randint(-2**13, 2**13, size=(2, 300)) * 2**18
+    ys = iir_simulation.simulate_int(coefficients, xs, SHIFT, BITS)
+    assert ys.shape == xs.shape
+    for x, y in zip(xs, ys):
+        assert np.array_equal(y, simulate_loop(coefficients, x, SHIFT, BITS))
+    # an unstable filter overflows
+    unstable = np.asarray([[0.5, 0, 0, 1, -2., 0.99]]) * 2**SHIFT
+    with pytest.raises(OverflowError):
+        iir_simulation.simulate_int(unstable.astype(np.int64), xs, SHIFT,
+                                    BITS)
@@ -0,0 +1,46 @@
+import numpy as np
+import scipy.signal as sig
+from pyrpl.hardware_modules.iir import iir_theory
+
+ZEROS = [-1e3 + 2e4j, -1e3 - 2e4j]
+POLES = [-5e2 + 3e4j, -5e2 - 3e4j, -2e5]
+FREQUENCIES = np.logspace(3, 5, 201)
+
+
+def test_freqz_biquads():
+    iirf = iir_theory.IirFilter(ZEROS, POLES, 1.0, loops=100,
+                                frequencies=FREQUENCIES)
+    coefficients = iirf.coefficients
+    w = FREQUENCIES * 2 * np.pi * iirf.dt * iirf.loops
+    delay_per_cycle = np.exp(-1j * iirf.dt * FREQUENCIES * 2 * np.pi)
+    h = np.zeros(len(w), dtype=complex)
+    for i, sos in enumerate(coefficients):
+        _, hh = sig.freqz(sos[:3], sos[3:], worN=w)
+        h += hh * delay_per_cycle ** (i + 1)
+    assert np.allclose(iirf.tf_coefficients(FREQUENCIES, delay=True), h)
+    rounded = iirf.coefficients_rounded
+    assert np.array_equal(rounded * 2**29, np.round(rounded * 2**29))
+
+
+def test_design_sweep():
+    loops = [50, 100, 200]
+    sweep = iir_theory.IirDesignSweep([dict(loops=l) for l in loops] +
+                                      [(ZEROS[:1], POLES[2:], 1.0)],
+                                      FREQUENCIES, zeros=ZEROS, poles=POLES,
+                                      gain=1.0)
+    assert sweep.tf_final.shape == (4, len(FREQUENCIES))
+    assert not sweep.errors
+    for index, l in enumerate(loops):
+        iirf = iir_theory.IirFilter(ZEROS, POLES, 1.0, loops=l,
+                                    frequencies=FREQUENCIES)
+        assert sweep.loops[index] == iirf.loops
+        assert np.allclose(sweep.tf_final[index], iirf.tf_final())
+        assert np.allclose(sweep.tf_rounded[index], iirf.tf_rounded())
+    iirf = iir_theory.IirFilter(ZEROS[:1], POLES[2:], 1.0,
+                                frequencies=FREQUENCIES)
+    assert np.allclose(sweep.tf_final[3], iirf.tf_final())
+    # designs in worker processes give the same result
+    parallel = iir_theory.IirDesignSweep([dict(loops=l) for l in loops],
+                                         FREQUENCIES, processes=2,
+                                         zeros=ZEROS, poles=POLES, gain=1.0)
+    assert np.allclose(parallel.tf_final, sweep.tf_final[:3])
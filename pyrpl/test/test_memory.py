@@ -1,6 +1,7 @@
 import logging
 logger = logging.getLogger(name=__name__)
 import os
+from .. import memory
 from ..memory import MemoryTree, MemoryBranch
 from .. import *
 from ..async_utils import sleep
@@ -73,8 +74,8 @@ class TestMemory(object):
     def test_two_trees(self):
         """ makes two different memorytree objects that might have conflicts w.r.t. each other.
 
-        The conflicts arise from the latency between the objects in memory and the file defined
-        by _loadsavedeadtime for speed reasons.
+        The conflicts arise from the latency between the objects in memory and the file: a tree
+        only checks the file after the file system watcher has notified a change.
         """
         filename = 'test3'
         T1, T2 = 1, 2
@@ -96,29 +97,45 @@ class TestMemory(object):
         old_save_to_file = m1._write_to_file_counter
         assert m1.a == 2
         assert m1._write_to_file_counter == old_save_to_file
-        # changes will only be written to file once m1._loadsavedeadtime has elapsed
-        assert m2.a == 1, m2.a
-        sleep(T1 + 0.05)  # some extra time is needed for overhead
-        # now changes should have been written to file
-        assert not m1._savetimer.isActive(), m1._savetimer.interval()
-        assert m1._write_to_file_counter == old_save_to_file + 1, \
-            m1._save_counter
-        # but m2 will only attempt to reload once m2._loadsavedeadtime has elapsed
-        assert m2.a == 1
-        # once we wait long enough, m2 will attempt to reload the file
-        sleep(T2 - T1 + 0.05)
-        assert m1._write_to_file_counter == old_save_to_file + 1
+        # changes are journaled instead of rewriting the config file, and m2
+        # applies the journal when it loads the config file
+        assert not m1._savetimer.isActive()
         assert m2.a == 2, m2.a
-        m2.a = 3
-        assert m2.a == 3
-        # m1 has also done nothing for a long time, so it will attempt to reload instantaneously
-        assert m1.a == 3
-        assert m1._write_to_file_counter == old_save_to_file + 1
+        m1.a = 3
+        # but m2 will only reload once the event loop has delivered the
+        # notification of the file system watcher
+        assert m2.a == 2
+        sleep(0.1)
+        assert m2.a == 3, m2.a
+        m2.a = 4
+        assert m2.a == 4
+        sleep(0.1)
+        assert m1.a == 4
+        # a reload can also be requested explicitly
+        m2.a = 5
+        m1._invalidate()
+        assert m1.a == 5
+        assert m1._write_to_file_counter == old_save_to_file
         # clean up
         m1._write_to_file()
         m2._write_to_file()
         os.remove(m1._filename)
 
+    def test_reload_without_event_loop(self):
+        """ without notifications of the file system watcher, the changes
+        are found once the reload timeout has expired """
+        import time
+        m1 = MemoryTree('test8', _loadsavedeadtime=0.05)
+        m1.a = 1
+        m2 = MemoryTree('test8', _loadsavedeadtime=0.05)
+        assert m2.a == 1
+        m1.a = 2
+        time.sleep(0.1)  # no Qt events are processed
+        assert not m2._changed_on_disk
+        assert m2.a == 2
+        m1._write_to_file()
+        os.remove(m1._filename)
+
     def test_two_trees_nodeadtime(self):
         """ makes two different memorytree objects that might have conflicts w.r.t. each other.
 
@@ -166,3 +183,87 @@ class TestMemory(object):
         m1._write_to_file()
         m2._write_to_file()
         os.remove(m1._filename)
+
+    def test_branch_cache(self):
+        """ subbranch objects are reused as long as they exist """
+        m = MemoryTree()
+        m.a = dict(b=dict(c=1), d=[dict(e=2), dict(e=3)])
+        assert m.a is m.a
+        assert m['a.b'] is m.a.b
+        assert m['a.b.c'] == 1
+        assert m._get_or_create('a.b') is m.a.b
+        assert m.a.d[1].e == 3
+        m.a.d._pop(0)
+        assert m.a.d[0].e == 3
+        m.a.b = dict(f=4)  # a replaced subbranch is found by the old object
+        assert m.a.b.f == 4
+        m.a._pop('b')
+        assert 'b' not in m.a
+        m.a.b = 5
+        assert m.a.b == 5
+        try:
+            m['a.b.c']
+        except KeyError:
+            pass
+        else:
+            assert False, "leaves have no subbranches"
+
+    def test_journal(self):
+        """ changes are journaled and compacted into the config file """
+        m1 = MemoryTree('test5')
+        m1.a = 1
+        m1.b = dict(c=[1, 2, 3], d=dict(e='f'))
+        m1.b.c._pop(0)
+        m1.b.d._pop('e')
+        m1._write_to_file()
+        assert not os.path.exists(m1._journal_filename)
+        m1.a = 2
+        m1.b.c[2] = 4
+        m1.b._update(dict(g=5))
+        assert os.path.exists(m1._journal_filename)
+        with open(m1._filename) as f:
+            assert 'g' not in f.read()  # the config file is not rewritten
+        # simulate a crash during the write of the last entry
+        with open(m1._journal_filename, 'ab') as f:
+            f.write(b'--- [[a], ')
+        m2 = MemoryTree('test5')
+        assert m2.a == 2
+        assert m2.b.c._data == [2, 3, 4]
+        assert m2.b.g == 5
+        assert 'e' not in m2.b.d
+        # writing after the crash does not append to the incomplete entry
+        m2.a = 7
+        m2.b.h = 8
+        m4 = MemoryTree('test5')
+        assert m4.a == 7
+        assert m4.b.h == 8
+        assert m4.b.g == 5
+        # an unreadable entry ends the journal instead of raising
+        with open(m1._journal_filename, 'ab') as f:
+            f.write(b'--- [[a], {\n...\n')
+        m5 = MemoryTree('test5')
+        assert m5.a == 7
+        assert m5.b.h == 8
+        # a journal of a replaced config file is ignored
+        m1._write_to_file()
+        m1.a = 3
+        with open(m1._filename, 'w') as f:
+            f.write('a: 0\n')
+        m3 = MemoryTree('test5')
+        assert m3.a == 0
+        assert not os.path.exists(m3._journal_filename)
+        os.remove(m3._filename)
+
+    def test_load_file_cache(self):
+        m = MemoryTree('test6')
+        m.a = dict(b=[1, 2.5], c='d')
+        m._write_to_file()
+        data = memory.load_file(m._filename)
+        assert data == m._data
+        data['a']['c'] = 'changed'  # every call returns a fresh copy
+        assert memory.load_file(m._filename)['a']['c'] == 'd'
+        assert len(memory._snapshots) > 0
+        m.a.c = 'e'
+        m._write_to_file()  # a modified file is parsed again
+        assert memory.load_file(m._filename)['a']['c'] == 'e'
+        os.remove(m._filename)
@@ -189,6 +189,153 @@ class TestNA(TestPyrpl):
             # account, that should be much closer to 1...
             # Also, there is this magic value of 0.988 instead of 1 ??!!!
 
+    def test_sweep_plan(self):
+        with self.pyrpl.networkanalyzer as self.na:
+            self.na.setup(start_freq=1e3, stop_freq=1e5, points=101,
+                          logscale=True, running_state='stopped')
+            plan = self.na.sweep_plan
+            assert self.na.sweep_plan is plan  # computed only once
+            assert len(plan.frequencies) == 101
+            assert abs(plan.frequencies[-1] - 1e5) < 1
+            assert len(plan.tf_values) == len(plan.bandwidths) == 101
+            # same normalization as the registers of the iq module
+            iq = self.na.iq
+            for frequency, raw in zip(plan.frequencies,
+                                      np.logspace(3, 5, 101)):
+                assert frequency == \
+                    iq.__class__.frequency.validate_and_normalize(iq, raw)
+            self.na.points = 11  # setup attributes invalidate the plan
+            assert self.na.sweep_plan is not plan
+            assert len(self.na.frequencies) == 11
+
+    def test_auto_bandwidth(self):
+        with self.pyrpl.networkanalyzer as self.na:
+            self.na.setup(start_freq=1e3, stop_freq=1e5, points=11,
+                          logscale=True, rbw=10000, auto_bandwidth=True,
+                          output_direct="out1", input="in1",
+                          running_state='stopped', trace_average=1,
+                          amplitude=0.01, parallel_iqs=1)
+            bandwidths = self.na.sweep_plan.bandwidths
+            # all bandwidths can be set in the register, and they increase
+            assert set(bandwidths) <= set(self.na.iq.bandwidth_options)
+            assert np.all(np.diff(bandwidths) >= 0)
+            self.na.single()
+            # the cycles correspond to the bandwidth read back from the iq
+            bandwidth = self.na.iq.bandwidth[0]
+            assert self.na._current_bandwidth == bandwidth
+            assert self.na._cached_na_averages == \
+                int(np.round(125e6 / bandwidth * self.na.average_per_point))
+            self.na.auto_bandwidth = False
+
+    def test_pipelined_points(self, caplog):
+        with self.pyrpl.networkanalyzer as self.na:
+            self.na.setup(start_freq=1e5, stop_freq=2e5, rbw=10000,
+                          points=5, output_direct="out1", input="in1",
+                          running_state='stopped', trace_average=1,
+                          amplitude=0.01, parallel_iqs=1)
+            iq = self.na.iq
+            execute = iq._execute
+            transactions = []
+
+            def record(operations):
+                transactions.append(operations)
+                results = execute(operations)
+                if len(transactions) == 2:
+                    # the next point was started too early
+                    results[0] = results[0] | 2 ** 31
+                return results
+            iq._execute = record
+            try:
+                data = self.na.single()
+            finally:
+                del iq._execute
+            assert len(data) == 5
+            assert np.all(np.isfinite(data))
+            # each readout but the last one starts the next point, the point
+            # whose data was not ready is measured again
+            register = iq.__class__.frequency
+            assert len(transactions) == 4
+            assert 'NA data not ready yet' in caplog.text
+            for operations in transactions:
+                assert operations[0] == ('r', 0x140, 4)
+                assert operations[1][:2] == ('w', register.address)
+
+    def test_board_sweep_retry(self, monkeypatch):
+        with self.pyrpl.networkanalyzer as self.na:
+            self.na.setup(start_freq=1e5, stop_freq=2e5, rbw=10000,
+                          points=5, output_direct="out1", input="in1",
+                          running_state='stopped', trace_average=1,
+                          amplitude=0.01, parallel_iqs=1)
+            iq = self.na.iq
+            monkeypatch.setattr(iq.__class__, '_na_sweep_available',
+                                property(lambda iq: True))
+            # points of the fake board are slow
+            monkeypatch.setattr(self.na, 'BOARD_SWEEP_CHUNK_DURATION', 100.,
+                                raising=False)
+
+            async def na_sweep(frequencies, sleepcycles, averages):
+                # the sweep leaves the iq at the last frequency
+                iq.frequency = frequencies[-1]
+                data = np.array([iq._reads(0x140, 4)] * len(frequencies))
+                # the first point of the chunk times out on the board
+                data[0] |= 2 ** 31
+                return data
+            monkeypatch.setattr(iq, '_na_sweep_async', na_sweep, raising=False)
+            execute = iq._execute
+            readouts = []
+
+            def record(operations):
+                if operations[0] == ('r', 0x140, 4):
+                    readouts.append(iq.frequency)
+                return execute(operations)
+            monkeypatch.setattr(iq, '_execute', record, raising=False)
+            data = self.na.single()
+            assert len(data) == 5
+            # point 0 is measured alone, the retry of point 1 at its own
+            # frequency
+            assert len(readouts) == 2
+            assert np.allclose(readouts, self.na.frequencies[:2], rtol=1e-6)
+
+    def test_parallel_iqs(self):
+        with self.pyrpl.networkanalyzer as self.na:
+            self.na.setup(start_freq=1e5, stop_freq=2e5, rbw=10000,
+                          points=6, output_direct="out1", input="in1",
+                          running_state='stopped', trace_average=1,
+                          amplitude=0.01, parallel_iqs=2)
+            n_available = self.pyrpl.iqs.n_available()
+            future = self.na.single_async()
+            sleep(0.1)
+            assert self.pyrpl.iqs.n_available() == max(n_available - 1, 0)
+            if n_available:  # two interleaved sub-sweeps of 3 points
+                assert self.na._parallel_stride == 3
+            data = wait(future, timeout=60)
+            assert len(data) == 6
+            # the additional iq module is freed after the run
+            assert self.pyrpl.iqs.n_available() == n_available
+            # two tones of 0.6 V would saturate the output
+            self.na.amplitude = 0.6
+            future = self.na.single_async()
+            sleep(0.1)
+            assert self.pyrpl.iqs.n_available() == n_available
+            assert self.na._parallel_stride is None
+            data = wait(future, timeout=60)
+            assert len(data) == 6
+            self.na.parallel_iqs = 1
+
+    def test_parallel_indices(self):
+        # iq module k measures the points i + k * stride of its sub-sweep
+        self.na.points = 7
+        self.na._parallel_stride = 3
+        steps, position = [], 0
+        while position < 7:
+            steps.append(self.na._parallel_indices(position, 3))
+            position += len(steps[-1])
+        assert steps == [[0, 3, 6], [1, 4], [2, 5]]
+        # with fewer iq modules, the points of a step are split
+        assert self.na._parallel_indices(0, 2) == [0, 3]
+        assert self.na._parallel_indices(2, 2) == [6]
+        self.na._parallel_stride = None
+
     def test_iq_stopped_when_paused(self):
         with self.pyrpl.networkanalyzer as self.na:
             self.na.setup(start_freq=1e5,
@@ -0,0 +1,567 @@
+# unitary test for the MonitorClient communication protocol. A minimal
+# python implementation of monitor_server is used such that no RedPitaya
+# hardware is required
+import logging
+logger = logging.getLogger(name=__name__)
+import asyncio
+import os
+import shutil
+import socket
+import struct
+import subprocess
+import tempfile
+import threading
+import time
+import numpy as np
+import pytest
+from ..redpitaya_client import MonitorClient, AsyncMonitorClient, \
+    ClientPool, sample_stats
+from ..modules import HardwareModule
+from ..attributes import IntRegister, BoolRegister
+from ..memory import MemoryTree
+from ..hardware_modules.scope import Scope
+from ..async_utils import ensure_future, wait, sleep_async, LOOP
+
+
+class FakeMonitorServer(object):
+    """ python version of monitor_server.c working on a dict as memory """
+    def __init__(self, version=1):
+        self.version = version  # 0 emulates a server without extensions
+        self.memory = dict()
+        self.received_packets = 0  # number of recv calls for requests
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.bind(('localhost', 0))
+        self.listener.listen(5)
+        self.port = self.listener.getsockname()[1]
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+
+    def recv(self, connection, length):
+        data = b''
+        while len(data) < length:
+            chunk = connection.recv(length - len(data))
+            if not chunk:
+                raise socket.error("connection closed")
+            data += chunk
+        return data
+
+    def serve(self):
+        while True:
+            try:
+                connection, _ = self.listener.accept()
+            except socket.error:
+                return
+            threading.Thread(target=self.serve_client, args=(connection,),
+                             daemon=True).start()
+
+    def serve_client(self, connection):
+        try:
+            while True:
+                header = self.recv(connection, 8)
+                self.received_packets += 1
+                command = header[:1]
+                length = header[2] + (header[3] << 8)
+                addr = struct.unpack('<I', header[4:8])[0]
+                if command == b'v' and self.version >= 1:
+                    connection.sendall(header[:1] + bytes([self.version])
+                                       + header[2:])
+                    continue
+                if length == 0:
+                    continue
+                if command == b'r':
+                    values = [self.memory.get(addr + 4 * i, 0)
+                              for i in range(length)]
+                    connection.sendall(
+                        header + np.array(values, dtype=np.uint32).tobytes())
+                elif command == b'w':
+                    values = np.frombuffer(self.recv(connection, 4 * length),
+                                           dtype=np.uint32)
+                    for i, v in enumerate(values):
+                        self.memory[addr + 4 * i] = int(v)
+                    connection.sendall(header)
+                elif command == b's' and self.version >= 1:
+                    bits = header[1] or 32
+                    values = [self.memory.get(addr, 0)] * length
+                    connection.sendall(header + struct.pack(
+                        '<qQii', *sample_stats(values, bits)[1:]))
+                else:
+                    break
+        except socket.error:
+            pass
+        finally:
+            connection.close()
+
+    def close(self):
+        self.listener.close()
+
+
+class TestMonitorClient(object):
+    @classmethod
+    def setup_class(cls):
+        cls.server = FakeMonitorServer()
+        cls.client = MonitorClient('localhost', cls.server.port)
+
+    @classmethod
+    def teardown_class(cls):
+        cls.client.close()
+        cls.server.close()
+
+    def test_read_write(self):
+        self.client.writes(0x40300000, [1, 2, 3])
+        assert list(self.client.reads(0x40300000, 3)) == [1, 2, 3]
+
+    def test_reads_into_buffer(self):
+        self.client.writes(0x40300040, [7, 8, 9])
+        out = np.zeros(5, dtype=np.uint32)
+        data = self.client.reads(0x40300040, 3, out=out)
+        assert list(data) == [7, 8, 9]
+        # the data is received in place
+        assert np.shares_memory(data, out)
+        assert list(out) == [7, 8, 9, 0, 0]
+
+    def test_execute(self):
+        transactions = self.client._transaction_counter
+        results = self.client.execute([('w', 0x40300010, [5, 6]),
+                                       ('r', 0x40300010, 2),
+                                       ('w', 0x40300014, [7]),
+                                       ('r', 0x40300010, 2)])
+        assert self.client._transaction_counter == transactions + 1
+        assert results[0] is True and results[2] is True
+        assert list(results[1]) == [5, 6]
+        assert list(results[3]) == [5, 7]
+
+    def test_execute_splits_long_requests(self):
+        values = np.arange(8192, dtype=np.uint32)
+        operations = [('w', 0x40100000 + 4 * i, values) for i in range(4)]
+        results = self.client.execute(operations + [('r', 0x40100000, 8195)])
+        assert list(results[-1]) == [0, 0, 0] + list(values)
+
+    def test_batch(self):
+        transactions = self.client._transaction_counter
+        with self.client.batch():
+            for i in range(20):
+                self.client.writes(0x40300100 + 4 * i, [i])
+            # nothing has been transmitted yet
+            assert self.server.memory.get(0x40300100 + 4 * 19) is None
+            with self.client.batch():
+                self.client.writes(0x40300200, [42])
+            # inner batch does not flush
+            assert self.server.memory.get(0x40300200) is None
+        assert self.client._transaction_counter == transactions + 1
+        assert self.server.memory[0x40300100 + 4 * 19] == 19
+        assert self.server.memory[0x40300200] == 42
+
+    def test_batch_read_flushes_writes(self):
+        with self.client.batch():
+            self.client.writes(0x40300300, [11])
+            # the read must see the value written before
+            assert self.client.reads(0x40300300, 1)[0] == 11
+            self.client.writes(0x40300300, [12])
+        assert self.client.reads(0x40300300, 1)[0] == 12
+
+    def test_coalesce_adjacent_writes(self):
+        operations = self.client._coalesce([('w', 0x40300400, [1]),
+                                            ('w', 0x40300404, [2, 3]),
+                                            ('w', 0x40300404, [4]),
+                                            ('r', 0x40300400, 3)])
+        # writes to the same register must not be merged
+        assert len(operations) == 3
+        assert list(operations[0][2]) == [1, 2, 3]
+        results = self.client.execute(operations)
+        assert list(results[-1]) == [1, 4, 3]
+
+
+class TestStats(object):
+    def test_stats(self):
+        for version in [0, 1]:
+            server = FakeMonitorServer(version=version)
+            client = MonitorClient('localhost', server.port)
+            try:
+                assert client.protocol_version == version
+                client.writes(0x40300010, [2 ** 14 - 3])
+                transactions = client._transaction_counter
+                n, s, sq, mi, ma = client.stats(0x40300010, 100, bits=14)
+                assert (n, s, sq, mi, ma) == (100, -300, 900, -3, -3)
+                if version >= 1:
+                    # only the result is transmitted
+                    assert client._transaction_counter == transactions + 1
+                # the connection is still in sync
+                assert client.reads(0x40300010, 1)[0] == 2 ** 14 - 3
+            finally:
+                client.close()
+                server.close()
+
+    def test_sample_stats(self):
+        assert sample_stats([0x1FFF, 0x2000, 0x3FFF], bits=14) == \
+            (3, 8191 - 8192 - 1, 8191 ** 2 + 8192 ** 2 + 1, -8192, 8191)
+        assert sample_stats([0xFFFFFFFF, 1]) == (2, 0, 2, -1, 1)
+
+
+class TestAsyncMonitorClient(object):
+    @classmethod
+    def setup_class(cls):
+        cls.server = FakeMonitorServer()
+        cls.client = MonitorClient('localhost', cls.server.port)
+        cls.async_client = AsyncMonitorClient('localhost', cls.server.port)
+
+    @classmethod
+    def teardown_class(cls):
+        cls.client.close()
+        cls.server.close()
+
+    def test_read_write(self):
+        async def transfer():
+            try:
+                await self.async_client.writes_async(0x40300500, [4, 5, 6])
+                return await self.async_client.reads_async(0x40300500, 3)
+            finally:
+                self.async_client.close()
+        assert list(asyncio.run(transfer())) == [4, 5, 6]
+        # the blocking client sees the same memory
+        assert list(self.client.reads(0x40300500, 3)) == [4, 5, 6]
+
+    def test_concurrent_coroutines(self):
+        values = np.arange(16384, dtype=np.uint32)
+        self.client.writes(0x40310000, values)
+
+        async def transfers():
+            try:
+                return await asyncio.gather(
+                    self.async_client.reads_async(0x40310000, 16384),
+                    self.async_client.writes_async(0x40300600, [7]),
+                    self.async_client.reads_async(0x40300600, 1))
+            finally:
+                self.async_client.close()
+        curve, written, value = asyncio.run(transfers())
+        assert (curve == values).all()
+        assert written is True
+        assert value[0] == 7
+
+    def test_pyrpl_loop(self):
+        """ the client runs on the qasync loop of pyrpl """
+        async def transfers():
+            # LOOP is not the running loop, asyncio.gather would not find it
+            write = ensure_future(
+                self.async_client.writes_async(0x40300700, [8, 9]))
+            read = ensure_future(self.async_client.reads_async(0x40300700, 2))
+            try:
+                return await write, await read
+            finally:
+                self.async_client.close()
+        written, values = wait(ensure_future(transfers()), timeout=5)
+        assert written is True
+        assert list(values) == [8, 9]
+
+    def test_pyrpl_loop_timeout(self):
+        client = AsyncMonitorClient('localhost', self.server.port)
+        client._loop = LOOP
+
+        async def transfer():
+            with pytest.raises(asyncio.TimeoutError):
+                await client._wait_for(sleep_async(10), 0.05)
+            return True
+        assert wait(ensure_future(transfer()), timeout=5)
+
+
+class TestClientPool(object):
+    @classmethod
+    def setup_class(cls):
+        cls.server = FakeMonitorServer(version=2)
+        cls.pool = ClientPool('localhost', cls.server.port)
+        parent = RegisterTestParent(cls.pool.client)
+        parent.client_pool = cls.pool
+        cls.module = RegisterTestModule(parent, name='registertest')
+
+    @classmethod
+    def teardown_class(cls):
+        cls.pool.close()
+        cls.server.close()
+
+    def test_channels(self):
+        scope = self.pool.get('scope')
+        assert scope is not self.pool.client
+        assert self.pool.get('scope') is scope
+        assert self.pool.get() is self.pool.client
+        scope.writes(0x40300700, [3])
+        assert self.pool.client.reads(0x40300700, 1)[0] == 3
+
+    def test_single_client_server(self):
+        server = FakeMonitorServer(version=1)
+        pool = ClientPool('localhost', server.port)
+        try:
+            assert pool.get('scope') is pool.client
+            assert pool.get_async('scope') is None
+        finally:
+            pool.close()
+            server.close()
+
+    def test_deferred_writes_of_other_clients(self):
+        sampler = self.pool.get('sampler')
+        with self.pool.client.batch():
+            self.pool.client.writes(0x40300710, [5])
+            # the read on another connection must see the deferred write
+            assert sampler.reads(0x40300710, 1)[0] == 5
+
+    def test_module_reads_async(self):
+        async def transfer():
+            try:
+                await self.module._writes_async(0x0, [13])
+                return await self.module._reads_async(0x0, 1)
+            finally:
+                self.module._async_client.close()
+        assert asyncio.run(transfer())[0] == 13
+        assert self.module.value == 13
+
+    def test_scope_trace_async(self):
+        scope = ScopeTestModule(self.module._rp, name='scopetest')
+        n = scope.data_length
+        memory = self.server.memory
+        # trigger delay 2, write pointer at trigger 5
+        memory.update({0x40100010: 2, 0x40100014: 1, 0x4010001C: 5})
+        ch1 = np.arange(n) - n // 2  # 14 bit two's complement on the board
+        for i, value in enumerate(ch1):
+            memory[0x40110000 + 4 * i] = int(value) % 2 ** 14
+            memory[0x40120000 + 4 * i] = 2 ** 14 - 1
+
+        async def transfer():
+            try:
+                return await scope._get_trace_async()
+            finally:
+                scope._async_client.close()
+        frame = asyncio.run(transfer())
+        assert np.array_equal(frame[0], np.roll(ch1, -8) / 2 ** 13)
+        assert np.all(frame[1] == -1. / 2 ** 13)
+
+    def test_scope_rolling_wrap_around(self):
+        scope = ScopeTestModule(self.module._rp, name='scopetest')
+        n = scope.data_length
+        memory = self.server.memory
+
+        def fill(ch1, ch2):
+            for i in range(n):
+                memory[0x40110000 + 4 * i] = int(ch1[i]) % 2 ** 14
+                memory[0x40120000 + 4 * i] = int(ch2[i]) % 2 ** 14
+        old = np.arange(n), -np.arange(n)
+        fill(*old)
+        memory[0x40100018] = 10
+        times, data = scope._get_rolling_curve()
+        assert np.array_equal(data * 2 ** 13, np.roll(old, -10, axis=1))
+        # the write pointer wraps around: [10, n) and [0, 5) are transferred
+        new = np.arange(n) + 100, -np.arange(n) - 100
+        fill(*new)
+        memory[0x40100018] = 5
+        client = scope._client
+        transactions = client._transaction_counter
+        times, data = scope._get_rolling_curve()
+        assert client._transaction_counter == transactions + 2
+        expected = np.array(new)
+        expected[:, 5:10] = np.array(old)[:, 5:10]
+        assert np.array_equal(data * 2 ** 13, np.roll(expected, -5, axis=1))
+        assert scope._rolling_write_pointer == 5
+
+
+class TestLocalMonitorServer(object):
+    """ monitor_server.c compiled for the local machine on a fake memory """
+    @classmethod
+    def setup_class(cls):
+        if shutil.which('gcc') is None or os.name != 'posix':
+            pytest.skip("monitor_server can only be built with gcc")
+        cls.directory = tempfile.mkdtemp()
+        source = os.path.join(os.path.dirname(os.path.dirname(__file__)),
+                              'monitor_server', 'monitor_server.c')
+        executable = os.path.join(cls.directory, 'monitor_server_local')
+        subprocess.check_call(['gcc', '-O2', '-o', executable, source,
+                               '-lpthread'])
+        with socket.socket() as s:  # find a free port
+            s.bind(('localhost', 0))
+            cls.port = s.getsockname()[1]
+        cls.server = subprocess.Popen(
+            [executable, str(cls.port),
+             os.path.join(cls.directory, 'memory.bin')],
+            stdout=subprocess.DEVNULL)
+        for i in range(50):  # wait for the server to listen
+            try:
+                socket.create_connection(('localhost', cls.port)).close()
+            except socket.error:
+                time.sleep(0.1)
+            else:
+                break
+        cls.pool = ClientPool('localhost', cls.port)
+
+    @classmethod
+    def teardown_class(cls):
+        cls.pool.close()
+        cls.server.kill()
+        cls.server.wait()
+        shutil.rmtree(cls.directory)
+
+    def test_version(self):
+        assert self.pool.client.protocol_version == 3
+        assert self.pool.multi_client
+
+    def test_na_sweep(self):
+        iq = 0x40200000
+        frequencies = [100, 200, 300]
+        # the fake memory has no iq module, so all points are valid at once
+        self.pool.client.writes(iq + 0x140, [1, 2, 3, 4])
+        data, = self.pool.client.execute([('n', iq, [10, 20] + frequencies)])
+        assert data.shape == (3, 4)
+        assert (data == [1, 2, 3, 4]).all()
+        assert list(self.pool.client.reads(iq + 0x108, 1)) == [300]
+        assert list(self.pool.client.reads(iq + 0x130, 2)) == [20, 10]
+
+        async def sweep():
+            client = self.pool.get_async('na')
+            try:
+                return await client.execute_async([('n', iq, [10, 20, 400]),
+                                                   ('r', iq + 0x108, 1)])
+            finally:
+                client.close()
+        data, frequency = asyncio.run(sweep())
+        assert data.shape == (1, 4) and frequency[0] == 400
+
+    def test_concurrent_clients(self):
+        values = np.arange(16384, dtype=np.uint32)
+        scope = self.pool.get('scope')
+        sampler = self.pool.get('sampler')
+        scope.writes(0x40110000, values)
+        sampler.writes(0x40300010, [2 ** 14 - 5])
+        assert (self.pool.client.reads(0x40110000, 16384) == values).all()
+        assert sampler.stats(0x40300010, 1000, bits=14) == \
+            (1000, -5000, 25000, -5, -5)
+
+        async def transfer():
+            client = self.pool.get_async('scope')
+            try:
+                return await client.reads_async(0x40110000, 16384)
+            finally:
+                client.close()
+        assert (asyncio.run(transfer()) == values).all()
+
+    def test_out_of_range(self):
+        # addresses outside the FPGA address space read as zero
+        assert self.pool.client.writes(0x50000000, [1]) is True
+        assert self.pool.client.reads(0x50000000, 1)[0] == 0
+        assert self.pool.client.reads(0x40000000, 1) is not None
+
+    def test_zz_last_close_ends_server(self):
+        # runs last: closing the last connection with 'c' ends the server
+        client = MonitorClient('localhost', self.port)
+        client.close()
+        assert self.server.poll() is None
+        self.pool.close()
+        assert self.server.wait(timeout=5) == 0
+
+
+class RegisterTestModule(HardwareModule):
+    addr_base = 0x40200000
+    _register_window = (0x0, 0x10)
+    _live_registers = ((0x8, 0x4),)
+    _setup_attributes = ['value', 'enable', 'invert', 'extra']
+    value = IntRegister(0x0)
+    enable = BoolRegister(0x4, 0)
+    invert = BoolRegister(0x4, 1)
+    extra = IntRegister(0x100)  # outside the window
+    status = IntRegister(0x8)  # live register inside the window
+
+
+class OtherRegisterTestModule(RegisterTestModule):
+    addr_base = 0x40210000
+
+
+class ScopeTestModule(HardwareModule):
+    """ the curve transfer of the scope on a short buffer """
+    addr_base = 0x40100000
+    _client_channel = 'scope'
+    data_length = 64
+    _frame_requests = Scope._frame_requests
+    _frame_from_replies = Scope._frame_from_replies
+    _get_trace_async = Scope._get_trace_async
+    _frame_buffer = None
+    _get_rolling_curve = Scope._get_rolling_curve
+    _rolling_data = Scope._rolling_data
+    _rolling_write_pointer = Scope._rolling_write_pointer
+    _rolling_time = Scope._rolling_time
+    _rolling_channels = Scope._rolling_channels
+    _write_pointer_current = IntRegister(0x18)
+    ch1_active = True
+    ch2_active = True
+    duration = 100.  # no full transfer due to elapsed time
+
+    @property
+    def times(self):
+        return np.arange(self.data_length, dtype=float)
+
+
+class RegisterTestParent(object):
+    def __init__(self, client):
+        self.client = client
+        self.c = MemoryTree()
+
+
+class TestRegisterSnapshot(object):
+    @classmethod
+    def setup_class(cls):
+        cls.server = FakeMonitorServer()
+        cls.client = MonitorClient('localhost', cls.server.port)
+        cls.module = RegisterTestModule(RegisterTestParent(cls.client),
+                                        name='registertest')
+
+    @classmethod
+    def teardown_class(cls):
+        cls.client.close()
+        cls.server.close()
+
+    def test_setup_round_trips(self):
+        transactions = self.client._transaction_counter
+        self.module.setup(value=3, enable=True, invert=True, extra=7)
+        # one read of the register window and one batch of writes
+        assert self.client._transaction_counter == transactions + 2
+        assert self.server.memory[0x40200000] == 3
+        assert self.server.memory[0x40200004] == 3
+        assert self.server.memory[0x40200100] == 7
+
+    def test_setup_attributes_snapshot(self):
+        self.module.setup(value=5, enable=False, invert=True, extra=8)
+        transactions = self.client._transaction_counter
+        attributes = self.module.setup_attributes
+        # the window is read at once, extra is read separately
+        assert self.client._transaction_counter == transactions + 2
+        assert dict(attributes) == dict(value=5, enable=False, invert=True,
+                                          extra=8)
+        # outside of the context, registers are read from the hardware
+        self.server.memory[0x40200000] = 9
+        assert self.module.value == 9
+
+    def test_live_registers(self):
+        self.module.setup(value=1)
+        with self.module._snapshot():
+            assert self.module.value == 1
+            self.server.memory[0x40200000] = 2
+            self.server.memory[0x40200008] = 3
+            # the snapshot serves value, status is read from the board
+            assert self.module.value == 1
+            assert self.module.status == 3
+            transactions = self.client._transaction_counter
+            self.module.status = 4
+            assert self.module.value == 1
+            assert self.client._transaction_counter == transactions + 1
+        assert self.module.value == 2
+        assert self.module.status == 4
+
+    def test_execute_modules(self):
+        other = OtherRegisterTestModule(self.module._rp, name='other')
+        self.module.setup(value=1)
+        with self.module._snapshot():
+            assert self.module.value == 1
+            transactions = self.client._transaction_counter
+            results = HardwareModule._execute_modules([
+                (self.module, 'r', 0x0, 1), (other, 'w', 0x0, [5]),
+                (self.module, 'w', 0x0, [6])])
+            # modules that share a client are served in one round trip
+            assert self.client._transaction_counter == transactions + 1
+            assert results[0][0] == 1
+            assert self.server.memory[0x40210000] == 5
+            # the written registers are read from the board again
+            self.server.memory[0x40200000] = 7
+            assert self.module.value == 7
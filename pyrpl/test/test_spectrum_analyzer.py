@@ -208,6 +208,47 @@ class TestClass(TestPyrpl):
         maxdiff = 0.08  # test fails 1 in 3 times with former value 0.05
         assert diff < maxdiff, (diff, diff.argmax(), exp, theory)
 
+    def test_cached_window_and_tf(self):
+        sa = self.pyrpl.spectrumanalyzer
+        sa.setup(baseband=True, span=1e5, window='flattop',
+                 running_state='stopped')
+        window, correction = sa.filter_window(), sa._inverse_tf_square()
+        assert sa.filter_window() is window
+        assert sa._inverse_tf_square() is correction
+        assert np.allclose(correction,
+                           abs(sa.transfer_function(sa.frequencies))**-2)
+        sa.span = 1e6  # setup attributes invalidate the caches
+        assert sa._inverse_tf_square() is not correction
+        assert np.allclose(sa._inverse_tf_square(),
+                           abs(sa.transfer_function(sa.frequencies))**-2)
+        sa.window = 'blackman'
+        assert sa.filter_window() is not window
+        # in iq mode, the correction depends on the center frequency, which
+        # is the frequency of the iq module and may change without setup()
+        sa.setup(baseband=False, center=1e5, running_state='stopped')
+        correction = sa._inverse_tf_square()
+        sa.iq.frequency = 2e5
+        assert sa._inverse_tf_square() is not correction
+        assert np.allclose(sa._inverse_tf_square(),
+                           abs(sa.transfer_function(sa.frequencies))**-2)
+
+    def test_welch_segments(self):
+        sa = self.pyrpl.spectrumanalyzer
+        sa.setup(baseband=True, span=1e6, segment_length=16384,
+                 trace_average=1, running_state='stopped')
+        rbw = sa.rbw
+        sa.setup(segment_length=1024, overlap=0.5)
+        try:
+            # rbw scales with the inverse segment length
+            assert abs(sa.rbw / rbw - 16) < 0.1, (sa.rbw, rbw)
+            # 16384 samples give 31 segments with 50 % overlap
+            assert sa._get_filtered_iq_data().shape == (31, 1024)
+            in1, in2, c_re, c_im = sa.single()
+            assert len(in1) == len(sa.frequencies) == \
+                   1024 * sa.PADDING_FACTOR // 2 + 1
+        finally:
+            sa.segment_length = 16384
+
     def test_flatness_iqmode(self):
         return # to be tested in next release
         for span in [5e4, 1e5, 5e5, 1e6, 2e6]:
@@ -16,6 +16,8 @@ panel ABOVE the plot are for settings that are only available for that module.
 The different buttons in the acquisition module control panel below the plot are:
 
 - :attr:`~.AcquisitionModule.trace_average` chooses the number of successive traces to average together.
+- :attr:`~.AcquisitionModule.average_mode` chooses between a running mean, an
+  exponential average and max/min hold (scope and spectrum analyzer only).
 - :attr:`~.AcquisitionModule.curve_name` is the name for the next curve that is saved.
 - :code:`Run single` starts a single acquisition of :code:`trace_average` traces (calls :meth:`.AcquisitionModule.single`).
 - :code:`Run continuous` starts a continuous acquisition with a running
@@ -73,6 +75,9 @@ class AcquisitionModuleWidget(ModuleWidget):
 
         self.button_layout.addWidget(self.current_avg_label)
         self.button_layout.addWidget(aws["trace_average"])
+        if "average_mode" in aws:
+            self.attribute_layout.removeWidget(aws["average_mode"])
+            self.button_layout.addWidget(aws["average_mode"])
         self.button_layout.addWidget(aws["curve_name"])
         self.button_layout.addWidget(self.button_single)
         self.button_layout.addWidget(self.button_continuous)
@@ -100,7 +100,8 @@ class NaWidget(AcquisitionModuleWidget):
                             ('Frequency', ['start_freq', 'stop_freq',
                                            'points', 'logscale']),
                             ('Setup', ['amplitude', 'acbandwidth']),
-                            ('Averaging', ['average_per_point', 'rbw']),
+                            ('Averaging', ['average_per_point', 'rbw',
+                                            'parallel_iqs']),
                             ('Auto-bandwidth', ['auto_bandwidth', 'q_factor_min']),
                             ('Auto-amplitude', ['auto_amplitude', 'target_dbv',
                                                 'auto_amp_min', 'auto_amp_max'])]:
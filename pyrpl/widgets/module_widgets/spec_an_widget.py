@@ -126,6 +126,13 @@ class OtherAttributesWidget(QtWidgets.QWidget):
             specan_widget.attribute_layout.removeWidget(widget)
             self.v_layout3.addWidget(widget)
 
+        self.v_layout4 = QtWidgets.QVBoxLayout()
+        self.h_layout.addLayout(self.v_layout4)
+        for name in ["segment_length", "overlap"]:
+            widget = aws[name]
+            specan_widget.attribute_layout.removeWidget(widget)
+            self.v_layout4.addWidget(widget)
+
 
 class SpecAnWidget(AcquisitionModuleWidget):
     _display_max_frequency = 25  # max 25 Hz framerate